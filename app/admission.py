@@ -0,0 +1,234 @@
+'''
+Admission control: per-class concurrency limits with bounded wait queues.
+
+Every request except `/metrics` is put in one of three classes (see
+`classify_request`), each with its own limit on concurrent requests and its
+own queue (`[admission]` in config.ini):
+
+- `import`: uploads. The slot is held until the background import that the
+  upload starts has finished, since that is where the database work is.
+- `scan`: data and indicator reads spanning `scan_min_days` or more, and
+  matrices. The slot is held until the streamed body is complete.
+- `light`: catalog entries, snapshots, short ranges and everything else.
+
+So a burst of uploads or multi-year reads waits in its own queue instead of
+taking all the database connections and threadpool workers from the light
+lookups. A request that finds its queue full gets 429, one that waits longer
+than the class's timeout gets 503, both with a `Retry-After` estimated from
+how long slots have recently been held.
+
+The queues live in the event loop (one per API process), so the limits are
+per process.
+'''
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from urllib.parse import parse_qs
+
+from starlette.responses import JSONResponse
+
+from app.config import get_setting
+from app.metrics import (
+    ADMISSION_ACTIVE,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_REJECTED,
+    ADMISSION_WAIT,
+)
+
+logger = logging.getLogger('elginvault.admission')
+
+REQUEST_CLASSES = ('import', 'scan', 'light')
+# limit, queue, timeout (seconds) per class; a limit of 0 disables it
+DEFAULT_LIMITS = {
+    'import': (2, 8, 30.0),
+    'scan': (8, 32, 10.0),
+    'light': (24, 200, 5.0),
+}
+IMPORT_ROUTES = {('POST', '/stock_vault/import'), ('POST', '/bulk_insert_stock_data')}
+# Reads whose cost depends on their start_time/end_time parameters
+RANGE_PREFIXES = ('/stock_data/', '/stock_vault/indicators/')
+# Reads that are always treated as scans (the data alias reads the default range)
+SCAN_PREFIXES = ('/stock_vault/data/', '/stock_vault/matrix')
+EXEMPT_PATHS = ('/metrics',)
+# The data endpoints' default range
+DEFAULT_RANGE = ('2000-01-01', '2025-01-25')
+REJECT_STATUS = {'queue_full': 429, 'timeout': 503}
+MAX_RETRY_AFTER = 60
+# Weight of the latest hold time in the running average
+HOLD_SMOOTHING = 0.2
+
+
+def admission_enabled() -> bool:
+    return get_setting('admission', 'enabled', True, bool)
+
+
+def _range_days(query_string: bytes) -> Optional[float]:
+    query = parse_qs(query_string.decode('latin-1'))
+    try:
+        start = datetime.strptime(query.get('start_time', [DEFAULT_RANGE[0]])[0], '%Y-%m-%d')
+        end = datetime.strptime(query.get('end_time', [DEFAULT_RANGE[1]])[0], '%Y-%m-%d')
+    except ValueError:
+        # The endpoint rejects it without a query
+        return None
+    return (end - start).days
+
+
+def classify_request(method: str, path: str, query_string: bytes = b'') -> Optional[str]:
+    '''
+    Returns the request's class, or None for requests that are never held back.
+    '''
+    if path in EXEMPT_PATHS:
+        return None
+    if (method, path) in IMPORT_ROUTES:
+        return 'import'
+    if method == 'GET' and path.startswith(SCAN_PREFIXES):
+        return 'scan'
+    if method == 'GET' and path.startswith(RANGE_PREFIXES):
+        days = _range_days(query_string)
+        if days is not None and days >= get_setting('admission', 'scan_min_days', 31, int):
+            return 'scan'
+    return 'light'
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, queue: 'AdmissionQueue', reason: str):
+        super().__init__(f'{queue.name} requests are at capacity ({reason}).')
+        self.request_class = queue.name
+        self.reason = reason
+        self.status_code = REJECT_STATUS[reason]
+        self.retry_after = queue.retry_after()
+
+
+class AdmissionQueue:
+    '''
+    A concurrency limit with a FIFO wait queue of at most `queue_size`
+    requests. A released slot is handed straight to the oldest waiter.
+    '''
+
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        # Running average of the seconds a slot is held
+        self._hold: Optional[float] = None
+
+    @classmethod
+    def from_settings(cls, name: str) -> 'AdmissionQueue':
+        limit, queue_size, timeout = DEFAULT_LIMITS[name]
+        return cls(
+            name,
+            get_setting('admission', f'{name}_limit', limit, int),
+            get_setting('admission', f'{name}_queue', queue_size, int),
+            get_setting('admission', f'{name}_timeout', timeout, float),
+        )
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        '''
+        Seconds until the queue has likely drained enough to admit one more.
+        '''
+        hold = self._hold if self._hold is not None else 1.0
+        slots = max(self.limit, 1)
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(hold * (self.waiting + 1) / slots)))
+
+    async def acquire(self):
+        '''
+        Takes a slot, waiting in the queue if need be. Raises
+        AdmissionRejected if the queue is full or the wait times out.
+        '''
+        if not self._waiters and (self.limit <= 0 or self.active < self.limit):
+            self.active += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            raise AdmissionRejected(self, 'queue_full')
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout if self.timeout > 0 else None)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected(self, 'timeout') from None
+            raise
+
+    def release(self, held: Optional[float] = None):
+        '''
+        Frees a slot that was held for `held` seconds (None if unknown).
+        '''
+        if held is not None:
+            self._hold = held if self._hold is None else (
+                self._hold + HOLD_SMOOTHING * (held - self._hold)
+            )
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes to the waiter, so `active` is unchanged
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+admission_queues = {name: AdmissionQueue.from_settings(name) for name in REQUEST_CLASSES}
+ADMISSION_ACTIVE.callback = lambda: {
+    (name,): queue.active for name, queue in admission_queues.items()
+}
+ADMISSION_QUEUE_DEPTH.callback = lambda: {
+    (name,): queue.waiting for name, queue in admission_queues.items()
+}
+
+
+class AdmissionMiddleware:
+    '''
+    Holds each request until its class has a free slot, or sheds it with
+    429/503 and a Retry-After header.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not admission_enabled():
+            await self.app(scope, receive, send)
+            return
+        request_class = classify_request(
+            scope['method'], scope['path'], scope.get('query_string', b'')
+        )
+        if request_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        queue = admission_queues[request_class]
+        start = time.perf_counter()
+        try:
+            await queue.acquire()
+        except AdmissionRejected as e:
+            ADMISSION_REJECTED.inc(request_class=request_class, reason=e.reason)
+            logger.warning(f'Rejected {scope["method"]} {scope["path"]}: {e}')
+            response = JSONResponse(
+                {'detail': f'Server busy: {e} Retry later.'},
+                status_code=e.status_code,
+                headers={'Retry-After': str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        admitted = time.perf_counter()
+        ADMISSION_WAIT.observe(admitted - start, request_class=request_class)
+        try:
+            # Returns once the body has been sent and background tasks have run
+            await self.app(scope, receive, send)
+        finally:
+            queue.release(time.perf_counter() - admitted)
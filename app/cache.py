@@ -0,0 +1,336 @@
+'''
+In-process cache for catalog entries and query results, kept coherent
+across API processes with Postgres LISTEN/NOTIFY.
+
+Writers (`import_stock_vault`, `remove_stock_vault`, ...) publish a change
+event on the `stock_vault_changes` channel inside their transaction, so the
+event is delivered exactly when the change commits. Every API process runs an
+`InvalidationListener` thread that LISTENs on the channel and drops the
+cached entries for the affected ticker and time range.
+
+If the listener loses its connection, notifications may have been missed:
+the cache is cleared and bypassed until the listener has reconnected.
+'''
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.config import get_setting
+from app.metrics import CACHE_INVALIDATIONS, CACHE_REQUESTS
+from db.connection import get_db_connection, get_shard_map, mark_ticker_written
+
+logger = logging.getLogger('elginvault.cache')
+
+CHANNEL = 'stock_vault_changes'
+ALL_TICKERS = '*'
+# Sentinel for get(): distinguishes a cached None from a miss
+MISSING = object()
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    '''
+    Parses a range bound; aware values are compared as naive UTC, like the
+    TIMESTAMP columns they describe.
+    '''
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _overlaps(start_a, end_a, start_b, end_b) -> bool:
+    '''
+    Closed-interval overlap; a missing bound is unbounded.
+    '''
+    if start_a is not None and end_b is not None and start_a > end_b:
+        return False
+    if start_b is not None and end_a is not None and start_b > end_a:
+        return False
+    return True
+
+
+class _Entry:
+    __slots__ = ('value', 'ticker', 'start', 'end', 'expires')
+
+    def __init__(self, value, ticker, start, end, expires):
+        self.value = value
+        self.ticker = ticker
+        self.start = start
+        self.end = end
+        self.expires = expires
+
+
+class VaultCache:
+    '''
+    LRU + TTL cache whose entries are tagged with the ticker (or ALL_TICKERS
+    for aggregates such as the catalog list) and, optionally, the time range
+    they cover, so a change only evicts what it can affect.
+    '''
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        # Set to False to bypass the cache
+        self.available = True
+        # Invalidation listeners that are (re)connecting; the cache is
+        # bypassed until every one of them is listening
+        self._disconnected = set()
+        self.generation = 0
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        # Called with the ticker on invalidate() and with None on clear(), for
+        # derived state kept outside the cache (see app/snapshot.py)
+        self._callbacks = []
+
+    def add_invalidation_callback(self, callback):
+        self._callbacks.append(callback)
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self.available and not self._disconnected
+
+    def set_listener_connected(self, name: str, connected: bool):
+        if connected:
+            self._disconnected.discard(name)
+        else:
+            self._disconnected.add(name)
+
+    def reset_listeners(self):
+        self._disconnected.clear()
+
+    def get(self, namespace: str, key, default=None):
+        if not self.active:
+            return default
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and entry.expires < time.monotonic():
+                del self._entries[(namespace, key)]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end((namespace, key))
+        CACHE_REQUESTS.inc(cache=namespace, result='miss' if entry is None else 'hit')
+        return default if entry is None else entry.value
+
+    def set(
+        self,
+        namespace: str,
+        key,
+        value,
+        ticker: str = ALL_TICKERS,
+        start_time=None,
+        end_time=None,
+        generation: Optional[int] = None,
+    ):
+        '''
+        Stores a value. Pass the `generation` read before querying the
+        database: if an invalidation happened since, the value may already
+        be stale and is not stored.
+        '''
+        if not self.active:
+            return
+        entry = _Entry(
+            value,
+            ticker,
+            _as_datetime(start_time),
+            _as_datetime(end_time),
+            time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[(namespace, key)] = entry
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, ticker: str, start_time=None, end_time=None, source: str = 'local') -> int:
+        '''
+        Drops entries for the ticker that overlap the range, and every
+        aggregate entry. Returns the number of entries removed.
+        '''
+        try:
+            start, end = _as_datetime(start_time), _as_datetime(end_time)
+        except ValueError:
+            # Unknown range: drop everything cached for the ticker
+            start = end = None
+        with self._lock:
+            self.generation += 1
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if entry.ticker == ALL_TICKERS
+                or (entry.ticker == ticker and _overlaps(entry.start, entry.end, start, end))
+            ]
+            for key in stale:
+                del self._entries[key]
+        for callback in self._callbacks:
+            callback(ticker)
+        CACHE_INVALIDATIONS.inc(source=source)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+        for callback in self._callbacks:
+            callback(None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+vault_cache = VaultCache(
+    max_entries=get_setting('cache', 'max_entries', 1024, int),
+    ttl=get_setting('cache', 'ttl', 300.0, float),
+    enabled=get_setting('cache', 'enabled', True, bool),
+)
+
+
+def change_payload(action: str, ticker: str, start_time=None, end_time=None) -> str:
+    return json.dumps({
+        'action': action,
+        'ticker': ticker,
+        'start_time': str(start_time) if start_time is not None else None,
+        'end_time': str(end_time) if end_time is not None else None,
+        'pid': os.getpid(),
+    })
+
+
+def apply_change(payload: str, cache: VaultCache = vault_cache, source: str = 'notify'):
+    try:
+        change = json.loads(payload)
+        # Reads of the ticker go to the primary until replicas have caught up
+        mark_ticker_written(change['ticker'])
+        cache.invalidate(
+            change['ticker'], change.get('start_time'), change.get('end_time'), source=source
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        # Unparseable event: drop everything rather than risk stale reads
+        logger.warning(f'Invalid cache invalidation payload {payload!r}: {e}')
+        cache.clear()
+
+
+class InvalidationListener(threading.Thread):
+    '''
+    Daemon thread holding a dedicated autocommit connection that LISTENs for
+    change events and applies them to the cache. Reconnects with backoff.
+    '''
+
+    def __init__(
+        self,
+        cache: VaultCache = vault_cache,
+        connect=None,
+        poll_interval: float = 5.0,
+        node: Optional[str] = None,
+    ):
+        name = 'cache-invalidation-listener' + (f'-{node}' if node else '')
+        super().__init__(name=name, daemon=True)
+        self.cache = cache
+        self.node = node
+        self.poll_interval = poll_interval
+        self._connect = connect
+        self._stop_event = threading.Event()
+        # Written to by stop() to wake the select() below
+        self._wake_read, self._wake_write = os.pipe()
+        self.connected = threading.Event()
+        cache.set_listener_connected(self.name, False)
+
+    def stop(self):
+        self._stop_event.set()
+        try:
+            os.write(self._wake_write, b'x')
+        except OSError:
+            pass  # already stopped
+
+    def _open(self):
+        if self._connect is not None:
+            return self._connect()
+        return get_db_connection(self.node)
+
+    def run(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = self._open()
+                if conn is None:
+                    raise ConnectionError('could not connect')
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                # Events may have been missed while disconnected
+                self.cache.clear()
+                self.cache.set_listener_connected(self.name, True)
+                self.connected.set()
+                backoff = 1.0
+                logger.info(f'Listening for cache invalidations on {CHANNEL}.')
+                self._listen(conn)
+            except Exception as e:
+                logger.error(f'Cache invalidation listener failed: {e}')
+            finally:
+                self.cache.set_listener_connected(self.name, False)
+                self.connected.clear()
+                self.cache.clear()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop_event.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+        os.close(self._wake_read)
+        os.close(self._wake_write)
+
+    def _listen(self, conn):
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select(
+                [conn, self._wake_read], [], [], self.poll_interval
+            )
+            if self._stop_event.is_set():
+                return
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                apply_change(notify.payload, self.cache)
+            if not readable:
+                # Idle: make sure the connection is still alive
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+
+
+_listeners: list[InvalidationListener] = []
+
+
+def start_invalidation_listener() -> list[InvalidationListener]:
+    '''
+    Starts one listener per database node: change events are published on
+    the node that owns the ticker (see db/shards.py).
+    '''
+    if not vault_cache.enabled or not get_setting('cache', 'listen', True, bool):
+        return []
+    if not any(listener.is_alive() for listener in _listeners):
+        _listeners[:] = [
+            InvalidationListener(node=node) for node in get_shard_map().all_nodes
+        ]
+        for listener in _listeners:
+            listener.start()
+    return _listeners
+
+
+def stop_invalidation_listener():
+    for listener in _listeners:
+        listener.stop()
+    for listener in _listeners:
+        listener.join(timeout=10)
+    _listeners.clear()
+    vault_cache.reset_listeners()
@@ -0,0 +1,81 @@
+'''
+Per-ticker statistics stored in the catalog entry.
+
+Imports accumulate them from the batches they write, so the catalog
+endpoints can report a ticker's size without scanning `stock_data`. An
+import always writes the ticker's whole history under a new version (see
+import_stock_vault_columns), so its statistics replace the previous ones,
+and deleting a ticker deletes its entry along with them.
+
+The storage size is an estimate of the uncompressed heap and index bytes
+(stock_data and its two indexes, measured at about 200 bytes per row with
+short tickers). TimescaleDB compression makes the real size smaller.
+'''
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from app.bars import PRICE_COLUMNS, StockBars
+
+STATS_COLUMNS = (
+    'row_count',
+    'first_bar',
+    'last_bar',
+    'min_price',
+    'max_price',
+    'total_volume',
+    'size_bytes',
+)
+# Fixed bytes per row across the heap tuple, the covering index and the
+# (ticker, timestamp) index, each of which also stores the ticker
+ROW_BYTES = 182
+
+
+def _padded_text_bytes(value: str) -> int:
+    # 1-byte varlena header, aligned to 8 bytes
+    return (len(value.encode()) + 1 + 7) // 8 * 8
+
+
+def estimate_storage_bytes(ticker: str, rows: int) -> int:
+    return rows * (ROW_BYTES + 3 * _padded_text_bytes(ticker))
+
+
+class BarStatistics:
+    '''
+    Running statistics over the batches of one import.
+    '''
+
+    def __init__(self, ticker: str):
+        self.ticker = ticker
+        self.row_count = 0
+        self.first_bar: Optional[datetime] = None
+        self.last_bar: Optional[datetime] = None
+        self.min_price: Optional[float] = None
+        self.max_price: Optional[float] = None
+        self.total_volume = 0
+
+    def add(self, bars: StockBars):
+        if not len(bars):
+            return
+        self.row_count += len(bars)
+        first, last = bars.time_range()
+        self.first_bar = first if self.first_bar is None else min(self.first_bar, first)
+        self.last_bar = last if self.last_bar is None else max(self.last_bar, last)
+        prices = np.concatenate([getattr(bars, name) for name in PRICE_COLUMNS])
+        prices = prices[np.isfinite(prices)]
+        if len(prices):
+            low, high = float(prices.min()), float(prices.max())
+            self.min_price = low if self.min_price is None else min(self.min_price, low)
+            self.max_price = high if self.max_price is None else max(self.max_price, high)
+        self.total_volume += int(bars.volume.sum())
+
+    @property
+    def size_bytes(self) -> int:
+        return estimate_storage_bytes(self.ticker, self.row_count)
+
+    def values(self) -> tuple:
+        '''
+        Values of the catalog's statistics columns, in STATS_COLUMNS order.
+        '''
+        return tuple(getattr(self, name) for name in STATS_COLUMNS)
@@ -0,0 +1,250 @@
+'''
+Single-flight coalescing of identical concurrent queries.
+
+When many clients ask for the same `/stock_data/{ticker}` range at once,
+each request joins the *flight* for its key (ticker, range, format) instead
+of running its own query. A flight runs the query once on a producer thread
+and encodes the response body. Every stream that joined it then reads the same
+encoded chunks from a shared buffer, at its own pace. Database load
+therefore grows with the number of distinct queries, not the number of
+clients.
+
+- A request joins a flight only while the flight can still serve the body
+  from its first chunk, i.e. until `max_buffer_mb` has been encoded. After
+  that, chunks every stream has read are dropped, and new requests start a
+  new flight.
+- The producer pauses while more than `max_buffer_mb` is waiting for the
+  slowest stream, so memory per flight stays bounded.
+- An import or delete of the ticker (see app/cache.py) closes its flights
+  to new requests, so none of them is served data older than the change.
+- When every stream has gone away, the flight's query is cancelled.
+- Producers run on a pool of `max_flights` threads, by default the size of
+  the database pool, since each one holds a connection. A flight started
+  while all of them are busy waits for one; its streams keep checking for
+  a disconnect meanwhile, and a flight every stream has left never runs.
+
+This is not a cache: a flight is forgotten as soon as its query is done.
+'''
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable, Iterator, Optional
+
+from app.cache import vault_cache
+from app.config import get_setting
+from app.metrics import COALESCED_REQUESTS
+from db.connection import QueryCancellation
+
+logger = logging.getLogger('elginvault.coalescing')
+
+# Seconds between checks of a waiting stream's cancellation
+POLL_INTERVAL = 0.25
+
+# Yields the encoded body as (chunk, rows) pairs for a query attached to the
+# given cancellation
+ChunkSource = Callable[[QueryCancellation], Iterator[tuple[str, int]]]
+
+
+class Flight:
+    '''
+    One running query and the encoded chunks its streams have not all read.
+    '''
+
+    def __init__(self, key: Hashable, max_buffer_bytes: int):
+        self.key = key
+        self.max_buffer_bytes = max_buffer_bytes
+        self.cancellation = QueryCancellation()
+        self.joinable = True
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._chunks: list[tuple[str, int]] = []
+        # Stream position of _chunks[0]
+        self._offset = 0
+        self._buffered = 0
+        self._produced = 0
+        # Stream id -> position of the next chunk it reads
+        self._positions: dict[int, int] = {}
+        self._next_id = 0
+
+    def join(self) -> Optional[int]:
+        '''
+        Adds a stream reading from the first chunk. Returns its id, or None
+        if the flight no longer takes streams.
+        '''
+        with self._cond:
+            if not self.joinable:
+                return None
+            stream_id = self._next_id
+            self._next_id += 1
+            self._positions[stream_id] = 0
+            return stream_id
+
+    def seal(self):
+        with self._cond:
+            self.joinable = False
+            self._trim()
+
+    def _trim(self):
+        # Only once no stream can join: a new one would start from chunk 0
+        if self.joinable:
+            return
+        low = min(self._positions.values(), default=self._offset + len(self._chunks))
+        drop = low - self._offset
+        if drop > 0:
+            self._buffered -= sum(len(chunk) for chunk, _ in self._chunks[:drop])
+            del self._chunks[:drop]
+            self._offset = low
+            self._cond.notify_all()
+
+    def leave(self, stream_id: int):
+        with self._cond:
+            self._positions.pop(stream_id, None)
+            abandoned = not self._positions and not self.done
+            if abandoned:
+                self.joinable = False
+            self._trim()
+            self._cond.notify_all()
+        if abandoned:
+            # Nobody is left to read the result
+            self.cancellation.cancel()
+
+    def produce(self, source: ChunkSource):
+        chunks = None
+        try:
+            if self.cancellation.cancelled:
+                # Every stream left while the flight waited for a producer
+                return
+            chunks = source(self.cancellation)
+            for chunk, rows in chunks:
+                with self._cond:
+                    while self._positions and self._buffered > self.max_buffer_bytes:
+                        self._cond.wait()
+                    if not self._positions:
+                        break
+                    self._chunks.append((chunk, rows))
+                    self._buffered += len(chunk)
+                    self._produced += len(chunk)
+                    if self._produced > self.max_buffer_bytes:
+                        self.joinable = False
+                    self._cond.notify_all()
+        except Exception as e:
+            if not self.cancellation.cancelled:
+                logger.error(f'Shared query {self.key} failed: {e}')
+            with self._cond:
+                self.error = e
+        finally:
+            if chunks is not None:
+                chunks.close()
+            with self._cond:
+                self.done = True
+                self.joinable = False
+                self._cond.notify_all()
+
+    def consume(self, stream_id: int, cancellation: QueryCancellation) -> Iterator[tuple[str, int]]:
+        '''
+        Yields the chunks for one stream. Stops early once `cancellation`
+        (the stream's own, cancelled when its client disconnects) is set.
+        '''
+        try:
+            while True:
+                with self._cond:
+                    while True:
+                        index = self._positions[stream_id] - self._offset
+                        if index < len(self._chunks):
+                            item = self._chunks[index]
+                            break
+                        if self.done:
+                            if self.error is not None:
+                                raise self.error
+                            return
+                        if cancellation.cancelled:
+                            return
+                        self._cond.wait(POLL_INTERVAL)
+                    self._positions[stream_id] += 1
+                    self._trim()
+                yield item
+        finally:
+            self.leave(stream_id)
+
+
+class QueryCoalescer:
+    '''
+    The flights in progress, by key.
+    '''
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_buffer_bytes: int = 16 * 1024 * 1024,
+        max_flights: int = 10,
+    ):
+        self.enabled = enabled
+        self.max_buffer_bytes = max_buffer_bytes
+        self._flights: dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+        # Threads are started on demand, up to max_flights
+        self._producers = ThreadPoolExecutor(
+            max_workers=max_flights, thread_name_prefix='flight'
+        )
+
+    def stream(
+        self, key: Hashable, source: ChunkSource, cancellation: QueryCancellation
+    ) -> Iterator[tuple[str, int]]:
+        '''
+        Yields the (chunk, rows) pairs of the body for `key`, from the flight
+        in progress or from a new one running `source`; with coalescing off,
+        from `source(cancellation)` itself. The flight is joined on the first
+        step, so a stream closed before it starts never holds one up.
+        '''
+        if not self.enabled:
+            yield from source(cancellation)
+            return
+        with self._lock:
+            flight = self._flights.get(key)
+            stream_id = flight.join() if flight is not None else None
+            leader = stream_id is None
+            if leader:
+                flight = Flight(key, self.max_buffer_bytes)
+                stream_id = flight.join()
+                self._flights[key] = flight
+        COALESCED_REQUESTS.inc(role='leader' if leader else 'follower')
+        if leader:
+            self._producers.submit(contextvars.copy_context().run, self._run, flight, source)
+        yield from flight.consume(stream_id, cancellation)
+
+    def _run(self, flight: Flight, source: ChunkSource):
+        try:
+            flight.produce(source)
+        finally:
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+
+    def seal(self, ticker: Optional[str]):
+        '''
+        Closes the ticker's flights (all flights when `ticker` is None) to
+        new streams. Keys are tuples whose second item is the ticker.
+        '''
+        with self._lock:
+            sealed = [
+                key for key in self._flights
+                if ticker is None or (isinstance(key, tuple) and key[1] == ticker)
+            ]
+            flights = [self._flights.pop(key) for key in sealed]
+        for flight in flights:
+            flight.seal()
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+
+query_flights = QueryCoalescer(
+    enabled=get_setting('coalescing', 'enabled', True, bool),
+    max_buffer_bytes=get_setting('coalescing', 'max_buffer_mb', 16, int) * 1024 * 1024,
+    max_flights=get_setting(
+        'coalescing', 'max_flights', get_setting('database', 'pool_max', 10, int), int
+    ),
+)
+vault_cache.add_invalidation_callback(query_flights.seal)
@@ -0,0 +1,277 @@
+import gzip
+import zlib
+from io import BytesIO
+from typing import BinaryIO, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional
+    zstandard = None
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+CSV_UPLOAD_SUFFIXES = {
+    '.csv': None,
+    '.csv.gz': 'gzip',
+    '.csv.gzip': 'gzip',
+    '.csv.zst': 'zstd',
+    '.csv.zstd': 'zstd',
+}
+
+COMPRESSIBLE_MEDIA_TYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'application/vnd.apache.arrow.stream',
+    'text/',
+)
+# Compressed bytes fed to the decompressor per step when checking an upload
+VERIFY_BLOCK_SIZE = 16 * 1024
+DECOMPRESSION_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def is_supported_csv_upload(filename: str) -> bool:
+    '''
+    Checks whether an uploaded file name is a plain or compressed CSV file.
+    '''
+    return get_upload_suffix(filename) is not None
+
+
+def get_upload_suffix(filename: str) -> Optional[str]:
+    name = filename.lower()
+    # Longest suffix first so '.csv.gz' is not mistaken for '.gz'
+    for suffix in sorted(CSV_UPLOAD_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+
+def detect_upload_compression(filename: str, content: bytes) -> Optional[str]:
+    '''
+    Detects the compression of an uploaded file.
+
+    The magic bytes win over the file name, so a gzip payload uploaded as
+    plain '.csv' is still decompressed correctly.
+    '''
+    if content.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if content.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    suffix = get_upload_suffix(filename)
+    return CSV_UPLOAD_SUFFIXES.get(suffix) if suffix else None
+
+
+def open_upload_stream(content: bytes, compression: Optional[str]) -> BinaryIO:
+    '''
+    Wraps uploaded bytes in a file object that decompresses on read, so the
+    CSV parser pulls decompressed data in blocks instead of inflating the
+    whole payload up front.
+    '''
+    raw = BytesIO(content)
+    if compression is None:
+        return raw
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd compressed uploads require the "zstandard" package.')
+        return zstandard.ZstdDecompressor().stream_reader(raw)
+    raise ValueError(f'Unsupported compression: {compression}')
+
+
+def _upload_decompressor(compression: str):
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd compressed uploads require the "zstandard" package.')
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f'Unsupported compression: {compression}')
+
+
+def verify_upload_stream(content: bytes, compression: Optional[str]):
+    '''
+    Decompresses an upload block by block, discarding the output, and raises
+    ValueError if it is corrupt or ends before its last stream does. A
+    truncated zstd upload would otherwise import the rows it does hold, and
+    a truncated gzip one fail only in the background import.
+    '''
+    if compression is None:
+        return
+    data = memoryview(content)
+    offset = 0
+    try:
+        # One decompressor per concatenated gzip member / zstd frame
+        while offset < len(data):
+            decompressor = _upload_decompressor(compression)
+            while not decompressor.eof:
+                if offset >= len(data):
+                    raise ValueError('Compressed upload is truncated.')
+                decompressor.decompress(data[offset:offset + VERIFY_BLOCK_SIZE])
+                offset += VERIFY_BLOCK_SIZE
+            offset = min(offset, len(data)) - len(decompressor.unused_data)
+    except DECOMPRESSION_ERRORS as e:
+        raise ValueError(f'Compressed upload is corrupt: {e}') from None
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    encodings = {}
+    for item in header.split(','):
+        parts = item.strip().split(';')
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[name] = quality
+    return encodings
+
+
+def negotiate_encoding(header: str) -> Optional[str]:
+    '''
+    Picks the response encoding for an Accept-Encoding header, preferring
+    zstd over gzip when the client accepts both with equal weight.
+    '''
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    candidates = ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+def _create_encoder(encoding: str):
+    if encoding == 'zstd':
+        return _ZstdEncoder(level=3)
+    return _GzipEncoder(level=6)
+
+
+class CompressionMiddleware:
+    '''
+    ASGI middleware that compresses JSON and text responses with gzip or
+    zstd based on the request's Accept-Encoding header.
+
+    Streaming responses are compressed incrementally: each body chunk is fed
+    to the compressor and whatever it emits is forwarded, so the rows are
+    never buffered in full. Every response with a compressible content type
+    carries `Vary: Accept-Encoding`, compressed or not, so a shared cache
+    does not serve one client's encoding to another.
+    '''
+
+    def __init__(self, app, minimum_size: int = 500):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers') or [])
+        encoding = negotiate_encoding(
+            headers.get(b'accept-encoding', b'').decode('latin-1')
+        )
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+def _add_vary(headers: list) -> list:
+    for index, (key, value) in enumerate(headers):
+        if key.lower() == b'vary':
+            if b'accept-encoding' not in value.lower() and value.strip() != b'*':
+                headers[index] = (key, value + b', Accept-Encoding')
+            return headers
+    headers.append((b'vary', b'Accept-Encoding'))
+    return headers
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding: Optional[str], minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+        self.negotiable = False
+
+    async def __call__(self, message):
+        message_type = message['type']
+        if message_type == 'http.response.start':
+            self.start_message = message
+            headers = {k.lower(): v for k, v in message.get('headers', [])}
+            content_type = headers.get(b'content-type', b'').decode('latin-1')
+            self.negotiable = (
+                b'content-encoding' not in headers
+                and content_type.startswith(COMPRESSIBLE_MEDIA_TYPES)
+            )
+            self.passthrough = not self.negotiable or self.encoding is None
+            return
+        if message_type != 'http.response.body':
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if self.passthrough or (not more_body and len(body) < self.minimum_size):
+                self.passthrough = True
+                if self.negotiable:
+                    start = {**start, 'headers': _add_vary(list(start.get('headers', [])))}
+                await self.send(start)
+                await self.send(message)
+                return
+            self.encoder = _create_encoder(self.encoding)
+            headers = [
+                (k, v)
+                for k, v in start.get('headers', [])
+                if k.lower() != b'content-length'
+            ]
+            headers.append((b'content-encoding', self.encoding.encode('latin-1')))
+            await self.send({**start, 'headers': _add_vary(headers)})
+
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        data = self.encoder.compress(body) if body else b''
+        if not more_body:
+            data += self.encoder.flush()
+        if data or not more_body:
+            await self.send(
+                {'type': 'http.response.body', 'body': data, 'more_body': more_body}
+            )
@@ -0,0 +1,38 @@
+import configparser
+import os
+from functools import lru_cache
+
+CONFIG_PATH = os.getenv(
+    'CONFIG_FILE', os.path.join(os.path.dirname(__file__), '../config.ini')
+)
+
+_TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+
+
+@lru_cache(maxsize=1)
+def load_config() -> configparser.ConfigParser:
+    '''
+    Reads config.ini once per process (path overridable with CONFIG_FILE).
+    '''
+    config = configparser.ConfigParser()
+    config.read(CONFIG_PATH)
+    return config
+
+
+def get_setting(section: str, key: str, default=None, cast=str):
+    '''
+    Returns a setting from config.ini, overridden by the environment variable
+    <SECTION>_<KEY> (e.g. SLOW_QUERY_THRESHOLD_MS for [slow_query] threshold_ms).
+    '''
+    value = os.getenv(f'{section}_{key}'.upper())
+    if value is None:
+        config = load_config()
+        if not config.has_option(section, key):
+            return default
+        value = config.get(section, key)
+    value = value.split(';', 1)[0].strip()
+    if value == '':
+        return default
+    if cast is bool:
+        return value.lower() in _TRUE_VALUES
+    return cast(value)
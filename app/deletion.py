@@ -0,0 +1,211 @@
+'''
+Background deletion of stock_data rows.
+
+Removing a ticker (or replacing it with a reimport) only deletes or swaps
+its catalog entry, which hides the data from readers at once, and queues a
+job in `stock_data_deletions` for the rows of the dead versions. A
+`DeletionWorker` thread in each API process claims jobs with a lease (so
+one crashed process does not strand a job) and works through them:
+
+1. On TimescaleDB, chunks that hold nothing but rows to delete are
+   truncated. This is the common case for tickers that have a hash
+   partition to themselves and avoids per-row WAL and table bloat.
+2. The remaining rows are deleted in batches of `batch_size`, one short
+   transaction each, so locks are brief and vacuum can keep up.
+
+Progress (rows deleted out of the total, chunks truncated) is stored on the
+job and served by `GET /stock_vault/deletions/{deletion_id}`. Jobs live on
+the database node that holds the ticker; the worker polls every node.
+'''
+import logging
+import threading
+from typing import Optional
+
+from app.config import get_setting
+from app.metrics import DELETION_ROWS
+from app.repositories.exceptions import RepositoryException
+from app.repositories.stock_data_deletion_repository import (
+    check_vault_data_chunk,
+    claim_vault_data_deletion,
+    count_vault_data_versions,
+    delete_vault_data_batch,
+    finish_vault_data_deletion,
+    get_vault_data_chunks,
+    truncate_vault_data_chunk,
+    update_vault_data_deletion_progress,
+)
+from app.tracing import start_trace
+from db.connection import db_connection, get_shard_map
+
+logger = logging.getLogger('elginvault.deletion')
+
+
+class DeletionWorker(threading.Thread):
+    '''
+    Daemon thread that runs queued deletion jobs one at a time. It checks
+    for new jobs every `poll_interval` seconds, or right away after wake().
+    '''
+
+    def __init__(
+        self,
+        batch_size: int = 10000,
+        pause: float = 0.0,
+        poll_interval: float = 10.0,
+        lease: float = 60.0,
+        lock_timeout_ms: int = 1000,
+        max_attempts: int = 5,
+        truncate_chunks: bool = True,
+    ):
+        super().__init__(name='stock-data-deletion-worker', daemon=True)
+        self.batch_size = batch_size
+        self.pause = pause
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.lock_timeout_ms = lock_timeout_ms
+        self.max_attempts = max_attempts
+        self.truncate_chunks = truncate_chunks
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def wake(self):
+        self._wake_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                if self.run_next():
+                    continue
+            except Exception as e:
+                logger.error(f'Deletion worker failed: {e}')
+            self._wake_event.wait(self.poll_interval)
+            self._wake_event.clear()
+
+    def run_next(self) -> bool:
+        '''
+        Claims and runs one job from the first node that has one. Returns
+        False if there was none.
+        '''
+        for node in get_shard_map().all_nodes:
+            with db_connection(node=node) as conn:
+                job = claim_vault_data_deletion(conn, self.lease)
+                conn.commit()
+            if job is not None:
+                self._run(node, *job)
+                return True
+        return False
+
+    def _run(self, node, deletion_id, ticker, min_version, max_version, rows_total, attempts):
+        with start_trace('task.delete', deletion_id=deletion_id, ticker=ticker, node=node):
+            try:
+                self._run_job(node, deletion_id, ticker, min_version, max_version, rows_total)
+                with db_connection(node=node) as conn:
+                    finish_vault_data_deletion(conn, deletion_id, 'completed')
+                    conn.commit()
+                logger.info(f'Deletion {deletion_id} of {ticker} completed.')
+            except Exception as e:
+                status = 'failed' if attempts >= self.max_attempts else 'pending'
+                logger.error(f'Deletion {deletion_id} of {ticker} failed ({status}): {e}')
+                with db_connection(node=node) as conn:
+                    finish_vault_data_deletion(
+                        conn, deletion_id, status, str(e), retry_after=self.lease
+                    )
+                    conn.commit()
+
+    def _run_job(self, node, deletion_id, ticker, min_version, max_version, rows_total):
+        if rows_total is None:
+            with db_connection(node=node) as conn:
+                rows_total = count_vault_data_versions(conn, ticker, min_version, max_version)
+                update_vault_data_deletion_progress(
+                    conn, deletion_id, self.lease, rows_total=rows_total
+                )
+                conn.commit()
+        if self.truncate_chunks:
+            self._truncate_chunks(node, deletion_id, ticker, min_version, max_version)
+        while not self._stop_event.is_set():
+            with db_connection(node=node) as conn:
+                deleted = delete_vault_data_batch(
+                    conn, ticker, min_version, max_version, self.batch_size
+                )
+                update_vault_data_deletion_progress(
+                    conn, deletion_id, self.lease, rows_deleted=deleted
+                )
+                conn.commit()
+            DELETION_ROWS.inc(deleted, method='batch')
+            if deleted == 0:
+                return
+            if self.pause:
+                self._stop_event.wait(self.pause)
+        # Stopping: the lease runs out and the job is resumed later
+        raise InterruptedError('worker stopped')
+
+    def _truncate_chunks(self, node, deletion_id, ticker, min_version, max_version):
+        with db_connection(node=node) as conn:
+            chunks = get_vault_data_chunks(conn)
+            conn.rollback()
+        for chunk in chunks:
+            if self._stop_event.is_set():
+                return
+            with db_connection(node=node) as conn:
+                try:
+                    has_rows, has_other_rows = check_vault_data_chunk(
+                        conn, chunk, ticker, min_version, max_version
+                    )
+                    conn.rollback()
+                    if not has_rows or has_other_rows:
+                        continue
+                    truncated = truncate_vault_data_chunk(
+                        conn, chunk, ticker, min_version, max_version, self.lock_timeout_ms
+                    )
+                    if truncated:
+                        update_vault_data_deletion_progress(
+                            conn, deletion_id, self.lease,
+                            rows_deleted=truncated, chunks_truncated=1,
+                        )
+                    conn.commit()
+                    DELETION_ROWS.inc(truncated, method='chunk')
+                except RepositoryException as e:
+                    # e.g. lock timeout: the batched delete covers this chunk
+                    conn.rollback()
+                    logger.info(f'Deletion {deletion_id}: skipped chunk {chunk[1]}: {e}')
+
+
+_worker: Optional[DeletionWorker] = None
+
+
+def start_deletion_worker() -> Optional[DeletionWorker]:
+    global _worker
+    if not get_setting('deletion', 'enabled', True, bool):
+        return None
+    if _worker is None or not _worker.is_alive():
+        _worker = DeletionWorker(
+            batch_size=get_setting('deletion', 'batch_size', 10000, int),
+            pause=get_setting('deletion', 'pause_ms', 0, int) / 1000,
+            poll_interval=get_setting('deletion', 'poll_interval', 10.0, float),
+            lease=get_setting('deletion', 'lease', 60.0, float),
+            lock_timeout_ms=get_setting('deletion', 'lock_timeout_ms', 1000, int),
+            max_attempts=get_setting('deletion', 'max_attempts', 5, int),
+            truncate_chunks=get_setting('deletion', 'truncate_chunks', True, bool),
+        )
+        _worker.start()
+    return _worker
+
+
+def wake_deletion_worker():
+    '''
+    Starts the local worker on a newly queued job without waiting for its
+    next poll. Workers in other processes pick the job up on their poll.
+    '''
+    if _worker is not None:
+        _worker.wake()
+
+
+def stop_deletion_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker.join(timeout=10)
+        _worker = None
@@ -0,0 +1,128 @@
+'''
+HTTP validators and conditional requests for the read endpoints.
+
+Stock data changes at most once a day, when a ticker is imported again, and
+every import or swap sets the catalog entry's `inserted_at`. The validators
+are therefore derived from the catalog alone: a request whose
+`If-None-Match` (or `If-Modified-Since`) still matches is answered with 304
+from the catalog entry, which is usually in the in-process cache, without
+querying `stock_data`.
+
+ETags are weak: the compression middleware sends different bytes for the
+same data depending on Accept-Encoding, and a weak ETag only promises that
+the representations are equivalent. `Cache-Control: public, max-age=...`
+lets a reverse proxy in front of the API serve repeated polls and
+revalidate them with the same ETag afterwards.
+'''
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+
+from starlette.responses import Response
+
+from app.config import get_setting
+from app.models import StockCatalog
+
+# Bump when the JSON layout of the responses changes
+REPRESENTATION = 'v2'
+
+
+def http_cache_enabled() -> bool:
+    return get_setting('http_cache', 'enabled', True, bool)
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(_as_utc(value), usegmt=True)
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b(
+        '\0'.join(str(part) for part in (REPRESENTATION,) + parts).encode(), digest_size=12
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def stock_data_validators(
+    catalog: StockCatalog, start_time: str, end_time: str, *extra
+) -> tuple[str, datetime]:
+    '''
+    Returns (ETag, Last-Modified) for the ticker's bars in the requested
+    range. `extra` tells apart other views of the same bars (e.g. the
+    indicators computed from them).
+    '''
+    etag = make_etag(
+        'stock_data',
+        catalog.ticker,
+        catalog.inserted_at.isoformat(),
+        catalog.start_time.isoformat(),
+        catalog.end_time.isoformat(),
+        start_time,
+        end_time,
+        *extra,
+    )
+    return etag, catalog.inserted_at
+
+
+def catalog_list_etag(catalogs: Iterable[StockCatalog]) -> str:
+    '''
+    ETag of the catalog list. There is no Last-Modified for the list:
+    removing a ticker changes it without a newer `inserted_at`.
+    '''
+    parts = [
+        f'{c.ticker}|{c.inserted_at.isoformat()}|{c.start_time.isoformat()}|{c.end_time.isoformat()}'
+        for c in catalogs
+    ]
+    return make_etag('catalog', *parts)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    '''
+    Weak comparison of `etag` with an If-None-Match header value.
+    '''
+    if header.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(
+        candidate.strip().removeprefix('W/') == opaque for candidate in header.split(',')
+    )
+
+
+def is_not_modified(headers, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    '''
+    Evaluates If-None-Match, or If-Modified-Since when If-None-Match is
+    absent (RFC 9110, section 13.2.2), for a GET request.
+    '''
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        # An invalid date is ignored
+        return False
+    # HTTP dates have one-second resolution
+    return _as_utc(last_modified).replace(microsecond=0) <= _as_utc(since)
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={get_setting("http_cache", "max_age", 60, int)}',
+    }
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
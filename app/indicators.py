@@ -0,0 +1,239 @@
+'''
+Technical indicators computed over StockBars batches.
+
+An indicator is requested as `name` or `name:period` (`sma:20,ema:12`):
+
+- `sma`: simple moving average of the close over `period` bars.
+- `ema`: exponential moving average of the close, alpha = 2 / (period + 1).
+- `returns`: simple return of the close over `period` bars.
+- `volatility`: standard deviation of the 1-bar log returns over `period`
+  bars (not annualized).
+- `vwap`: volume-weighted average of the typical price (high + low + close)
+  / 3 over `period` bars.
+
+Each indicator needs some history before the first bar it reports (its
+`lookback`), which the range query reads ahead of `start_time`. The rolling
+indicators are exact once `period` bars are available. An EMA depends on
+every earlier bar; it is started `EMA_WARMUP` periods early, where the
+weight left on its seed is below 1e-5. Values without enough history, at
+the start of a ticker, are NaN (null in JSON).
+
+`IndicatorCalculator` consumes the batches of one range query in order and
+carries what the next batch needs: the last bars for the rolling windows
+and the previous value of each EMA.
+'''
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+
+from app.bars import TIMESTAMP_DTYPE, StockBars
+
+DEFAULT_PERIODS = {'sma': 20, 'ema': 20, 'returns': 1, 'volatility': 20, 'vwap': 20}
+EMA_WARMUP = 6
+# Keeps alpha-weighted block sums of the EMA well inside float64 range
+_EMA_BLOCK_DECADES = 150
+
+
+class Indicator(NamedTuple):
+    name: str
+    period: int
+
+    @property
+    def column(self) -> str:
+        return f'{self.name}_{self.period}'
+
+    @property
+    def window(self) -> int:
+        '''
+        Bars a rolling indicator reads to produce one value.
+        '''
+        if self.name in ('returns', 'volatility'):
+            return self.period + 1
+        return self.period
+
+    @property
+    def lookback(self) -> int:
+        if self.name == 'ema':
+            return EMA_WARMUP * self.period
+        return self.window - 1
+
+
+def parse_indicators(spec: str, max_period: int = 10000) -> list[Indicator]:
+    '''
+    Parses a comma-separated list of `name[:period]`. Raises ValueError for
+    unknown names, bad periods and an empty list.
+    '''
+    indicators = []
+    for item in (spec or '').split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        name, _, period = item.partition(':')
+        if name not in DEFAULT_PERIODS:
+            raise ValueError(
+                f'Unknown indicator "{name}"; expected one of {", ".join(DEFAULT_PERIODS)}.'
+            )
+        try:
+            period = int(period) if period else DEFAULT_PERIODS[name]
+        except ValueError:
+            raise ValueError(f'Invalid period for indicator "{name}": {period!r}.')
+        if not 1 <= period <= max_period:
+            raise ValueError(f'Indicator periods must be between 1 and {max_period}.')
+        indicator = Indicator(name, period)
+        if indicator not in indicators:
+            indicators.append(indicator)
+    if not indicators:
+        raise ValueError('At least one indicator is required.')
+    return indicators
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    '''
+    Sums over the trailing `window` values; NaN where the window is
+    incomplete or holds a NaN.
+    '''
+    out = np.full(len(values), np.nan)
+    if len(values) < window:
+        return out
+    missing = np.isnan(values)
+    totals = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, values))))
+    gaps = np.concatenate(([0], np.cumsum(missing)))
+    sums = totals[window:] - totals[:-window]
+    sums[gaps[window:] - gaps[:-window] > 0] = np.nan
+    out[window - 1:] = sums
+    return out
+
+
+def _shifted(values: np.ndarray, periods: int) -> np.ndarray:
+    out = np.full(len(values), np.nan)
+    if periods < len(values):
+        out[periods:] = values[:-periods]
+    return out
+
+
+def sma(close: np.ndarray, period: int) -> np.ndarray:
+    return _rolling_sum(close, period) / period
+
+
+def returns(close: np.ndarray, period: int) -> np.ndarray:
+    return close / _shifted(close, period) - 1.0
+
+
+def volatility(close: np.ndarray, period: int) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_returns = np.log(close / _shifted(close, 1))
+    if period == 1:
+        return np.where(np.isnan(log_returns), np.nan, 0.0)
+    sums = _rolling_sum(log_returns, period)
+    squares = _rolling_sum(log_returns * log_returns, period)
+    variance = (squares - sums * sums / period) / (period - 1)
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def vwap(high, low, close, volume, period: int) -> np.ndarray:
+    volume = volume.astype(np.float64)
+    weighted = _rolling_sum((high + low + close) / 3.0 * volume, period)
+    total = _rolling_sum(volume, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, weighted / total, np.nan)
+
+
+def ema(close: np.ndarray, period: int, previous: float = np.nan) -> np.ndarray:
+    '''
+    EMA of `close` continuing from `previous` (NaN: start at the first
+    value). A missing close counts as the previous one.
+
+    y[k] = d^k * y0 + alpha * sum(d^(k-j) * x[j]) is evaluated as
+    d^k * (y0 + alpha * cumsum(x / d^j)) in blocks short enough for d^-j not
+    to overflow.
+    '''
+    values = close.astype(np.float64)
+    missing = np.isnan(values)
+    if missing.any():
+        # Forward-fill from the last known close (or `previous`)
+        index = np.where(missing, 0, np.arange(len(values)))
+        np.maximum.accumulate(index, out=index)
+        values = values[index]
+        if np.isnan(values[0]):
+            values[np.isnan(values)] = previous
+    out = np.empty(len(values))
+    alpha = 2.0 / (period + 1)
+    decay = 1.0 - alpha
+    block = len(values) if decay == 0 else max(1, int(_EMA_BLOCK_DECADES / -np.log10(decay)))
+    y = previous
+    for start in range(0, len(values), block):
+        x = values[start:start + block]
+        if np.isnan(y):
+            first = np.flatnonzero(~np.isnan(x))
+            if not len(first):
+                out[start:start + len(x)] = np.nan
+                continue
+            # Seed with the first known value
+            out[start:start + first[0]] = np.nan
+            y = x[first[0]]
+            out[start + first[0]] = y
+            offset = first[0] + 1
+            x = x[offset:]
+        else:
+            offset = 0
+        if len(x):
+            powers = decay ** np.arange(1, len(x) + 1)
+            if decay == 0:
+                result = x.copy()
+            else:
+                result = powers * (y + alpha * np.cumsum(x / powers))
+            out[start + offset:start + offset + len(x)] = result
+            y = result[-1]
+    return out
+
+
+class IndicatorCalculator:
+    '''
+    Computes indicators over the consecutive batches of one range query and
+    drops the bars before `start_time`, which only serve as history.
+    '''
+
+    def __init__(self, indicators: list[Indicator], start_time: datetime):
+        self.indicators = indicators
+        self.start = np.datetime64(start_time, 'us').astype(TIMESTAMP_DTYPE)
+        self.lookback = max(indicator.lookback for indicator in indicators)
+        windows = [i.window for i in indicators if i.name != 'ema']
+        self.history = max(windows) - 1 if windows else 0
+        self._tail = StockBars.empty()
+        self._ema_state = {}
+        self._seen = 0
+
+    def update(self, bars: StockBars) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+        '''
+        Returns (timestamps, {column: values}) for the bars of the batch at or
+        after start_time.
+        '''
+        combined = StockBars.concat([self._tail, bars]) if len(self._tail) else bars
+        skip = len(combined) - len(bars)
+        columns = {}
+        for indicator in self.indicators:
+            if indicator.name == 'ema':
+                values = ema(bars.close, indicator.period, self._ema_state.get(indicator, np.nan))
+                if len(values):
+                    self._ema_state[indicator] = values[-1]
+                # As with the rolling indicators, nothing before `period` bars
+                values[:max(0, indicator.period - 1 - self._seen)] = np.nan
+            elif indicator.name == 'sma':
+                values = sma(combined.close, indicator.period)[skip:]
+            elif indicator.name == 'returns':
+                values = returns(combined.close, indicator.period)[skip:]
+            elif indicator.name == 'volatility':
+                values = volatility(combined.close, indicator.period)[skip:]
+            else:
+                values = vwap(
+                    combined.high, combined.low, combined.close, combined.volume, indicator.period
+                )[skip:]
+            columns[indicator.column] = values
+        self._seen += len(bars)
+        if self.history:
+            self._tail = combined[max(0, len(combined) - self.history):]
+        keep = bars.timestamp >= self.start
+        if keep.all():
+            return bars.timestamp, columns
+        return bars.timestamp[keep], {name: values[keep] for name, values in columns.items()}
@@ -0,0 +1,184 @@
+'''
+Queue-based logging.
+
+Request threads only put records on a bounded in-memory queue (a
+`QueueHandler` on the root logger); a `QueueListener` thread does the
+formatting and the blocking console / file I/O. When the queue is full,
+records are dropped and counted rather than blocking the request.
+
+Settings live in the `[logging]` section of config.ini:
+
+- `level`: root level
+- `format`: `text` or `json` (one structured object per line, including
+  the trace id and any `extra` fields)
+- `levels`: per-logger levels, e.g. `uvicorn.access:WARNING, elginvault.slow_query:INFO`
+- `sample`: per-logger sampling rates for DEBUG/INFO records, e.g.
+  `elginvault.requests:0.1`; warnings and errors are never sampled out
+'''
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.config import get_setting
+from app.metrics import LOG_RECORDS_DROPPED
+from app.tracing import current_span
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+def parse_mapping(value: Optional[str], cast=str) -> dict:
+    '''
+    Parses 'name:value, name:value' settings.
+    '''
+    mapping = {}
+    for item in (value or '').split(','):
+        if ':' not in item:
+            continue
+        name, setting = item.rsplit(':', 1)
+        mapping[name.strip()] = cast(setting.strip())
+    return mapping
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    '''
+    QueueHandler that never blocks: records that do not fit are dropped.
+    '''
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class SamplingFilter(logging.Filter):
+    '''
+    Keeps a fraction of DEBUG/INFO records from the configured loggers (and
+    their children). WARNING and above always pass.
+    '''
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._cache: dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            candidate = name
+            while candidate:
+                if candidate in self.rates:
+                    rate = self.rates[candidate]
+                    break
+                candidate = candidate.rpartition('.')[0]
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class TraceContextFilter(logging.Filter):
+    '''
+    Stamps records with the current trace and span ids. Runs in the calling
+    thread, where the tracing context is still available.
+    '''
+
+    def filter(self, record) -> bool:
+        span = current_span()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(force: bool = False):
+    '''
+    Installs the queue pipeline on the root logger. Safe to call more than
+    once; later calls are no-ops unless `force` is set.
+    '''
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            if not force:
+                return
+            stop_logging()
+
+        formatter = (
+            JsonFormatter()
+            if get_setting('logging', 'format', 'text').lower() == 'json'
+            else logging.Formatter(TEXT_FORMAT)
+        )
+        handlers = [logging.StreamHandler()]
+        log_file = get_setting('logging', 'file', 'app.log')
+        if log_file:
+            handlers.append(logging.FileHandler(log_file))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(get_setting('logging', 'queue_size', 10000, int))
+        queue_handler = DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(
+            parse_mapping(get_setting('logging', 'sample', None), float)
+        ))
+        queue_handler.addFilter(TraceContextFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(get_setting('logging', 'level', 'INFO').upper())
+        for name, level in parse_mapping(get_setting('logging', 'levels', None)).items():
+            logging.getLogger(name).setLevel(level.upper())
+
+        _listener = logging.handlers.QueueListener(
+            log_queue, *handlers, respect_handler_level=True
+        )
+        _listener.start()
+
+
+def stop_logging():
+    '''
+    Flushes queued records and stops the listener thread.
+    '''
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
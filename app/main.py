@@ -1,9 +1,8 @@
+import json
 import uuid
 import logging
 import time
-import pandas as pd
 from typing import Optional
-from io import StringIO
 from fastapi import (
     FastAPI,
     HTTPException,
@@ -11,16 +10,92 @@ from fastapi import (
     Form,
     UploadFile,
     File,
+    Request,
 )
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
 from pydantic import BaseModel
 from typing import Generator
-from app.models import StockData, StockCatalog
+from app.models import StockCatalog
+from app.admission import AdmissionMiddleware
+from app.coalescing import query_flights
+from app.config import get_setting
+from app.compression import (
+    CompressionMiddleware,
+    detect_upload_compression,
+    is_supported_csv_upload,
+    open_upload_stream,
+    verify_upload_stream,
+)
+from app.http_cache import (
+    cache_headers,
+    catalog_list_etag,
+    http_cache_enabled,
+    is_not_modified,
+    not_modified_response,
+    stock_data_validators,
+)
+from app.indicators import parse_indicators
+from app.logging_config import configure_logging
+from app.matrix import (
+    FILL_METHODS,
+    matrix_to_arrow_stream,
+    matrix_to_parquet,
+    parse_fields,
+    parse_list,
+)
+from app.metrics import (
+    BACKGROUND_TASKS,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    IMPORT_BYTES,
+    IMPORT_DURATION,
+    IMPORT_ROWS,
+    STREAM_BYTES,
+    STREAM_ROWS,
+    MetricsMiddleware,
+    render_metrics,
+)
+from app.profiling import (
+    ProfilingMiddleware,
+    maybe_profile_stream,
+    requested_profile_id,
+    start_profiler,
+)
+from app.tracing import (
+    TracingMiddleware,
+    current_trace_parent,
+    span,
+    start_trace,
+    traced_iterator,
+)
+from app.uploads import (
+    columnar_support_available,
+    detect_upload_format,
+    is_supported_upload,
+)
 from app.repositories.exceptions import RepositoryException
-from app.services.stock_data_service import prepare_records
+from app.snapshot import latest_bars
+from app.serializers import (
+    bars_to_json_records,
+    indicators_to_json_records,
+    matrix_to_csv,
+    matrix_to_json,
+)
+from app.startup import lifespan
+from app.streaming import QueryStreamingResponse
+from app.services.stock_data_service import (
+    iter_columnar_batches,
+    prepare_bars,
+    prepare_columns,
+)
+from db.connection import QueryCancellation, get_statement_timeout
 from app.services.stock_vault_services import (
     import_stock_vault,
+    import_stock_vault_columns,
+    query_stock_vault_deletion,
+    query_stock_vault_indicators,
+    query_stock_vault_matrix,
     remove_stock_vault,
     fetch_stock_vault_catalog_list,
     query_stock_vault_data,
@@ -35,16 +110,30 @@ class BulkInsertRequest(BaseModel):
     csv_content: str
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler(), logging.FileHandler('app.log')],
-)
+configure_logging()
 logging.info('Starting FastAPI application...')
-app = FastAPI()
+# Per-request chatter; sampled via [logging] sample
+request_logger = logging.getLogger('elginvault.requests')
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 task_status = {}
 
 
+def count_task_statuses():
+    counts = {('In Progress',): 0, ('Completed',): 0, ('Failed',): 0}
+    for status in list(task_status.values()):
+        key = ('Failed',) if status.startswith('Failed') else (status,)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+BACKGROUND_TASKS.callback = count_task_statuses
+
+
 def task_status_cleanup_loop(interval: int = 3600):
     timeout = datetime.now()
     while True:
@@ -63,33 +152,81 @@ def init_task_status(task_id: str):
 
 
 def process_bulk_insert_stock_data(
-    ticker: str, start_time: str, end_time: str, csv_content: bytes, task_id: str
+    ticker: str,
+    start_time: str,
+    end_time: str,
+    csv_content: bytes,
+    task_id: str,
+    compression: Optional[str] = None,
+    upload_format: str = 'csv',
+    profile: bool = False,
+    trace_parent: Optional[str] = None,
 ):
-    try:
-        # if not os.path.exists(req.csv_file):
-        #     raise ValueError(f'CSV file does not exist: {req.csv_file}')
-        # df = read_and_validate_csv(req.csv_file)
-        # if df.empty:
-        #     raise ValueError('CSV file is empty.')
-        csv_string: str = csv_content.decode('utf-8')
-        csv_io: StringIO = StringIO(csv_string)
-        records = prepare_records(pd.read_csv(csv_io))
-        logging.info(
-            f'[Task {task_id}] Processing bulk insert for ticker: {ticker}, total records: {len(records)}'
-        )
-        import_stock_vault(ticker, start_time, end_time, records)
-        update_task_status(task_id, 'Completed')
-        logging.info(f'[Task {task_id}] Bulk insert completed successfully.')
-    except ValueError as e:
-        update_task_status(task_id, f'Failed: {e}')
-        raise
-    except RepositoryException as e:
-        update_task_status(task_id, f'Failed: {e}')
-        raise
-    except Exception as e:
-        logging.error(f'[Task {task_id}] Unexpected error: {e}', exc_info=True)
-        update_task_status(task_id, 'Failed: Internal server error')
-        raise
+    start = time.perf_counter()
+    outcome = 'failed'
+    profiler = start_profiler(f'import_{task_id}') if profile else None
+    if profiler:
+        profiler.resume()
+    with start_trace(
+        'task.import', parent=trace_parent, task_id=task_id, format=upload_format
+    ):
+        try:
+            # if not os.path.exists(req.csv_file):
+            #     raise ValueError(f'CSV file does not exist: {req.csv_file}')
+            # df = read_and_validate_csv(req.csv_file)
+            # if df.empty:
+            #     raise ValueError('CSV file is empty.')
+            if upload_format != 'csv':
+                # Parquet / Arrow columns go straight to the bulk insert, batch by batch
+                logging.info(
+                    f'[Task {task_id}] Processing {upload_format} bulk insert for ticker: {ticker}'
+                )
+                total = import_stock_vault_columns(
+                    ticker,
+                    start_time,
+                    end_time,
+                    (
+                        prepare_columns(batch)
+                        for batch in iter_columnar_batches(csv_content, upload_format)
+                    ),
+                )
+                logging.info(f'[Task {task_id}] Inserted {total} records.')
+                IMPORT_ROWS.inc(total, format=upload_format)
+            else:
+                # pandas is only needed here; importing it lazily keeps startup fast
+                import pandas as pd
+
+                # Compressed uploads are inflated block by block while pandas parses
+                with span('parse.csv'), open_upload_stream(csv_content, compression) as csv_io:
+                    bars = prepare_bars(pd.read_csv(csv_io, encoding='utf-8'))
+                logging.info(
+                    f'[Task {task_id}] Processing bulk insert for ticker: {ticker}, total records: {len(bars)}'
+                )
+                import_stock_vault(ticker, start_time, end_time, bars)
+                IMPORT_ROWS.inc(len(bars), format=upload_format)
+            update_task_status(task_id, 'Completed')
+            outcome = 'completed'
+            logging.info(f'[Task {task_id}] Bulk insert completed successfully.')
+        except ValueError as e:
+            update_task_status(task_id, f'Failed: {e}')
+            raise
+        except RepositoryException as e:
+            update_task_status(task_id, f'Failed: {e}')
+            raise
+        except Exception as e:
+            logging.error(f'[Task {task_id}] Unexpected error: {e}', exc_info=True)
+            update_task_status(task_id, 'Failed: Internal server error')
+            raise
+        finally:
+            IMPORT_DURATION.observe(time.perf_counter() - start, outcome=outcome)
+            if profiler:
+                profiler.pause()
+                profiler.finish()
+
+
+@app.get('/metrics')
+def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 
 @app.get('/task_status/{task_id}')
@@ -99,9 +236,53 @@ async def get_taskstatus_taskid(task_id: str):
     return {'task_id': task_id, 'status': task_status[task_id]}
 
 
+def check_stock_data_validators(
+    request: Request, ticker: str, start_time: datetime, end_time: datetime, *extra
+) -> tuple[Optional[dict], bool]:
+    '''
+    Returns the validator headers for a view of the ticker's bars (None when
+    HTTP caching is off or the ticker is not in the catalog) and whether the
+    request's conditional headers still match them.
+    '''
+    if not http_cache_enabled():
+        return None, False
+    catalog = query_stock_vault_catalog_ticker(
+        ticker, statement_timeout=get_statement_timeout('catalog')
+    )
+    if catalog is None:
+        return None, False
+    etag, last_modified = stock_data_validators(
+        catalog, start_time.isoformat(), end_time.isoformat(), *extra
+    )
+    headers = cache_headers(etag, last_modified)
+    return headers, is_not_modified(request.headers, etag, last_modified)
+
+
+def encode_stock_data(batch_generator: Generator) -> Generator:
+    '''
+    Encodes the /stock_data body as (chunk, rows) pairs: one chunk per
+    batch, serialized column-wise, between the envelope's head and tail.
+    '''
+    count = 0
+    try:
+        yield '{"data": [', 0
+        for bars in batch_generator:
+            records = bars_to_json_records(bars)
+            if not records:
+                continue
+            yield (',' if count else '') + ','.join(records), len(records)
+            count += len(records)
+        yield f'], "count": {count}, "status": "success"}}', 0
+    finally:
+        batch_generator.close()
+
+
 @app.get('/stock_data/{ticker}')
 def get_stockdata_ticker(
-    ticker: str, start_time: str = '2000-01-01', end_time: str = '2025-01-25'
+    request: Request,
+    ticker: str,
+    start_time: str = '2000-01-01',
+    end_time: str = '2025-01-25',
 ):
     try:
         start_time_dt = datetime.strptime(start_time, '%Y-%m-%d')
@@ -110,24 +291,54 @@ def get_stockdata_ticker(
             raise ValueError('Start time must be before end time.')
         if not ticker:
             raise ValueError('Ticker symbol is required.')
-        record_generator: Generator = query_stock_vault_data(
-            ticker, start_time, end_time
+        headers, not_modified = check_stock_data_validators(
+            request, ticker, start_time_dt, end_time_dt
         )
+        if not_modified:
+            return not_modified_response(headers)
+        cancellation = QueryCancellation()
+        statement_timeout = get_statement_timeout('stock_data')
+
+        def encode(query_cancellation):
+            return encode_stock_data(
+                query_stock_vault_data(
+                    ticker,
+                    start_time,
+                    end_time,
+                    statement_timeout=statement_timeout,
+                    cancellation=query_cancellation,
+                )
+            )
 
         def stream_data():
             count = 0
-            yield '{"data": ['
-            first = True
-            record: StockData
-            for record in record_generator:
-                if not first:
-                    yield ','
-                first = False
-                yield record.model_dump_json()
-                count += 1
-            yield f'], "count": {count}, "status": "success"}}'
-
-        return StreamingResponse(stream_data(), media_type='application/json')
+            size = 0
+            # Identical concurrent requests share one query (app/coalescing.py)
+            chunks = query_flights.stream(
+                ('stock_data', ticker, start_time_dt.isoformat(), end_time_dt.isoformat(), 'json'),
+                encode,
+                cancellation,
+            )
+            try:
+                for chunk, rows in chunks:
+                    size += len(chunk)
+                    count += rows
+                    yield chunk
+            finally:
+                # Releases the connection when the stream is closed early
+                chunks.close()
+                STREAM_ROWS.inc(count, endpoint='stock_data')
+                STREAM_BYTES.inc(size, endpoint='stock_data')
+
+        return QueryStreamingResponse(
+            maybe_profile_stream(
+                traced_iterator(stream_data(), 'serialize.stock_data'), 'stock_data'
+            ),
+            cancellation,
+            'stock_data',
+            media_type='application/json',
+            headers=headers,
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f'Invalid date format: {e}')
     except RepositoryException as e:
@@ -148,9 +359,10 @@ async def post_bulkinsertstockdata2(
             raise HTTPException(status_code=400, detail='CSV file is required.')
 
         # Validate the file type
-        if not csv_file.filename.endswith('.csv'):
+        if not is_supported_csv_upload(csv_file.filename):
             raise HTTPException(
-                status_code=400, detail='Invalid file type. Only CSV files are allowed.'
+                status_code=400,
+                detail='Invalid file type. Only CSV files (.csv, .csv.gz, .csv.zst) are allowed.',
             )
 
         # Validate other fields
@@ -168,6 +380,10 @@ async def post_bulkinsertstockdata2(
         csv_content = await csv_file.read()
         if not csv_content.strip():
             raise HTTPException(status_code=400, detail='CSV file is empty.')
+        compression = detect_upload_compression(csv_file.filename, csv_content)
+        # A truncated or corrupt archive is the client's error, not the import's
+        await run_in_threadpool(verify_upload_stream, csv_content, compression)
+        IMPORT_BYTES.inc(len(csv_content), format='csv')
         task_id = str(uuid.uuid4())
         init_task_status(task_id)
         background_tasks.add_task(
@@ -177,6 +393,9 @@ async def post_bulkinsertstockdata2(
             end_time,
             csv_content,
             task_id,
+            compression,
+            profile=requested_profile_id() is not None,
+            trace_parent=current_trace_parent(),
         )
         return {'message': 'Stock data bulk insert started.', 'task_id': task_id}
     except ValueError as e:
@@ -189,24 +408,49 @@ async def post_bulkinsertstockdata2(
 
 # old
 @app.get('/stock/vault_catalog/all')
-def get_stock_vaultcatalog_all():
-    logging.info('Fetching all stock vault catalog...')
+def get_stock_vaultcatalog_all(request: Request):
+    request_logger.info('Fetching all stock vault catalog...')
     try:
-        record_generator = fetch_stock_vault_catalog_list()
+        cancellation = QueryCancellation()
+        # The list is small (one entry per ticker) and usually cached; reading
+        # it up front gives the ETag before anything is sent
+        catalogs = list(fetch_stock_vault_catalog_list(
+            statement_timeout=get_statement_timeout('catalog'),
+            cancellation=cancellation,
+        ))
+        headers = None
+        if http_cache_enabled():
+            etag = catalog_list_etag(catalogs)
+            headers = cache_headers(etag)
+            if is_not_modified(request.headers, etag):
+                return not_modified_response(headers)
 
         def stream_data():
             count = 0
-            yield '{"data":['  # Start of the JSON object
-            first = True
-            for record in record_generator:
-                if not first:
-                    yield ','  # Add a comma between records
-                first = False
-                yield record.model_dump_json()  # Serialize each record to JSON
-                count += 1
-            yield f'], "count": {count}, "status": "success"}}'  # End of the JSON object
-
-        return StreamingResponse(stream_data(), media_type="application/json")
+            size = 0
+            try:
+                yield '{"data":['  # Start of the JSON object
+                first = True
+                for record in catalogs:
+                    if not first:
+                        yield ','  # Add a comma between records
+                    first = False
+                    chunk = record.model_dump_json()  # Serialize each record to JSON
+                    size += len(chunk) + 1
+                    yield chunk
+                    count += 1
+                yield f'], "count": {count}, "status": "success"}}'  # End of the JSON object
+            finally:
+                STREAM_ROWS.inc(count, endpoint='catalog')
+                STREAM_BYTES.inc(size, endpoint='catalog')
+
+        return QueryStreamingResponse(
+            maybe_profile_stream(traced_iterator(stream_data(), 'serialize.catalog'), 'catalog'),
+            cancellation,
+            'catalog',
+            media_type="application/json",
+            headers=headers,
+        )
     except RepositoryException as e:
         raise HTTPException(
             status_code=500, detail=f'Error retrieving stock catalog: {e}'
@@ -216,11 +460,13 @@ def get_stock_vaultcatalog_all():
 # old
 @app.get('/stock/vault_catalog/{ticker}')
 def get_stock_vaultcatalog_ticker(ticker: str):
-    logging.info(f'Fetching stock vault catalog for ticker: {ticker}')
+    request_logger.info(f'Fetching stock vault catalog for ticker: {ticker}')
     try:
         if not ticker:
             raise ValueError('Ticker symbol is required.')
-        result = query_stock_vault_catalog_ticker(ticker)
+        result = query_stock_vault_catalog_ticker(
+            ticker, statement_timeout=get_statement_timeout('catalog')
+        )
 
         if result:
             return {
@@ -257,9 +503,10 @@ async def post_stockvault_import(
             raise HTTPException(status_code=400, detail='CSV file is required.')
 
         # Validate the file type
-        if not csv_file.filename.endswith('.csv'):
+        if not is_supported_upload(csv_file.filename):
             raise HTTPException(
-                status_code=400, detail='Invalid file type. Only CSV files are allowed.'
+                status_code=400,
+                detail='Invalid file type. Only CSV (.csv, .csv.gz, .csv.zst), Parquet and Arrow files are allowed.',
             )
 
         # Validate other fields
@@ -276,10 +523,17 @@ async def post_stockvault_import(
         csv_content = await csv_file.read()
         if not csv_content.strip():
             raise HTTPException(status_code=400, detail='CSV file is empty.')
-        # Check if stock catalog already exists
-        existing_catalog = query_stock_vault_catalog_ticker(ticker)
-        if existing_catalog:
-            remove_stock_vault(ticker)
+        upload_format = detect_upload_format(csv_file.filename, csv_content)
+        if upload_format != 'csv' and not columnar_support_available():
+            raise HTTPException(
+                status_code=400,
+                detail='Parquet and Arrow uploads require the "pyarrow" package on the server.',
+            )
+        compression = detect_upload_compression(csv_file.filename, csv_content)
+        await run_in_threadpool(verify_upload_stream, csv_content, compression)
+        IMPORT_BYTES.inc(len(csv_content), format=upload_format)
+        # An existing ticker keeps serving its current data until the new
+        # import is loaded and swapped in (see import_stock_vault_columns)
         task_id = str(uuid.uuid4())
         init_task_status(task_id)
         background_tasks.add_task(
@@ -289,6 +543,10 @@ async def post_stockvault_import(
             end_time,
             csv_content,
             task_id,
+            compression,
+            upload_format,
+            profile=requested_profile_id() is not None,
+            trace_parent=current_trace_parent(),
         )
         return {'message': 'Stock data bulk insert started.', 'task_id': task_id}
     except ValueError as e:
@@ -312,11 +570,31 @@ def delete_stockvault_ticker(ticker: str):
         )
 
 
+# v2 GET /stock_vault/deletions/{deletion_id}
+@app.get('/stock_vault/deletions/{deletion_id}')
+def get_stockvault_deletion(deletion_id: int, node: Optional[str] = None):
+    try:
+        result = query_stock_vault_deletion(deletion_id, node)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f'Invalid request: {e}')
+    except RepositoryException as e:
+        raise HTTPException(
+            status_code=500, detail=f'Error retrieving stock vault deletion: {e}'
+        )
+    if result is None:
+        raise HTTPException(status_code=404, detail='Deletion not found.')
+    return {
+        "data": result.model_dump(),
+        "message": "Stock vault deletion retrieved successfully",
+        "status": "success",
+    }
+
+
 # v2 GET /stock_vault/catalog_all
 @app.get('/stock_vault/catalog_all')
-def get_stockvault_catalog():
-    logging.info('Fetching all stock vault catalog...')
-    return get_stock_vaultcatalog_all()
+def get_stockvault_catalog(request: Request):
+    request_logger.info('Fetching all stock vault catalog...')
+    return get_stock_vaultcatalog_all(request)
 
 
 # v2 GET /stock_vault/catalog/{ticker}
@@ -327,5 +605,157 @@ def get_stockvault_catalog_ticker(ticker: str):
 
 # v2 GET /stock_vault/data/{ticker}
 @app.get('/stock_vault/data/{ticker}')
-def get_stockvault_data_ticker(ticker: str):
-    return get_stockdata_ticker(ticker)
+def get_stockvault_data_ticker(request: Request, ticker: str):
+    return get_stockdata_ticker(request, ticker)
+
+
+# v2 GET /stock_vault/indicators/{ticker}
+@app.get('/stock_vault/indicators/{ticker}')
+def get_stockvault_indicators_ticker(
+    request: Request,
+    ticker: str,
+    indicators: str,
+    start_time: str = '2000-01-01',
+    end_time: str = '2025-01-25',
+):
+    try:
+        start_time_dt = datetime.strptime(start_time, '%Y-%m-%d')
+        end_time_dt = datetime.strptime(end_time, '%Y-%m-%d')
+        if start_time_dt > end_time_dt:
+            raise ValueError('Start time must be before end time.')
+        if not ticker:
+            raise ValueError('Ticker symbol is required.')
+        requested = parse_indicators(
+            indicators, get_setting('indicators', 'max_period', 10000, int)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f'Invalid indicator request: {e}')
+    try:
+        headers, not_modified = check_stock_data_validators(
+            request,
+            ticker,
+            start_time_dt,
+            end_time_dt,
+            *(indicator.column for indicator in requested),
+        )
+        if not_modified:
+            return not_modified_response(headers)
+        cancellation = QueryCancellation()
+        batch_generator: Generator = query_stock_vault_indicators(
+            ticker,
+            start_time_dt,
+            end_time_dt,
+            requested,
+            statement_timeout=get_statement_timeout('stock_data'),
+            cancellation=cancellation,
+        )
+
+        def stream_data():
+            count = 0
+            size = 0
+            try:
+                yield '{"data": ['
+                for timestamps, columns in batch_generator:
+                    records = indicators_to_json_records(timestamps, columns)
+                    chunk = (',' if count else '') + ','.join(records)
+                    size += len(chunk)
+                    yield chunk
+                    count += len(records)
+                yield f'], "count": {count}, "status": "success"}}'
+            finally:
+                batch_generator.close()
+                STREAM_ROWS.inc(count, endpoint='indicators')
+                STREAM_BYTES.inc(size, endpoint='indicators')
+
+        return QueryStreamingResponse(
+            maybe_profile_stream(
+                traced_iterator(stream_data(), 'serialize.indicators'), 'indicators'
+            ),
+            cancellation,
+            'indicators',
+            media_type='application/json',
+            headers=headers,
+        )
+    except RepositoryException as e:
+        raise HTTPException(status_code=500, detail=f'Error computing indicators: {e}')
+
+
+# v2 GET /stock_vault/snapshot
+@app.get('/stock_vault/snapshot')
+def get_stockvault_snapshot(tickers: Optional[str] = None):
+    '''
+    Latest bar of each ticker in the comma-separated `tickers` (all tickers
+    if omitted), from the in-memory latest-bar table (app/snapshot.py).
+    '''
+    requested = None
+    if tickers is not None:
+        requested = [ticker.strip() for ticker in tickers.split(',') if ticker.strip()]
+        if not requested:
+            raise HTTPException(status_code=400, detail='At least one ticker is required.')
+    try:
+        records, missing = latest_bars.snapshot(requested)
+    except RepositoryException as e:
+        raise HTTPException(status_code=500, detail=f'Error retrieving snapshot: {e}')
+    body = (
+        f'{{"data":[{",".join(records)}],"missing":{json.dumps(missing)},'
+        f'"count":{len(records)},"status":"success"}}'
+    )
+    return Response(body, media_type='application/json')
+
+
+MATRIX_FORMATS = ('json', 'csv', 'arrow', 'parquet')
+
+
+# v2 GET /stock_vault/matrix
+@app.get('/stock_vault/matrix')
+def get_stockvault_matrix(
+    tickers: str,
+    fields: str = 'close',
+    start_time: str = '2000-01-01',
+    end_time: str = '2025-01-25',
+    fill: str = 'null',
+    format: str = 'json',
+):
+    '''
+    The fields of several tickers aligned on their common timestamps, one
+    column per (field, ticker); see app/matrix.py.
+    '''
+    try:
+        start_time_dt = datetime.strptime(start_time, '%Y-%m-%d')
+        end_time_dt = datetime.strptime(end_time, '%Y-%m-%d')
+        if start_time_dt > end_time_dt:
+            raise ValueError('Start time must be before end time.')
+        requested = parse_list(tickers, 'ticker')
+        max_tickers = get_setting('matrix', 'max_tickers', 500, int)
+        if len(requested) > max_tickers:
+            raise ValueError(f'At most {max_tickers} tickers can be requested at once.')
+        requested_fields = parse_fields(fields)
+        if fill not in FILL_METHODS:
+            raise ValueError(f'fill must be one of {", ".join(FILL_METHODS)}.')
+        if format not in MATRIX_FORMATS:
+            raise ValueError(f'format must be one of {", ".join(MATRIX_FORMATS)}.')
+        if format in ('arrow', 'parquet') and not columnar_support_available():
+            raise ValueError('Arrow and Parquet output require the "pyarrow" package on the server.')
+        matrix = query_stock_vault_matrix(
+            requested,
+            start_time,
+            end_time,
+            requested_fields,
+            fill,
+            max_rows=get_setting('matrix', 'max_rows', 5_000_000, int),
+            statement_timeout=get_statement_timeout('stock_data'),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f'Invalid matrix request: {e}')
+    except RepositoryException as e:
+        raise HTTPException(status_code=500, detail=f'Error retrieving stock data: {e}')
+    STREAM_ROWS.inc(len(matrix), endpoint='matrix')
+    if format == 'arrow':
+        return Response(
+            matrix_to_arrow_stream(matrix), media_type='application/vnd.apache.arrow.stream'
+        )
+    if format == 'parquet':
+        return Response(matrix_to_parquet(matrix), media_type='application/vnd.apache.parquet')
+    if format == 'csv':
+        return StreamingResponse(matrix_to_csv(matrix), media_type='text/csv')
+    return StreamingResponse(matrix_to_json(matrix), media_type='application/json')
@@ -0,0 +1,128 @@
+'''
+Timestamp-aligned matrices of several tickers' bars.
+
+`align_bars` pivots the bars of one multi-ticker query into one column per
+(field, ticker), named `<field>.<ticker>`, on the sorted union of their
+timestamps. A ticker without a bar at a timestamp is filled according to
+`fill`:
+
+- `null`: left missing (NaN; null in JSON and Arrow, empty in CSV).
+- `ffill`: the ticker's previous value within the range; missing before its
+  first bar.
+- `zero`: 0.
+- `drop`: only timestamps at which every ticker has a bar are kept.
+'''
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+from app.bars import TIMESTAMP_DTYPE, StockBars
+
+MATRIX_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+FILL_METHODS = ('null', 'ffill', 'zero', 'drop')
+
+
+class PriceMatrix(NamedTuple):
+    index: np.ndarray
+    # '<field>.<ticker>' -> float64 values (NaN where missing)
+    columns: dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+def parse_list(value: str, name: str) -> list[str]:
+    '''
+    Splits a comma-separated query parameter, dropping blanks and repeats.
+    '''
+    items = list(dict.fromkeys(item.strip() for item in (value or '').split(',') if item.strip()))
+    if not items:
+        raise ValueError(f'At least one {name} is required.')
+    return items
+
+
+def parse_fields(value: str) -> list[str]:
+    fields = [field.lower() for field in parse_list(value, 'field')]
+    unknown = [field for field in fields if field not in MATRIX_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields {unknown}; expected some of {", ".join(MATRIX_FIELDS)}.')
+    return fields
+
+
+def _forward_fill(values: np.ndarray) -> np.ndarray:
+    '''
+    Forward-fills the NaNs of each column of a 2-D array.
+    '''
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return values[rows, np.arange(values.shape[1])]
+
+
+def align_bars(
+    batches: Iterable[StockBars], tickers: list[str], fields: list[str], fill: str = 'null'
+) -> PriceMatrix:
+    if fill not in FILL_METHODS:
+        raise ValueError(f'Unknown fill method "{fill}"; expected one of {", ".join(FILL_METHODS)}.')
+    bars = StockBars.concat(batches)
+    index = np.unique(bars.timestamp).astype(TIMESTAMP_DTYPE)
+    rows = np.searchsorted(index, bars.timestamp)
+    positions = {ticker: i for i, ticker in enumerate(tickers)}
+    cols = np.fromiter(
+        (positions[ticker] for ticker in bars.ticker.tolist()), dtype=np.intp, count=len(bars)
+    )
+    shape = (len(index), len(tickers))
+    keep = None
+    if fill == 'drop':
+        present = np.zeros(shape, dtype=bool)
+        present[rows, cols] = True
+        keep = present.all(axis=1)
+        index = index[keep]
+    columns = {}
+    for field in fields:
+        values = np.full(shape, np.nan)
+        values[rows, cols] = getattr(bars, field)
+        if fill == 'ffill':
+            values = _forward_fill(values)
+        elif fill == 'zero':
+            values[np.isnan(values)] = 0.0
+        elif keep is not None:
+            values = values[keep]
+        for i, ticker in enumerate(tickers):
+            columns[f'{field}.{ticker}'] = values[:, i]
+    return PriceMatrix(index, columns)
+
+
+def matrix_to_arrow(matrix: PriceMatrix):
+    '''
+    Converts to a pyarrow Table: a `timestamp` column, then float64 price
+    and int64 volume columns, with nulls where values are missing.
+    '''
+    import pyarrow as pa
+
+    arrays = [pa.array(matrix.index, type=pa.timestamp('us'))]
+    for name, values in matrix.columns.items():
+        missing = np.isnan(values)
+        if name.startswith('volume.'):
+            arrays.append(pa.array(np.where(missing, 0, values).astype(np.int64), mask=missing))
+        else:
+            arrays.append(pa.array(values, mask=missing, type=pa.float64()))
+    return pa.Table.from_arrays(arrays, names=['timestamp'] + list(matrix.columns))
+
+
+def matrix_to_arrow_stream(matrix: PriceMatrix) -> bytes:
+    import pyarrow as pa
+
+    table = matrix_to_arrow(matrix)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def matrix_to_parquet(matrix: PriceMatrix) -> bytes:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = pa.BufferOutputStream()
+    pq.write_table(matrix_to_arrow(matrix), sink)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,356 @@
+'''
+Minimal Prometheus-style metrics.
+
+Counters, gauges and histograms are plain in-process objects guarded by a
+lock; recording a sample is a dict lookup plus an addition (and a bisect for
+histograms), so the instrumentation can stay on in production. `/metrics`
+renders everything in the Prometheus text exposition format.
+'''
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+_registry: list['_Metric'] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple, values: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    '''
+    A gauge that is either set/incremented directly or, when `callback` is
+    given, computed at scrape time. The callback returns a number, or a dict
+    mapping label-value tuples to numbers for labelled gauges.
+    '''
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback: Optional[Callable] = None):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        if self.callback is not None:
+            result = self.callback()
+            items = list(result.items()) if isinstance(result, dict) else [((), result)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [
+            f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # per label key: [bucket counts..., +Inf count], sum
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, ('le', _format_value(float(bound))))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    'elginvault_http_request_duration_seconds',
+    'HTTP request latency including the streamed body, by route template.',
+    labels=('method', 'route', 'status'),
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    'elginvault_http_requests_in_progress',
+    'HTTP requests currently being served.',
+)
+DB_QUERY_DURATION = Histogram(
+    'elginvault_db_query_duration_seconds',
+    'Database statement execution time, by SQL file.',
+    labels=('query',),
+)
+DB_QUERY_ROWS = Counter(
+    'elginvault_db_query_rows_total',
+    'Rows returned or affected by database statements, by SQL file.',
+    labels=('query',),
+)
+DB_QUERY_ERRORS = Counter(
+    'elginvault_db_query_errors_total',
+    'Database statements that raised, by SQL file.',
+    labels=('query',),
+)
+DB_CONNECTIONS_OPENED = Counter(
+    'elginvault_db_connections_opened_total',
+    'Database connections opened by the API process.',
+)
+DB_CONNECTIONS_OPEN = Gauge(
+    'elginvault_db_connections_open',
+    'Database connections currently open in the API process.',
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'elginvault_db_pool_connections',
+    'Connections held by the pool, by state (idle, in_use).',
+    labels=('state',),
+)
+DB_POOL_WAIT = Histogram(
+    'elginvault_db_pool_wait_seconds',
+    'Time spent waiting for a free pooled connection.',
+)
+DB_READ_ROUTES = Counter(
+    'elginvault_db_read_routes_total',
+    'Read-only connections by target (replica name or primary) and reason '
+    '(replica, freshness, fallback).',
+    labels=('target', 'reason'),
+)
+STREAM_ROWS = Counter(
+    'elginvault_stream_rows_total',
+    'Rows written to streaming responses, by endpoint.',
+    labels=('endpoint',),
+)
+STREAM_BYTES = Counter(
+    'elginvault_stream_bytes_total',
+    'Uncompressed bytes written to streaming responses, by endpoint.',
+    labels=('endpoint',),
+)
+STREAM_ABORTS = Counter(
+    'elginvault_stream_aborts_total',
+    'Streaming responses that ended before the body was complete (client '
+    'disconnect or error), by endpoint.',
+    labels=('endpoint',),
+)
+IMPORT_ROWS = Counter(
+    'elginvault_import_rows_total',
+    'Rows imported by background import tasks, by upload format.',
+    labels=('format',),
+)
+IMPORT_BYTES = Counter(
+    'elginvault_import_bytes_total',
+    'Upload bytes accepted for import (as received, possibly compressed), by upload format.',
+    labels=('format',),
+)
+IMPORT_DURATION = Histogram(
+    'elginvault_import_duration_seconds',
+    'Duration of background import tasks, by outcome.',
+    labels=('outcome',),
+)
+DELETION_ROWS = Counter(
+    'elginvault_deletion_rows_total',
+    'stock_data rows removed by the deletion worker, by method (batch, chunk).',
+    labels=('method',),
+)
+CACHE_REQUESTS = Counter(
+    'elginvault_cache_requests_total',
+    'In-process cache lookups, by cache and result (hit, miss).',
+    labels=('cache', 'result'),
+)
+CACHE_INVALIDATIONS = Counter(
+    'elginvault_cache_invalidations_total',
+    'Cache invalidations applied, by source (local, notify).',
+    labels=('source',),
+)
+LOG_RECORDS_DROPPED = Counter(
+    'elginvault_log_records_dropped_total',
+    'Log records dropped because the logging queue was full.',
+)
+BACKGROUND_TASKS = Gauge(
+    'elginvault_background_tasks',
+    'Background tasks known to the task status table, by status.',
+    labels=('status',),
+)
+ADMISSION_ACTIVE = Gauge(
+    'elginvault_admission_active',
+    'Requests holding an admission slot, by request class.',
+    labels=('request_class',),
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'elginvault_admission_queue_depth',
+    'Requests waiting for an admission slot, by request class.',
+    labels=('request_class',),
+)
+ADMISSION_WAIT = Histogram(
+    'elginvault_admission_wait_seconds',
+    'Time admitted requests waited for a slot, by request class.',
+    labels=('request_class',),
+)
+ADMISSION_REJECTED = Counter(
+    'elginvault_admission_rejected_total',
+    'Requests shed by admission control, by request class and reason '
+    '(queue_full, timeout).',
+    labels=('request_class', 'reason'),
+)
+COALESCED_REQUESTS = Counter(
+    'elginvault_coalesced_requests_total',
+    'Streams served by shared queries, by role (leader: started the query; '
+    'follower: joined one in progress).',
+    labels=('role',),
+)
+
+
+class MetricsMiddleware:
+    '''
+    ASGI middleware recording per-route latency. The clock stops when the
+    last body chunk is sent, so streamed responses are measured in full and
+    background tasks (run after the body, e.g. imports) are not. Routes are labelled by their template ('/stock_data/{ticker}') to keep
+    label cardinality bounded.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = '500'
+        observed = False
+
+        def observe():
+            nonlocal observed
+            observed = True
+            route = scope.get('route')
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=scope['method'],
+                route=getattr(route, 'path', 'unmatched'),
+                status=status,
+            )
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = str(message['status'])
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                # Background tasks run after this, inside the app call
+                observe()
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            if not observed:
+                # The response was never completed
+                observe()
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Optional
 
 class StockData(BaseModel):
     timestamp: datetime
@@ -15,3 +16,24 @@ class StockCatalog(BaseModel):
     start_time: datetime
     end_time: datetime
     inserted_at: datetime
+    # Maintained by imports (see app/catalog_stats.py); None for entries
+    # written before the statistics existed
+    row_count: Optional[int] = None
+    first_bar: Optional[datetime] = None
+    last_bar: Optional[datetime] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    total_volume: Optional[int] = None
+    size_bytes: Optional[int] = None
+
+class StockVaultDeletion(BaseModel):
+    id: int
+    ticker: str
+    status: str
+    rows_total: Optional[int] = None
+    rows_deleted: int
+    chunks_truncated: int
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
@@ -0,0 +1,226 @@
+'''
+Opt-in CPU and memory profiling of single requests and background imports.
+
+Profiling is off unless `[profiling] enabled = true`. A request opts in with
+an `X-Profile` header or a `profile` query parameter; when a token is
+configured the value must match it. The profiled work (stream generators,
+import tasks) is run under cProfile and tracemalloc, and the results are
+written to the profiles directory as `<label>.prof` (pstats, loadable with
+snakeviz or `python -m pstats`) plus a `<label>.txt` summary with the top
+functions, the tracemalloc peak and the top allocation sites.
+
+Only one profile runs at a time: cProfile and tracemalloc are process-wide,
+so concurrent sessions would pollute each other's numbers.
+'''
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import tracemalloc
+import uuid
+from typing import Iterator, Optional
+from urllib.parse import parse_qs
+
+from app.config import get_setting
+
+logger = logging.getLogger('elginvault.profiling')
+
+_profile_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    'profile_request_id', default=None
+)
+_active_lock = threading.Lock()
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+def profiling_enabled() -> bool:
+    return get_setting('profiling', 'enabled', False, bool)
+
+
+def get_profiles_dir() -> str:
+    return get_setting('profiling', 'profiles_dir', 'profiles')
+
+
+def is_profile_requested(value: Optional[str]) -> bool:
+    '''
+    Checks an X-Profile header / profile query value against the config.
+    '''
+    if not value or not profiling_enabled():
+        return False
+    token = get_setting('profiling', 'token', None)
+    if token:
+        return value == token
+    return value.lower() not in ('0', 'false', 'no', 'off')
+
+
+def requested_profile_id() -> Optional[str]:
+    '''
+    Returns the current request's profile id if the request asked to be profiled.
+    '''
+    return _profile_request_id.get()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class Profiler:
+    '''
+    cProfile + tracemalloc session. `resume()`/`pause()` bracket the code to
+    measure (the profiler is per-thread on older Pythons, so it is enabled in
+    whichever thread runs the work); `finish()` writes the results.
+    '''
+
+    def __init__(self, label: str):
+        self.label = label
+        self.profile = cProfile.Profile()
+        self._started_tracemalloc = False
+        self._finished = False
+        if not _active_lock.acquire(blocking=False):
+            raise ProfilerBusy('Another profile is in progress.')
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+
+    def resume(self):
+        self.profile.enable()
+
+    def pause(self):
+        self.profile.disable()
+
+    def __enter__(self):
+        self.resume()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pause()
+        self.finish()
+        return False
+
+    def finish(self) -> Optional[str]:
+        if self._finished:
+            return None
+        self._finished = True
+        try:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            return self._write(current, peak, snapshot)
+        except Exception as e:
+            logger.error(f'Failed to write profile {self.label}: {e}')
+            return None
+        finally:
+            _active_lock.release()
+
+    def _write(self, current: int, peak: int, snapshot) -> str:
+        directory = get_profiles_dir()
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.label)
+        self.profile.dump_stats(f'{base}.prof')
+
+        stats_text = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stats_text)
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        with open(f'{base}.txt', 'w') as f:
+            f.write(f'Profile: {self.label}\n')
+            f.write(f'tracemalloc peak: {peak / 1024 / 1024:.2f} MiB, ')
+            f.write(f'at finish: {current / 1024 / 1024:.2f} MiB\n\n')
+            f.write(f'Top {TOP_ALLOCATIONS} allocation sites still held at finish:\n')
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write(f'  {stat}\n')
+            f.write('\n')
+            f.write(stats_text.getvalue())
+        logger.info(f'Profile written to {base}.prof (peak {peak / 1024 / 1024:.2f} MiB)')
+        return base
+
+
+def start_profiler(label: str) -> Optional[Profiler]:
+    try:
+        return Profiler(label)
+    except ProfilerBusy:
+        logger.warning(f'Skipping profile {label}: another profile is in progress.')
+        return None
+
+
+def profile_iterator(iterator: Iterator, profiler: Profiler) -> Iterator:
+    '''
+    Wraps a (stream) generator so only the time spent producing items is
+    profiled, in whichever threadpool thread pulls the next item. The
+    profile is written when the generator is exhausted or closed.
+    '''
+    try:
+        while True:
+            profiler.resume()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                profiler.pause()
+            yield item
+    finally:
+        profiler.finish()
+
+
+def maybe_profile_stream(iterator: Iterator, name: str) -> Iterator:
+    '''
+    Profiles a stream generator if the current request asked for it.
+    '''
+    request_id = requested_profile_id()
+    if request_id is None:
+        return iterator
+    profiler = start_profiler(f'{name}_{request_id}')
+    return profile_iterator(iterator, profiler) if profiler else iterator
+
+
+class ProfilingMiddleware:
+    '''
+    Marks requests carrying a valid X-Profile header or profile query
+    parameter, and returns the profile id in an X-Profile-Id header.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers') or [])
+        value = headers.get(b'x-profile', b'').decode('latin-1')
+        if not value:
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            value = query.get('profile', [''])[0]
+        if not is_profile_requested(value):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = headers.get(b'x-request-id', b'').decode('latin-1')
+        request_id = ''.join(c for c in request_id if c.isalnum() or c in '-_')[:64]
+        request_id = request_id or uuid.uuid4().hex[:12]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                message = {
+                    **message,
+                    'headers': list(message.get('headers', []))
+                    + [(b'x-profile-id', request_id.encode('latin-1'))],
+                }
+            await send(message)
+
+        token = _profile_request_id.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _profile_request_id.reset(token)
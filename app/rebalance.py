@@ -0,0 +1,122 @@
+'''
+Moves tickers to the database node that owns them after nodes are added
+(see db/shards.py).
+
+1. In every API process, add the new node to `[shards] nodes` and set
+   `previous_nodes` to the old list. Reads of a ticker whose owner changed
+   fall back to its old node until it has been moved; imports already go to
+   the new owner. Run `python -m db.migrate` to create the new node's schema.
+2. Run `python -m app.rebalance` (`--dry-run` only lists the moves). Each
+   ticker is copied under a new version and its catalog entry is created on
+   the new owner; only then is it removed from the old node, whose deletion
+   worker deletes the rows. Re-running after a failure is safe.
+3. Clear `previous_nodes`.
+'''
+import argparse
+import logging
+
+from app.cache import vault_cache
+from app.catalog_stats import BarStatistics
+from app.repositories.stock_data_deletion_repository import insert_vault_data_deletion
+from app.repositories.stock_data_repository import (
+    get_vault_data_batches_by_ticker_and_time_range,
+    insert_vault_data_bulk,
+    next_vault_data_version,
+)
+from app.repositories.stock_vault_catalog_repository import (
+    delete_vault_catalog_by_ticker,
+    get_vault_catalog_by_ticker,
+    get_vault_catalog_list,
+    insert_vault_catalog,
+)
+from app.services.stock_vault_services import publish_vault_change
+from db.connection import db_connection, get_shard_map
+
+logger = logging.getLogger('elginvault.rebalance')
+
+
+def plan_moves() -> list[tuple[str, str, str]]:
+    '''
+    Returns (ticker, source node, target node) for every ticker that is not
+    on its owner node.
+    '''
+    shard_map = get_shard_map()
+    moves = []
+    for node in shard_map.all_nodes:
+        with db_connection(node=node) as conn:
+            records = get_vault_catalog_list(conn)
+        for record in records:
+            owner = shard_map.owner(record[0])
+            if owner != node:
+                moves.append((record[0], node, owner))
+    return moves
+
+
+def move_ticker(ticker: str, source: str, target: str) -> int:
+    '''
+    Copies the ticker's current version from `source` to `target` and then
+    removes it from `source`. Returns the number of rows copied (0 if the
+    target already had the ticker, e.g. from an import during the rebalance).
+    '''
+    copied = 0
+    with db_connection(node=source) as src, db_connection(node=target) as dst:
+        entry = get_vault_catalog_by_ticker(src, ticker)
+        if entry is None:
+            return 0
+        start_time, end_time = entry[1], entry[2]
+        if get_vault_catalog_by_ticker(dst, ticker) is None:
+            try:
+                version = next_vault_data_version(dst)
+                stats = BarStatistics(ticker)
+                for bars in get_vault_data_batches_by_ticker_and_time_range(
+                    src, ticker, '-infinity', 'infinity'
+                ):
+                    insert_vault_data_bulk(dst, bars, version)
+                    stats.add(bars)
+                copied = stats.row_count
+                dst.commit()
+                if insert_vault_catalog(
+                    dst, ticker, start_time, end_time, version, stats.values()
+                ):
+                    publish_vault_change(dst, 'import', ticker)
+                else:
+                    # An import created the ticker on the target meanwhile
+                    insert_vault_data_deletion(dst, ticker, version, version)
+                    copied = 0
+                dst.commit()
+            except Exception as e:
+                dst.rollback()
+                logger.error(f'Error copying {ticker} from {source} to {target}: {e}')
+                raise e
+        src.rollback()
+        try:
+            version = delete_vault_catalog_by_ticker(src, ticker)
+            if version is not None:
+                insert_vault_data_deletion(src, ticker, 0, version)
+            publish_vault_change(src, 'remove', ticker)
+            src.commit()
+        except Exception as e:
+            src.rollback()
+            logger.error(f'Error removing {ticker} from {source}: {e}')
+            raise e
+    vault_cache.invalidate(ticker)
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move tickers to their owner nodes.')
+    parser.add_argument('--dry-run', action='store_true', help='List the moves without making them.')
+    args = parser.parse_args()
+    moves = plan_moves()
+    for ticker, source, target in moves:
+        if args.dry_run:
+            print(f'{ticker}: {source} -> {target}')
+            continue
+        rows = move_ticker(ticker, source, target)
+        print(f'{ticker}: {source} -> {target} ({rows} rows)')
+    print(f'{len(moves)} ticker(s) {"to move" if args.dry_run else "moved"}.')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
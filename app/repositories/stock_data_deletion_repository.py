@@ -0,0 +1,193 @@
+from typing import Optional
+
+from psycopg2 import sql as pgsql
+
+from db.queries import (
+    SqlQuery,
+    load_sql_query,
+    execute_nonquery,
+    fetch_query_results,
+    fetch_query_single_result,
+)
+from app.tracing import traced
+from app.repositories.exceptions import RepositoryException
+
+
+def _load(filepath: str):
+    sql = load_sql_query(filepath)
+    if not sql:
+        raise RepositoryException('SQL query not found.')
+    return sql
+
+
+def _chunk_query(conn, filepath: str, chunk: tuple[str, str]) -> SqlQuery:
+    '''
+    Fills the {chunk} placeholder of a SQL file with a quoted chunk table
+    name, keeping the file's name for metrics.
+    '''
+    template = _load(filepath)
+    query = SqlQuery(
+        pgsql.SQL(template).format(chunk=pgsql.Identifier(*chunk)).as_string(conn)
+    )
+    query.name = template.name
+    return query
+
+
+def _version_params(ticker: str, min_version: int, max_version: int, **extra) -> dict:
+    return {'ticker': ticker, 'min_version': min_version, 'max_version': max_version, **extra}
+
+
+@traced('repository')
+def insert_vault_data_deletion(conn, ticker: str, min_version: int, max_version: int) -> int:
+    '''
+    Queues the deletion of the ticker's rows with a version in
+    [min_version, max_version] and returns the job id.
+    '''
+    sql = _load('db/queries/insert_stock_data_deletion.sql')
+    try:
+        return fetch_query_single_result(conn, sql, (ticker, min_version, max_version))[0]
+    except Exception as e:
+        raise RepositoryException(f'Error executing insert: {e}')
+
+
+@traced('repository')
+def claim_vault_data_deletion(conn, lease_seconds: float) -> Optional[tuple]:
+    '''
+    Claims the oldest runnable deletion job for lease_seconds. Returns
+    (id, ticker, min_version, max_version, rows_total, attempts) or None.
+    '''
+    sql = _load('db/queries/claim_stock_data_deletion.sql')
+    try:
+        return fetch_query_single_result(conn, sql, (lease_seconds,))
+    except Exception as e:
+        raise RepositoryException(f'Error executing query: {e}')
+
+
+@traced('repository')
+def update_vault_data_deletion_progress(
+    conn,
+    deletion_id: int,
+    lease_seconds: float,
+    rows_deleted: int = 0,
+    chunks_truncated: int = 0,
+    rows_total: Optional[int] = None,
+):
+    '''
+    Adds to the job's progress counters and renews its lease.
+    '''
+    sql = _load('db/queries/update_stock_data_deletion_progress.sql')
+    try:
+        execute_nonquery(
+            conn,
+            sql,
+            (rows_total, rows_deleted, chunks_truncated, lease_seconds, deletion_id),
+        )
+    except Exception as e:
+        raise RepositoryException(f'Error executing update: {e}')
+
+
+@traced('repository')
+def finish_vault_data_deletion(
+    conn, deletion_id: int, status: str, error: Optional[str] = None, retry_after: float = 0
+):
+    sql = _load('db/queries/finish_stock_data_deletion.sql')
+    try:
+        execute_nonquery(conn, sql, (status, error, retry_after, deletion_id))
+    except Exception as e:
+        raise RepositoryException(f'Error executing update: {e}')
+
+
+@traced('repository')
+def get_vault_data_deletion(conn, deletion_id: int):
+    sql = _load('db/queries/get_stock_data_deletion.sql')
+    try:
+        return fetch_query_single_result(conn, sql, (deletion_id,))
+    except Exception as e:
+        raise RepositoryException(f'Error executing query: {e}')
+
+
+@traced('repository')
+def count_vault_data_versions(conn, ticker: str, min_version: int, max_version: int) -> int:
+    sql = _load('db/queries/count_stock_data_by_ticker_and_versions.sql')
+    try:
+        return fetch_query_single_result(conn, sql, (ticker, min_version, max_version))[0]
+    except Exception as e:
+        raise RepositoryException(f'Error executing query: {e}')
+
+
+@traced('repository')
+def delete_vault_data_batch(
+    conn, ticker: str, min_version: int, max_version: int, batch_size: int
+) -> int:
+    '''
+    Deletes up to batch_size of the ticker's rows in the version range and
+    returns the number deleted.
+    '''
+    sql = _load('db/queries/delete_stock_data_batch.sql')
+    try:
+        return execute_nonquery(
+            conn, sql, _version_params(ticker, min_version, max_version, batch_size=batch_size)
+        )
+    except Exception as e:
+        raise RepositoryException(f'Error executing delete: {e}')
+
+
+@traced('repository')
+def get_vault_data_chunks(conn) -> list[tuple[str, str]]:
+    '''
+    Returns the (schema, table) of each stock_data chunk, or an empty list
+    when TimescaleDB is not installed.
+    '''
+    try:
+        if not fetch_query_single_result(conn, _load('db/queries/has_stock_data_chunks.sql'))[0]:
+            return []
+        return fetch_query_results(conn, _load('db/queries/get_stock_data_chunks.sql'), ('stock_data',))
+    except Exception as e:
+        raise RepositoryException(f'Error executing query: {e}')
+
+
+@traced('repository')
+def check_vault_data_chunk(
+    conn, chunk: tuple[str, str], ticker: str, min_version: int, max_version: int
+) -> tuple[bool, bool]:
+    '''
+    Returns whether the chunk holds rows to delete, and whether it holds
+    any other rows.
+    '''
+    sql = _chunk_query(conn, 'db/queries/check_stock_data_chunk.sql', chunk)
+    try:
+        return fetch_query_single_result(conn, sql, _version_params(ticker, min_version, max_version))
+    except Exception as e:
+        raise RepositoryException(f'Error executing query: {e}')
+
+
+@traced('repository')
+def truncate_vault_data_chunk(
+    conn,
+    chunk: tuple[str, str],
+    ticker: str,
+    min_version: int,
+    max_version: int,
+    lock_timeout_ms: int,
+) -> int:
+    '''
+    Truncates the chunk if, once locked, it holds only rows to delete.
+    Returns the number of rows removed (0 if the chunk was left alone).
+    Waits at most lock_timeout_ms for the lock, so it never queues readers
+    behind a long wait; the caller must commit.
+    '''
+    try:
+        execute_nonquery(
+            conn, _chunk_query(conn, 'db/queries/lock_stock_data_chunk.sql', chunk), (lock_timeout_ms,)
+        )
+        doomed, total = fetch_query_single_result(
+            conn,
+            _chunk_query(conn, 'db/queries/count_stock_data_chunk.sql', chunk),
+            _version_params(ticker, min_version, max_version),
+        )
+        if not total or doomed != total:
+            return 0
+        execute_nonquery(conn, _chunk_query(conn, 'db/queries/truncate_stock_data_chunk.sql', chunk))
+        return total
+    except Exception as e:
+        raise RepositoryException(f'Error truncating chunk: {e}')
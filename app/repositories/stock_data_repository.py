@@ -1,47 +1,39 @@
 from datetime import datetime
+from typing import Iterator, Optional
 
 from db.connection import get_db_connection
 from db.queries import (
     load_sql_query,
     execute_nonquery,
+    fetch_query_batches,
     fetch_query_results,
+    fetch_query_single_result,
 )
+from app.tracing import traced
 from app.repositories.exceptions import RepositoryException
-from app.models import StockData
+from app.bars import StockBars
 
+QUERY_BATCH_SIZE = 10_000
 
-def insert_vault_data_bulk(conn, records: list[StockData]):
+
+@traced('repository')
+def insert_vault_data_bulk(conn, bars: StockBars, version: int = 0):
     '''
-    Inserts stock data records into the database in bulk.
+    Inserts a batch of stock data bars into the database in bulk, tagged
+    with the import version.
     '''
     sql = load_sql_query('db/queries/insert_stock_data.sql')
     if not sql:
         raise RepositoryException('SQL query not found.')
-    if not records:
+    if not bars:
         raise RepositoryException('No records to insert.')
     try:
-        execute_nonquery(
-            conn,
-            sql,
-            [
-                (
-                    record.timestamp,
-                    record.ticker,
-                    record.open,
-                    record.high,
-                    record.low,
-                    record.close,
-                    record.volume,
-                )
-                for record in records
-            ],
-            bulk=True,
-        )
+        execute_nonquery(conn, sql, [row + (version,) for row in bars.to_rows()], bulk=True)
     except Exception as e:
-        print(e)
         raise RepositoryException(f'Error executing bulk insert: {e}')
 
 
+@traced('repository')
 def get_vault_data_by_ticker_and_time_range(
     conn, ticker: str, start_time: str, end_time: str
 ):
@@ -52,19 +44,115 @@ def get_vault_data_by_ticker_and_time_range(
     if not sql:
         raise RepositoryException('SQL query not found.')
     try:
-        results = fetch_query_results(conn, sql, (ticker, start_time, end_time))
+        results = fetch_query_results(
+            conn, sql, {'ticker': ticker, 'start_time': start_time, 'end_time': end_time}
+        )
         return results if results else []
     except Exception as e:
-        print(e)
         raise RepositoryException(f'Error executing query: {e}')
 
 
-def delete_vault_data_by_ticker(conn, ticker: str):
-    sql = load_sql_query('db/queries/delete_stock_data_by_ticker.sql')
+@traced('repository')
+def get_vault_data_batches_by_ticker_and_time_range(
+    conn, ticker: str, start_time: str, end_time: str, batch_size: int = QUERY_BATCH_SIZE
+) -> Iterator[StockBars]:
+    '''
+    Retrieves stock data for a ticker within a time range as StockBars
+    batches of at most batch_size rows, read through a server-side cursor.
+    '''
+    sql = load_sql_query('db/queries/get_stock_data_columns_by_ticker_and_time_range.sql')
+    if not sql:
+        raise RepositoryException('SQL query not found.')
+    params = {'ticker': ticker, 'start_time': start_time, 'end_time': end_time}
+    try:
+        for rows in fetch_query_batches(conn, sql, params, batch_size):
+            yield StockBars.from_db_rows(ticker, rows)
+    except Exception as e:
+        raise RepositoryException(f'Error executing query: {e}')
+
+
+@traced('repository')
+def get_vault_data_batches_with_lookback(
+    conn,
+    ticker: str,
+    start_time: str,
+    end_time: str,
+    lookback: int,
+    batch_size: int = QUERY_BATCH_SIZE,
+) -> Iterator[StockBars]:
+    '''
+    Like get_vault_data_batches_by_ticker_and_time_range, but the first
+    batch starts with up to `lookback` bars before start_time.
+    '''
+    if lookback <= 0:
+        yield from get_vault_data_batches_by_ticker_and_time_range(
+            conn, ticker, start_time, end_time, batch_size
+        )
+        return
+    sql = load_sql_query('db/queries/get_stock_data_columns_with_lookback.sql')
+    if not sql:
+        raise RepositoryException('SQL query not found.')
+    params = {
+        'ticker': ticker,
+        'start_time': start_time,
+        'end_time': end_time,
+        'lookback': lookback,
+    }
+    try:
+        for rows in fetch_query_batches(conn, sql, params, batch_size):
+            yield StockBars.from_db_rows(ticker, rows)
+    except Exception as e:
+        raise RepositoryException(f'Error executing query: {e}')
+
+
+@traced('repository')
+def get_vault_data_batches_by_tickers_and_time_range(
+    conn,
+    tickers: list[str],
+    start_time: str,
+    end_time: str,
+    batch_size: int = QUERY_BATCH_SIZE,
+) -> Iterator[StockBars]:
+    '''
+    Retrieves the bars of several tickers within a time range in one query,
+    as StockBars batches in no particular order.
+    '''
+    sql = load_sql_query('db/queries/get_stock_data_columns_by_tickers_and_time_range.sql')
+    if not sql:
+        raise RepositoryException('SQL query not found.')
+    params = {'tickers': tickers, 'start_time': start_time, 'end_time': end_time}
+    try:
+        for rows in fetch_query_batches(conn, sql, params, batch_size):
+            yield StockBars.from_ticker_rows(rows)
+    except Exception as e:
+        raise RepositoryException(f'Error executing query: {e}')
+
+
+@traced('repository')
+def get_latest_vault_bars(conn, tickers: Optional[list[str]] = None) -> StockBars:
+    '''
+    Returns the latest bar of each catalogued ticker, or of `tickers` only,
+    as one StockBars batch (one row per ticker, in no particular order).
+    '''
+    sql = load_sql_query('db/queries/get_latest_stock_bars.sql')
+    if not sql:
+        raise RepositoryException('SQL query not found.')
+    try:
+        rows = fetch_query_results(conn, sql, {'tickers': tickers})
+    except Exception as e:
+        raise RepositoryException(f'Error executing query: {e}')
+    return StockBars.from_ticker_rows(rows)
+
+
+@traced('repository')
+def next_vault_data_version(conn) -> int:
+    '''
+    Allocates a new stock_data version for an import.
+    '''
+    sql = load_sql_query('db/queries/next_stock_data_version.sql')
     if not sql:
         raise RepositoryException('SQL query not found.')
     try:
-        execute_nonquery(conn, sql, (ticker,))
+        return fetch_query_single_result(conn, sql)[0]
     except Exception as e:
-        print(e)
         raise RepositoryException(f'Error executing query: {e}')
@@ -5,33 +5,65 @@ from db.queries import (
     fetch_query_results,
     fetch_query_single_result,
 )
+from app.tracing import traced
+from app.catalog_stats import STATS_COLUMNS
 from app.repositories.exceptions import RepositoryException
 
 
-def insert_vault_catalog(conn, ticker, start_time, end_time):
+@traced('repository')
+def insert_vault_catalog(conn, ticker, start_time, end_time, version=0, stats=None) -> bool:
+    '''
+    Inserts a catalog entry. `stats` are the values of its statistics columns
+    (see app/catalog_stats.py), or None to leave them empty. Returns False if
+    the ticker already has one.
+    '''
     sql = load_sql_query('db/queries/insert_stock_vault_entry.sql')
     if not sql:
         raise RepositoryException('SQL query not found.')
     try:
-        execute_nonquery(conn, sql, (ticker, start_time, end_time))
+        params = (ticker, start_time, end_time, version) + (stats or (None,) * len(STATS_COLUMNS))
+        return execute_nonquery(conn, sql, params) > 0
     except Exception as e:
-        print(e)
         raise RepositoryException(f'Error executing insert: {e}')
 
 
+@traced('repository')
+def swap_vault_catalog(
+    conn, ticker, start_time, end_time, version, expected_version, stats=None
+) -> bool:
+    '''
+    Points the ticker's catalog entry at a new stock_data version, with that
+    version's statistics, provided it is still at expected_version. Returns
+    False if it was not.
+    '''
+    sql = load_sql_query('db/queries/swap_stock_vault_entry.sql')
+    if not sql:
+        raise RepositoryException('SQL query not found.')
+    try:
+        return execute_nonquery(
+            conn,
+            sql,
+            (start_time, end_time, version)
+            + (stats or (None,) * len(STATS_COLUMNS))
+            + (ticker, expected_version),
+        ) > 0
+    except Exception as e:
+        raise RepositoryException(f'Error executing update: {e}')
+
+
+@traced('repository')
 def get_vault_catalog_by_ticker(conn, ticker):
     sql = load_sql_query('db/queries/get_stock_vault_entry_by_ticker.sql')
     if not sql:
         raise RepositoryException('SQL query not found.')
     try:
-        print(sql, ticker)
         result = fetch_query_single_result(conn, sql, (ticker,))
         return result if result else None
     except Exception as e:
-        print(e)
         raise RepositoryException(f'Error executing query: {e}')
 
 
+@traced('repository')
 def get_vault_catalog_list(conn):
     sql = load_sql_query('db/queries/get_all_stock_vault_catalog.sql')
     if not sql:
@@ -40,16 +72,34 @@ def get_vault_catalog_list(conn):
         results = fetch_query_results(conn, sql)
         return results if results else []
     except Exception as e:
-        print(e)
-        raise RepositoryException('Error executing query: {e}')
+        raise RepositoryException(f'Error executing query: {e}')
 
 
+@traced('repository')
 def delete_vault_catalog_by_ticker(conn, ticker):
+    '''
+    Deletes the catalog entry and returns the stock_data version it named,
+    or None if there was no entry.
+    '''
     sql = load_sql_query('db/queries/delete_stock_vault_entry_by_ticker.sql')
     if not sql:
         raise RepositoryException('SQL query not found.')
     try:
-        execute_nonquery(conn, sql, (ticker,))
+        result = fetch_query_single_result(conn, sql, (ticker,))
+        return result[0] if result else None
     except Exception as e:
-        print(e)
         raise RepositoryException(f'Error executing query: {e}')
+
+
+@traced('repository')
+def notify_vault_change(conn, channel, payload):
+    '''
+    Queues a NOTIFY on the channel; it is delivered when the transaction commits.
+    '''
+    sql = load_sql_query('db/queries/notify_stock_vault_change.sql')
+    if not sql:
+        raise RepositoryException('SQL query not found.')
+    try:
+        fetch_query_single_result(conn, sql, (channel, payload))
+    except Exception as e:
+        raise RepositoryException(f'Error executing notify: {e}')
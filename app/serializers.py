@@ -0,0 +1,111 @@
+'''
+Response serializers for StockBars batches.
+
+They format whole columns at once and produce the same JSON as
+`StockData.model_dump_json()` (non-finite prices become null) without
+building a model per row.
+'''
+import json
+import math
+from typing import Iterator
+
+import numpy as np
+
+from app.bars import PRICE_COLUMNS, StockBars
+
+
+def _format_timestamps(timestamps: np.ndarray) -> list[str]:
+    # Pydantic omits the fraction for whole seconds and prints microseconds otherwise
+    text = np.datetime_as_string(timestamps, unit='us')
+    whole = timestamps.view(np.int64) % 1_000_000 == 0
+    if whole.any():
+        text[whole] = np.datetime_as_string(timestamps[whole], unit='s')
+    return text.tolist()
+
+
+def _format_floats(values: np.ndarray) -> list[str]:
+    return [repr(value) if math.isfinite(value) else 'null' for value in values.tolist()]
+
+
+def bars_to_json_records(bars: StockBars) -> list[str]:
+    '''
+    Returns one JSON object per bar, formatted like StockData.model_dump_json().
+    '''
+    if not len(bars):
+        return []
+    timestamps = _format_timestamps(bars.timestamp)
+    # Batches usually hold a single ticker: encode each distinct value once
+    tickers = {
+        ticker: json.dumps(ticker, ensure_ascii=False) for ticker in set(bars.ticker.tolist())
+    }
+    prices = [_format_floats(getattr(bars, name)) for name in PRICE_COLUMNS]
+    return [
+        f'{{"timestamp":"{timestamp}","ticker":{tickers[ticker]},'
+        f'"open":{open_},"high":{high},"low":{low},"close":{close},"volume":{volume}}}'
+        for timestamp, ticker, open_, high, low, close, volume in zip(
+            timestamps, bars.ticker.tolist(), *prices, bars.volume.tolist()
+        )
+    ]
+
+
+def indicators_to_json_records(timestamps: np.ndarray, columns: dict[str, np.ndarray]) -> list[str]:
+    '''
+    Returns one JSON object per timestamp holding the indicator columns
+    (NaN becomes null). Column names are plain identifiers such as `sma_20`.
+    '''
+    if not len(timestamps):
+        return []
+    names = list(columns)
+    values = [_format_floats(columns[name]) for name in names]
+    return [
+        '{"timestamp":"' + timestamp + '",'
+        + ','.join(f'"{name}":{value}' for name, value in zip(names, row)) + '}'
+        for timestamp, *row in zip(_format_timestamps(timestamps), *values)
+    ]
+
+
+def _format_ints(values: np.ndarray, missing: str = 'null') -> list[str]:
+    return [str(int(value)) if math.isfinite(value) else missing for value in values.tolist()]
+
+
+def _format_matrix_column(name: str, values: np.ndarray, missing: str = 'null') -> list[str]:
+    if name.startswith('volume.'):
+        return _format_ints(values, missing)
+    return [repr(value) if math.isfinite(value) else missing for value in values.tolist()]
+
+
+def matrix_to_json(matrix) -> Iterator[str]:
+    '''
+    Yields a PriceMatrix as column-oriented JSON:
+    {"index": [...], "columns": {"close.AAPL": [...], ...}, "count": n}.
+    '''
+    yield '{"index":[' + ','.join(f'"{t}"' for t in _format_timestamps(matrix.index)) + ']'
+    yield ',"columns":{'
+    for i, (name, values) in enumerate(matrix.columns.items()):
+        yield (',' if i else '') + json.dumps(name, ensure_ascii=False) + ':['
+        yield ','.join(_format_matrix_column(name, values)) + ']'
+    yield f'}},"count":{len(matrix)},"status":"success"}}'
+
+
+def _csv_field(value: str) -> str:
+    # RFC 4180: quote fields holding a separator, quote or line break, and
+    # double the quotes inside them
+    if any(c in value for c in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def matrix_to_csv(matrix, chunk_rows: int = 10_000) -> Iterator[str]:
+    '''
+    Yields a PriceMatrix as CSV with a `timestamp` column; missing values
+    are empty.
+    '''
+    header = ['timestamp'] + [_csv_field(name) for name in matrix.columns]
+    yield ','.join(header) + '\n'
+    for start in range(0, len(matrix), chunk_rows):
+        end = start + chunk_rows
+        columns = [_format_timestamps(matrix.index[start:end])] + [
+            _format_matrix_column(name, values[start:end], '')
+            for name, values in matrix.columns.items()
+        ]
+        yield ''.join(','.join(row) + '\n' for row in zip(*columns))
@@ -1,7 +1,16 @@
-import pandas as pd
-from app.models import StockData
+from io import BytesIO
+from typing import TYPE_CHECKING, Iterator
+from app.bars import BAR_COLUMNS, StockBars
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+STOCK_DATA_COLUMNS = list(BAR_COLUMNS)
+COLUMNAR_BATCH_SIZE = 50_000
 
 def read_and_validate_csv(csv_file: str):
+    import pandas as pd
+
     df = pd.read_csv(csv_file)
     if df.empty:
         raise ValueError(f'CSV file is empty: {csv_file}')
@@ -9,9 +18,41 @@ def read_and_validate_csv(csv_file: str):
         raise ValueError('CSV file must contain "timestamp" and "ticker" columns.')
     return df
     
-def prepare_records(df: pd.DataFrame) -> list[StockData]:
-    records = []
-    for index, record in enumerate(df.to_dict(orient='records')):
-        stock_data = StockData(**record)
-        records.append(stock_data)
-    return records
\ No newline at end of file
+def prepare_bars(df: 'pd.DataFrame') -> StockBars:
+    '''
+    Validates a parsed CSV and converts it to a StockBars batch column by
+    column. Raises ValueError for missing columns or invalid values.
+    '''
+    return StockBars.from_frame(df)
+
+def iter_columnar_batches(
+    content: bytes, upload_format: str, batch_size: int = COLUMNAR_BATCH_SIZE
+) -> Iterator:
+    '''
+    Yields pyarrow RecordBatches from a Parquet or Arrow IPC payload, reading
+    at most batch_size rows at a time.
+    '''
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    source = BytesIO(content)
+    if upload_format == 'parquet':
+        parquet_file = pyarrow.parquet.ParquetFile(source)
+        yield from parquet_file.iter_batches(
+            batch_size=batch_size, columns=STOCK_DATA_COLUMNS
+        )
+    elif upload_format == 'arrow':
+        reader = pyarrow.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+    elif upload_format == 'arrow_stream':
+        yield from pyarrow.ipc.open_stream(source)
+    else:
+        raise ValueError(f'Unsupported columnar format: {upload_format}')
+
+def prepare_columns(batch) -> StockBars:
+    '''
+    Converts a pyarrow RecordBatch into a StockBars batch. Values are cast
+    inside Arrow, so no text parsing is involved.
+    '''
+    return StockBars.from_arrow(batch)
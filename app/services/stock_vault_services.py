@@ -1,105 +1,436 @@
+import contextvars
+import heapq
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, Optional
 
-from app.models import StockData, StockCatalog
+from app.cache import CHANNEL, MISSING, change_payload, vault_cache
+from app.bars import StockBars
+from app.catalog_stats import STATS_COLUMNS, BarStatistics
+from app.tracing import traced
+from app.deletion import wake_deletion_worker
+from app.indicators import Indicator, IndicatorCalculator
+from app.matrix import PriceMatrix, align_bars
+from app.models import StockCatalog, StockVaultDeletion
+from app.repositories.stock_data_deletion_repository import (
+    get_vault_data_deletion,
+    insert_vault_data_deletion,
+)
 from app.repositories.stock_data_repository import (
-    delete_vault_data_by_ticker,
     insert_vault_data_bulk,
-    get_vault_data_by_ticker_and_time_range,
+    get_vault_data_batches_by_ticker_and_time_range,
+    get_vault_data_batches_by_tickers_and_time_range,
+    get_vault_data_batches_with_lookback,
+    next_vault_data_version,
 )
 from app.repositories.stock_vault_catalog_repository import (
     delete_vault_catalog_by_ticker,
     insert_vault_catalog,
     get_vault_catalog_list,
     get_vault_catalog_by_ticker,
+    notify_vault_change,
+    swap_vault_catalog,
+)
+from db.connection import (
+    QueryCancellation,
+    db_connection,
+    get_shard_map,
+    mark_ticker_written,
 )
-from db.connection import get_db_connection
 
 
+def publish_vault_change(conn, action: str, ticker: str, start_time=None, end_time=None):
+    '''
+    Publishes a change event for other API processes' caches. It is sent
+    with the transaction's commit and discarded if it rolls back.
+    '''
+    notify_vault_change(conn, CHANNEL, change_payload(action, ticker, start_time, end_time))
+
+
+def ticker_node(ticker: str) -> str:
+    '''
+    Returns the database node holding the ticker (see db/shards.py): its
+    owner, or during a rebalance its previous owner until the ticker has
+    been copied to the new one.
+    '''
+    shard_map = get_shard_map()
+    owner = shard_map.owner(ticker)
+    previous = shard_map.previous_owner(ticker)
+    if previous is None:
+        return owner
+    with db_connection(node=owner) as conn:
+        moved = get_vault_catalog_by_ticker(conn, ticker) is not None
+    return owner if moved else previous
+
+
+@traced('service')
 def import_stock_vault(
-    ticker: str, start_time: str, end_time: str, records: list[StockData]
-):
-    with get_db_connection() as conn:
+    ticker: str, start_time: str, end_time: str, bars: StockBars
+) -> int:
+    if not len(bars):
+        raise ValueError('File contains no rows.')
+    return import_stock_vault_columns(ticker, start_time, end_time, [bars])
+
+
+@traced('service')
+def import_stock_vault_columns(
+    ticker: str, start_time: str, end_time: str, batches: Iterable[StockBars]
+) -> int:
+    '''
+    Imports StockBars batches (see prepare_columns) and returns the number of
+    rows written. Reimporting a ticker replaces its data without a gap:
+
+    1. The rows are loaded under a new version. Readers only see the
+       version named by the catalog entry, so they keep reading the old data.
+    2. One short transaction points the catalog entry at the new version,
+       provided no other import or delete changed it in the meantime.
+    3. The old version's rows are queued for the deletion worker
+       (app/deletion.py), so their cost is not part of the import.
+
+    The import goes to the ticker's owner node, so imports of tickers owned
+    by different nodes load in parallel.
+    '''
+    with db_connection(node=get_shard_map().owner(ticker)) as conn:
         try:
-            insert_vault_data_bulk(conn, records)
-            insert_vault_catalog(
-                conn,
-                ticker=ticker,
-                start_time=start_time,
-                end_time=end_time,
-            )
+            previous = get_vault_catalog_by_ticker(conn, ticker)
+            previous_version = previous[4] if previous else None
+            version = next_vault_data_version(conn)
+            stats = BarStatistics(ticker)
+            for bars in batches:
+                if not len(bars):
+                    continue
+                insert_vault_data_bulk(conn, bars, version)
+                stats.add(bars)
+            if not stats.row_count:
+                raise ValueError('File contains no rows.')
             conn.commit()
         except Exception as e:
             conn.rollback()
-            logging.error(f'Error adding stock vault: {e}')
+            logging.error(f'Error loading stock vault: {e}')
             raise e
 
-
-def remove_stock_vault(ticker: str):
-    with get_db_connection() as conn:
         try:
-            if not ticker:
-                raise ValueError('ticker symbol is required.')
-            delete_vault_data_by_ticker(conn, ticker)
-            delete_vault_catalog_by_ticker(conn, ticker)
+            if previous_version is None:
+                swapped = insert_vault_catalog(
+                    conn, ticker, start_time, end_time, version, stats.values()
+                )
+            else:
+                swapped = swap_vault_catalog(
+                    conn, ticker, start_time, end_time, version, previous_version, stats.values()
+                )
+            if not swapped:
+                raise ValueError(
+                    f'Stock vault for {ticker} was changed by another request during the import.'
+                )
+            if previous_version is not None:
+                # Versions only grow, so this also covers rows left behind
+                # by earlier imports
+                insert_vault_data_deletion(conn, ticker, 0, previous_version)
+            # A reimport can change any part of the ticker's history
+            changed = (
+                (stats.first_bar, stats.last_bar) if previous_version is None else (None, None)
+            )
+            publish_vault_change(conn, 'import', ticker, *changed)
             conn.commit()
-            return {
-                'ticker': ticker,
-                'message': f'Stock vault for {ticker} deleted successfully.',
-            }
+            mark_ticker_written(ticker)
+            vault_cache.invalidate(ticker, *changed)
         except Exception as e:
             conn.rollback()
-            logging.error(f'Error deleting stock data: {e}')
+            logging.error(f'Error adding stock vault: {e}')
+            discard_vault_data_version(conn, ticker, version)
             raise e
+    wake_deletion_worker()
+    return stats.row_count
+
+
+def discard_vault_data_version(conn, ticker: str, version: int):
+    '''
+    Queues the deletion of an abandoned import's rows. No reader can see
+    them, so failures only leave unreachable rows behind and are logged
+    rather than raised.
+    '''
+    try:
+        insert_vault_data_deletion(conn, ticker, version, version)
+        conn.commit()
+        wake_deletion_worker()
+    except Exception as e:
+        conn.rollback()
+        logging.error(f'Error queueing deletion of version {version} of stock vault {ticker}: {e}')
+
+
+@traced('service')
+def remove_stock_vault(ticker: str):
+    if not ticker:
+        raise ValueError('ticker symbol is required.')
+    shard_map = get_shard_map()
+    result = {
+        'ticker': ticker,
+        'message': f'Stock vault for {ticker} deleted successfully.',
+        'deletion_id': None,
+        'node': shard_map.owner(ticker),
+    }
+    # During a rebalance the ticker may still be on its previous owner too
+    nodes = [shard_map.owner(ticker)]
+    if shard_map.previous_owner(ticker):
+        nodes.append(shard_map.previous_owner(ticker))
+    for node in nodes:
+        with db_connection(node=node) as conn:
+            try:
+                # Deleting the catalog entry hides the data at once; the rows
+                # are deleted in the background (app/deletion.py)
+                version = delete_vault_catalog_by_ticker(conn, ticker)
+                if version is not None and result['deletion_id'] is None:
+                    result['deletion_id'] = insert_vault_data_deletion(conn, ticker, 0, version)
+                    result['node'] = node
+                elif version is not None:
+                    insert_vault_data_deletion(conn, ticker, 0, version)
+                publish_vault_change(conn, 'remove', ticker)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logging.error(f'Error deleting stock data: {e}')
+                raise e
+    mark_ticker_written(ticker)
+    vault_cache.invalidate(ticker)
+    wake_deletion_worker()
+    return result
+
+
+def catalog_from_record(record: tuple) -> StockCatalog:
+    '''
+    Builds a StockCatalog from a catalog row: ticker, start_time, end_time,
+    inserted_at, version and then the statistics columns.
+    '''
+    return StockCatalog(
+        ticker=record[0],
+        start_time=record[1],
+        end_time=record[2],
+        inserted_at=record[3],
+        **dict(zip(STATS_COLUMNS, record[5:])),
+    )
 
 
-def fetch_stock_vault_catalog_list():
-    with get_db_connection() as conn:
+def _catalog_records(statement_timeout, cancellation):
+    '''
+    Yields the catalog rows of every node, newest first. With several nodes
+    they are queried in parallel (scatter-gather) and merged.
+    '''
+    shard_map = get_shard_map()
+    if not shard_map.sharded:
+        with db_connection(statement_timeout, cancellation, read_only=True) as conn:
+            yield from get_vault_catalog_list(conn)
+        return
+
+    def fetch(node):
+        with db_connection(statement_timeout, cancellation, read_only=True, node=node) as conn:
+            return node, get_vault_catalog_list(conn)
+
+    nodes = shard_map.all_nodes
+    with ThreadPoolExecutor(max_workers=len(nodes), thread_name_prefix='catalog-gather') as executor:
+        futures = [executor.submit(contextvars.copy_context().run, fetch, node) for node in nodes]
+        results = [future.result() for future in futures]
+    # A ticker being moved by a rebalance is listed by its old and new owner
+    # until the old copy is removed; the owner's entry wins
+    owned = {
+        record[0] for node, records in results for record in records
+        if node == shard_map.owner(record[0])
+    }
+    yield from heapq.merge(
+        *[
+            [r for r in records if node == shard_map.owner(r[0]) or r[0] not in owned]
+            for node, records in results
+        ],
+        key=lambda record: record[3],
+        reverse=True,
+    )
+
+
+@traced('service')
+def fetch_stock_vault_catalog_list(
+    statement_timeout: Optional[int] = None,
+    cancellation: Optional[QueryCancellation] = None,
+):
+    cached = vault_cache.get('catalog_list', 'all')
+    if cached is not None:
+        yield from cached
+        return
+    generation = vault_cache.generation
+    catalogs = []
+    try:
+        for record in _catalog_records(statement_timeout, cancellation):
+            catalog = catalog_from_record(record)
+            catalogs.append(catalog)
+            yield catalog
+    except Exception as e:
+        logging.error(f'Error retrieving stock vault catalog list: {e}')
+        raise e
+    vault_cache.set('catalog_list', 'all', catalogs, generation=generation)
+
+
+@traced('service')
+def query_stock_vault_catalog_ticker(ticker: str, statement_timeout: Optional[int] = None):
+    cached = vault_cache.get('catalog', ticker, MISSING)
+    if cached is not MISSING:
+        return cached
+    generation = vault_cache.generation
+    node = ticker_node(ticker)
+    with db_connection(statement_timeout, read_only=True, ticker=ticker, node=node) as conn:
         try:
-            for record in get_vault_catalog_list(conn):
-                yield StockCatalog(**{
-                    'ticker': record[0],
-                    'start_time': record[1],
-                    'end_time': record[2],
-                    'inserted_at': record[3],
-                })
+            record = get_vault_catalog_by_ticker(conn, ticker)
+            catalog = catalog_from_record(record) if record else None
+            vault_cache.set('catalog', ticker, catalog, ticker=ticker, generation=generation)
+            return catalog
         except Exception as e:
-            logging.error(f'Error retrieving stock vault catalog list: {e}')
+            logging.error(f'Error retrieveing stock vault catalog: {e}')
             raise e
 
 
-def query_stock_vault_catalog_ticker(ticker: str):
-    with get_db_connection() as conn:
+@traced('service')
+def query_stock_vault_data(
+    ticker: str,
+    start_time: str,
+    end_time: str,
+    statement_timeout: Optional[int] = None,
+    cancellation: Optional[QueryCancellation] = None,
+):
+    '''
+    Yields the ticker's bars in the time range as StockBars batches.
+    '''
+    node = ticker_node(ticker)
+    with db_connection(
+        statement_timeout, cancellation, read_only=True, ticker=ticker, node=node
+    ) as conn:
         try:
-            record = get_vault_catalog_by_ticker(conn, ticker)
-            return StockCatalog(**{
-                    'ticker': record[0],
-                    'start_time': record[1],
-                    'end_time': record[2],
-                    'inserted_at': record[3],
-                }) if record else None
+            yield from get_vault_data_batches_by_ticker_and_time_range(
+                conn,
+                ticker=ticker,
+                start_time=start_time,
+                end_time=end_time,
+            )
         except Exception as e:
-            logging.error(f'Error retrieveing stock vault catalog: {e}')
+            if cancellation is not None and cancellation.cancelled:
+                logging.info(f'Stock data query for {ticker} cancelled: client disconnected.')
+            else:
+                logging.error(f'Error retrieving stock data: {e}')
             raise e
 
 
-def query_stock_vault_data(ticker: str, start_time: str, end_time: str):
-    with get_db_connection() as conn:
+@traced('service')
+def query_stock_vault_indicators(
+    ticker: str,
+    start_time: datetime,
+    end_time: datetime,
+    indicators: list[Indicator],
+    statement_timeout: Optional[int] = None,
+    cancellation: Optional[QueryCancellation] = None,
+):
+    '''
+    Yields (timestamps, {column: values}) batches of the indicators over the
+    time range. The range query also reads the history the indicators need
+    before start_time.
+    '''
+    calculator = IndicatorCalculator(indicators, start_time)
+    node = ticker_node(ticker)
+    with db_connection(
+        statement_timeout, cancellation, read_only=True, ticker=ticker, node=node
+    ) as conn:
         try:
-            for record in get_vault_data_by_ticker_and_time_range(
+            for bars in get_vault_data_batches_with_lookback(
                 conn,
                 ticker=ticker,
                 start_time=start_time,
                 end_time=end_time,
+                lookback=calculator.lookback,
+            ):
+                timestamps, columns = calculator.update(bars)
+                if len(timestamps):
+                    yield timestamps, columns
+        except Exception as e:
+            if cancellation is not None and cancellation.cancelled:
+                logging.info(f'Indicator query for {ticker} cancelled: client disconnected.')
+            else:
+                logging.error(f'Error computing indicators: {e}')
+            raise e
+
+
+@traced('service')
+def query_stock_vault_matrix(
+    tickers: list[str],
+    start_time: str,
+    end_time: str,
+    fields: list[str],
+    fill: str = 'null',
+    max_rows: Optional[int] = None,
+    statement_timeout: Optional[int] = None,
+) -> PriceMatrix:
+    '''
+    Reads the tickers' bars in the time range with one query per node that
+    owns some of them (in parallel when there are several) and aligns them
+    on their common timestamps (see app/matrix.py). Raises ValueError when a
+    node has more than `max_rows` bars to return.
+    '''
+    by_node = {}
+    for ticker in tickers:
+        by_node.setdefault(ticker_node(ticker), []).append(ticker)
+
+    def fetch(node, node_tickers):
+        batches, rows = [], 0
+        with db_connection(statement_timeout, read_only=True, node=node) as conn:
+            for bars in get_vault_data_batches_by_tickers_and_time_range(
+                conn, node_tickers, start_time, end_time
             ):
-                yield StockData(**{
-                    'timestamp': record[0],
-                    'ticker': record[1],
-                    'open': record[2],
-                    'high': record[3],
-                    'low': record[4],
-                    'close': record[5],
-                    'volume': record[6],
-                })
+                rows += len(bars)
+                if max_rows is not None and rows > max_rows:
+                    raise ValueError(
+                        f'More than {max_rows} bars requested; narrow the range or the tickers.'
+                    )
+                batches.append(bars)
+        return batches
+
+    try:
+        if len(by_node) == 1:
+            [(node, node_tickers)] = by_node.items()
+            batches = fetch(node, node_tickers)
+        else:
+            with ThreadPoolExecutor(
+                max_workers=len(by_node), thread_name_prefix='matrix-gather'
+            ) as executor:
+                futures = [
+                    executor.submit(contextvars.copy_context().run, fetch, node, node_tickers)
+                    for node, node_tickers in by_node.items()
+                ]
+                batches = [bars for future in futures for bars in future.result()]
+        return align_bars(batches, tickers, fields, fill)
+    except ValueError:
+        raise
+    except Exception as e:
+        logging.error(f'Error retrieving stock data matrix: {e}')
+        raise e
+
+
+@traced('service')
+def query_stock_vault_deletion(
+    deletion_id: int, node: Optional[str] = None
+) -> Optional[StockVaultDeletion]:
+    '''
+    Deletion ids are per node: `node` is the one remove_stock_vault returned.
+    '''
+    with db_connection(node=node) as conn:
+        try:
+            record = get_vault_data_deletion(conn, deletion_id)
+            return StockVaultDeletion(**{
+                'id': record[0],
+                'ticker': record[1],
+                'status': record[2],
+                'rows_total': record[3],
+                'rows_deleted': record[4],
+                'chunks_truncated': record[5],
+                'attempts': record[6],
+                'error': record[7],
+                'created_at': record[8],
+                'updated_at': record[9],
+            }) if record else None
         except Exception as e:
-            logging.error(f'Error retrieving stock data: {e}')
+            logging.error(f'Error retrieving stock vault deletion: {e}')
             raise e
@@ -0,0 +1,205 @@
+'''
+In-memory table of the latest bar of every ticker, for snapshot reads.
+
+The table is built with one query per database node
+(get_latest_stock_bars.sql) and kept current through the cache's
+invalidations: an import or delete in any process (announced over
+LISTEN/NOTIFY, see app/cache.py) marks its ticker stale and wakes the
+`SnapshotRefresher` thread, which re-reads just the stale tickers, in one
+query. Snapshots do not wait for it: they serve the table as it is, and a
+failed refresh leaves it in place until the retry. Only when there is no
+table to serve, before the first load or after the cache was cleared, does a
+snapshot load it itself. Entries hold the bar already serialized to JSON, so
+a snapshot costs a dict lookup per ticker.
+
+The table depends on the invalidations as much as the cache does: while
+`vault_cache` is not active (disabled, or a listener is reconnecting),
+snapshots are read from the database.
+'''
+import logging
+import threading
+from typing import Iterable, Optional
+
+from app.cache import vault_cache
+from app.config import get_setting
+from app.repositories.stock_data_repository import get_latest_vault_bars
+from app.serializers import bars_to_json_records
+from db.connection import db_connection, get_shard_map
+
+logger = logging.getLogger('elginvault.snapshot')
+
+
+def read_latest_records(tickers: Optional[list[str]] = None) -> dict[str, str]:
+    '''
+    Returns {ticker: bar JSON} for every catalogued ticker (or `tickers`),
+    from all nodes. While a rebalance copies a ticker, the owner's bar wins.
+    '''
+    shard_map = get_shard_map()
+    records, owned = {}, set()
+    for node in shard_map.all_nodes:
+        with db_connection(read_only=True, node=node) as conn:
+            bars = get_latest_vault_bars(conn, tickers)
+        for ticker, record in zip(bars.ticker.tolist(), bars_to_json_records(bars)):
+            if ticker in owned:
+                continue
+            records[ticker] = record
+            if node == shard_map.owner(ticker):
+                owned.add(ticker)
+    return records
+
+
+class LatestBars:
+    '''
+    Latest bar per ticker, refreshed lazily for the tickers marked stale.
+    '''
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._records: dict[str, str] = {}
+        self._stale: set[str] = set()
+        # Set until the first load, and whenever the cache is cleared
+        self._reload = True
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # Set by mark_stale() to wake the refresher
+        self.changed = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and vault_cache.active
+
+    @property
+    def pending(self) -> bool:
+        return self._reload or bool(self._stale)
+
+    def mark_stale(self, ticker: Optional[str]):
+        '''
+        Marks a ticker stale, or the whole table when `ticker` is None.
+        '''
+        with self._lock:
+            if ticker is None:
+                self._reload = True
+            else:
+                self._stale.add(ticker)
+        self.changed.set()
+
+    def refresh(self):
+        '''
+        Reloads the table if it was cleared, or re-reads the stale tickers.
+        A change that commits while this runs marks its ticker stale again,
+        so it is picked up by the next refresh.
+        '''
+        with self._refresh_lock:
+            with self._lock:
+                reload, stale = self._reload, self._stale
+                self._reload, self._stale = False, set()
+            if not reload and not stale:
+                return
+            try:
+                records = read_latest_records(None if reload else sorted(stale))
+            except Exception:
+                with self._lock:
+                    self._reload = self._reload or reload
+                    self._stale |= stale
+                raise
+            if not reload:
+                # Readers may be iterating the current dict: replace it
+                records = {
+                    **{t: r for t, r in self._records.items() if t not in stale},
+                    **records,
+                }
+            else:
+                logger.info(f'Loaded the latest bar of {len(records)} tickers.')
+            self._records = records
+
+    def snapshot(self, tickers: Optional[Iterable[str]] = None) -> tuple[list[str], list[str]]:
+        '''
+        Returns the bar JSON of each ticker that has one, in the given order
+        (all tickers, sorted, when `tickers` is None), and the tickers that
+        have none.
+        '''
+        tickers = list(dict.fromkeys(tickers)) if tickers is not None else None
+        if not self.active:
+            records = read_latest_records(tickers)
+        else:
+            if self._reload:
+                # No table to serve yet; stale tickers are left to the refresher
+                self.refresh()
+            records = self._records
+        if tickers is None:
+            return [records[ticker] for ticker in sorted(records)], []
+        found, missing = [], []
+        for ticker in tickers:
+            record = records.get(ticker)
+            if record is None:
+                missing.append(ticker)
+            else:
+                found.append(record)
+        return found, missing
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+latest_bars = LatestBars(enabled=get_setting('snapshot', 'enabled', True, bool))
+vault_cache.add_invalidation_callback(latest_bars.mark_stale)
+
+
+class SnapshotRefresher(threading.Thread):
+    '''
+    Daemon thread that refreshes the table as soon as tickers are marked
+    stale, so snapshots never wait for the database. A failed refresh is
+    logged and retried after `retry_interval` seconds.
+    '''
+
+    def __init__(self, table: LatestBars, retry_interval: float = 5.0):
+        super().__init__(name='snapshot-refresher', daemon=True)
+        self.table = table
+        self.retry_interval = retry_interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.table.changed.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.table.changed.clear()
+            # While the table is not active, snapshots read the database and
+            # the listener clears the table when it reconnects
+            if self.table.active and self.table.pending:
+                try:
+                    self.table.refresh()
+                except Exception as e:
+                    logger.error(f'Could not refresh the latest bars: {e}')
+                    self._stop_event.wait(self.retry_interval)
+                    continue
+            self.table.changed.wait(self.retry_interval)
+
+
+_refresher: Optional[SnapshotRefresher] = None
+
+
+def start_snapshot_refresher() -> Optional[SnapshotRefresher]:
+    '''
+    Starts the thread that builds the table and keeps it current. Startup
+    does not wait for the load: the invalidation listeners clear the table
+    when they connect, which wakes the refresher to build it.
+    '''
+    global _refresher
+    if not latest_bars.enabled:
+        return None
+    if _refresher is None or not _refresher.is_alive():
+        _refresher = SnapshotRefresher(
+            latest_bars, get_setting('snapshot', 'retry_interval', 5.0, float)
+        )
+        _refresher.start()
+    return _refresher
+
+
+def stop_snapshot_refresher():
+    global _refresher
+    if _refresher is not None:
+        _refresher.stop()
+        _refresher.join(timeout=10)
+        _refresher = None
@@ -0,0 +1,60 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
+
+from app.cache import start_invalidation_listener, stop_invalidation_listener
+from app.config import get_setting
+from app.deletion import start_deletion_worker, stop_deletion_worker
+from app.models import StockCatalog, StockData
+from app.snapshot import start_snapshot_refresher, stop_snapshot_refresher
+from db.connection import close_db_pool, db_connection
+from db.queries import preload_sql_queries
+
+
+def warm_up():
+    '''
+    Pays the first-request costs before the app starts serving: opens the
+    connection pool, reads the SQL files into the cache and builds the
+    pydantic serializers. A database that is not reachable yet is logged and
+    left to the first request, so the app still starts.
+    '''
+    start = time.perf_counter()
+    try:
+        count = preload_sql_queries()
+        logging.info(f'Warm-up: loaded {count} SQL files.')
+    except Exception as e:
+        logging.error(f'Warm-up: failed to load SQL files: {e}')
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            conn.rollback()
+    except Exception as e:
+        logging.error(f'Warm-up: database not reachable: {e}')
+    now = datetime.now()
+    StockData(
+        timestamp=now, ticker='WARMUP', open=0, high=0, low=0, close=0, volume=0
+    ).model_dump_json()
+    StockCatalog(
+        ticker='WARMUP', start_time=now, end_time=now, inserted_at=now
+    ).model_dump_json()
+    logging.info(f'Warm-up finished in {(time.perf_counter() - start) * 1000:.1f} ms.')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if get_setting('startup', 'warm_up', True, bool):
+        await run_in_threadpool(warm_up)
+    start_invalidation_listener()
+    start_deletion_worker()
+    start_snapshot_refresher()
+    yield
+    stop_snapshot_refresher()
+    stop_deletion_worker()
+    stop_invalidation_listener()
+    close_db_pool()
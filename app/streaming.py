@@ -0,0 +1,72 @@
+'''
+Streaming responses backed by a database query.
+
+Starlette stops pulling from a StreamingResponse body when the client
+disconnects, but it never closes a synchronous body generator: the query
+keeps running and the pooled connection stays checked out until the
+generator is garbage collected. `QueryStreamingResponse` cancels the
+statement and closes the generator as soon as the stream ends early.
+'''
+import logging
+from typing import Iterator
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+
+from app.metrics import STREAM_ABORTS
+from db.connection import QueryCancellation
+
+
+class QueryStreamingResponse(StreamingResponse):
+    '''
+    StreamingResponse whose `content` reads from connections attached to
+    `cancellation`. If the body is not sent to completion (client
+    disconnect, or an error), the running statement is cancelled and
+    `content` is closed, returning its connection to the pool.
+    '''
+
+    def __init__(
+        self,
+        content: Iterator,
+        cancellation: QueryCancellation,
+        endpoint: str,
+        **kwargs,
+    ):
+        super().__init__(content, **kwargs)
+        self.content = content
+        self.cancellation = cancellation
+        self.endpoint = endpoint
+        self.completed = False
+
+    async def stream_response(self, send):
+        await super().stream_response(send)
+        self.completed = True
+
+    async def listen_for_disconnect(self, receive):
+        await super().listen_for_disconnect(receive)
+        if not self.completed:
+            # Starlette waits for the threadpool call in progress before it
+            # gives up on the stream, so stop the query it may be blocked on now
+            self.cancellation.cancel()
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if not self.completed:
+                # Shielded: this also runs while the request is being cancelled
+                with anyio.CancelScope(shield=True):
+                    await self.abort()
+
+    async def abort(self):
+        STREAM_ABORTS.inc(endpoint=self.endpoint)
+        self.cancellation.cancel()
+        try:
+            await run_in_threadpool(self.content.close)
+        except ValueError:
+            # The generator is still running in a threadpool thread; the
+            # cancelled statement makes it fail and finish there.
+            pass
+        except Exception as e:
+            logging.warning(f'Error closing {self.endpoint} stream: {e}')
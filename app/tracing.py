@@ -0,0 +1,443 @@
+'''
+Lightweight request tracing.
+
+`TracingMiddleware` opens a root span per HTTP request (continuing a W3C
+`traceparent` header if the client sent one). Layers below open child spans
+with `span()` or the `@traced(layer)` decorator: route -> service ->
+repository -> db statement, plus the serialization of streamed bodies. The
+current span lives in a context variable, so it follows the request into
+threadpool workers; background tasks carry it explicitly via
+`current_trace_parent()` / `start_trace(parent=...)`.
+
+Finished spans are summarised in a `Server-Timing` response header (for
+spans that end before the response starts, i.e. synchronous responses) and
+handed to an exporter thread that appends them to a JSONL file or POSTs them
+to an OTLP/HTTP collector, depending on `[tracing] exporter`.
+
+Outside a trace (scripts, tests calling services directly) `span()` is a
+no-op.
+'''
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from app.config import get_setting
+
+logger = logging.getLogger('elginvault.tracing')
+
+EXPORT_BATCH_SIZE = 512
+
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar(
+    'current_span', default=None
+)
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+_SERVER_TIMING_TOKEN = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def tracing_enabled() -> bool:
+    return get_setting('tracing', 'enabled', True, bool)
+
+
+def _new_id(length: int) -> str:
+    return os.urandom(length // 2).hex()
+
+
+class Trace:
+    '''
+    Spans of one request or background task that share a trace id.
+    '''
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or _new_id(32)
+        self.spans: list['Span'] = []
+
+
+class Span:
+    def __init__(self, name: str, trace: Trace, parent_id: Optional[str] = None, **attributes):
+        self.name = name
+        self.trace = trace
+        self.span_id = _new_id(16)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = 'ok'
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def child(self, name: str, **attributes) -> 'Span':
+        return Span(name, self.trace, self.span_id, **attributes)
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.status = 'error'
+            self.attributes.setdefault('error', f'{type(error).__name__}: {error}')
+        self.trace.spans.append(self)
+        get_exporter().export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'duration_ms': round((self.duration or 0) * 1000, 3),
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    '''
+    Times the enclosed block as a child of the current span. Yields the span
+    (or None outside a trace) so callers can add attributes.
+    '''
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, **attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(e)
+        raise
+    else:
+        child.end()
+    finally:
+        _current_span.reset(token)
+
+
+def traced_iterator(iterator: Iterator, name: str, **attributes) -> Iterator:
+    '''
+    Wraps a generator in a span covering its whole iteration. Each step runs
+    with the span as the current one, so spans opened inside (e.g. the DB
+    query on the first step) nest under it even when streaming moves from
+    one threadpool thread to the next. The parent is taken from whoever
+    pulls the first item.
+    '''
+    current = None
+    try:
+        while True:
+            if current is None:
+                parent = _current_span.get()
+                if parent is None:
+                    yield from iterator
+                    return
+                current = parent.child(name, **attributes)
+            token = _current_span.set(current)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current_span.reset(token)
+            yield item
+    except BaseException as e:
+        if current is not None and not isinstance(e, GeneratorExit):
+            current.end(e)
+        raise
+    finally:
+        if current is not None:
+            current.end()
+
+
+def traced(layer: str, name: Optional[str] = None):
+    '''
+    Decorator opening a `<layer>.<function name>` span around each call.
+    Generator functions get a span over their whole iteration.
+    '''
+
+    def decorator(func):
+        span_name = name or f'{layer}.{func.__name__}'
+        if inspect.isgeneratorfunction(func):
+
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                return traced_iterator(func(*args, **kwargs), span_name)
+
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def parse_traceparent(value: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+    match = _TRACEPARENT.match((value or '').strip().lower())
+    if not match or match.group(1) == '0' * 32:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def format_traceparent(trace_id: str, span_id: str) -> str:
+    return f'00-{trace_id}-{span_id}-01'
+
+
+def current_trace_parent() -> Optional[str]:
+    '''
+    The current span as a traceparent string, for handing a trace to a
+    background task.
+    '''
+    current = _current_span.get()
+    return format_traceparent(current.trace_id, current.span_id) if current else None
+
+
+@contextmanager
+def start_trace(name: str, parent: Optional[str] = None, **attributes):
+    '''
+    Opens a root span, continuing the trace in `parent` (a traceparent
+    string) if given.
+    '''
+    if not tracing_enabled():
+        yield None
+        return
+    trace_id, parent_id = parse_traceparent(parent)
+    root = Span(name, Trace(trace_id), parent_id, **attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.end(e)
+        raise
+    else:
+        root.end()
+    finally:
+        _current_span.reset(token)
+
+
+def server_timing(spans: list[Span]) -> str:
+    '''
+    Formats finished spans as a Server-Timing header value, summing spans
+    that share a name (e.g. several statements from the same SQL file).
+    '''
+    totals: dict[str, list] = {}
+    for finished in spans:
+        entry = totals.setdefault(finished.name, [0.0, 0])
+        entry[0] += finished.duration or 0
+        entry[1] += 1
+    metrics = []
+    for span_name, (seconds, count) in totals.items():
+        metric = f'{_SERVER_TIMING_TOKEN.sub("_", span_name)};dur={seconds * 1000:.3f}'
+        if count > 1:
+            metric += f';desc="x{count}"'
+        metrics.append(metric)
+    return ', '.join(metrics)
+
+
+class _NullExporter:
+    def export(self, finished: Span):
+        pass
+
+
+class SpanExporter:
+    '''
+    Exports finished spans from a daemon thread so requests never wait on
+    file or network I/O. Spans are dropped (and logged) if the queue backs up.
+    '''
+
+    def __init__(self, kind: str, path: str, endpoint: str, service_name: str):
+        self.kind = kind
+        self.path = path
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._queue: queue.Queue = queue.Queue(maxsize=EXPORT_BATCH_SIZE * 20)
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+        self._thread.start()
+
+    def export(self, finished: Span):
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self._dropped += 1
+
+    def flush(self):
+        '''
+        Blocks until every span queued so far has been written.
+        '''
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f'Failed to export {len(batch)} spans: {e}')
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if self._dropped:
+                logger.warning(f'Dropped {self._dropped} spans: export queue full.')
+                self._dropped = 0
+
+    def _write(self, batch: list[Span]):
+        if self.kind == 'file':
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a') as f:
+                for finished in batch:
+                    f.write(json.dumps(finished.to_dict(), default=str) + '\n')
+        elif self.kind == 'otlp':
+            body = json.dumps(to_otlp(batch, self.service_name), default=str).encode()
+            request = urllib.request.Request(
+                self.endpoint, data=body, headers={'Content-Type': 'application/json'}
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(batch: list[Span], service_name: str) -> dict:
+    '''
+    Encodes spans as an OTLP/HTTP JSON ExportTraceServiceRequest.
+    '''
+    spans = []
+    for finished in batch:
+        entry = {
+            'traceId': finished.trace_id,
+            'spanId': finished.span_id,
+            'name': finished.name,
+            # SPAN_KIND_SERVER for request roots, SPAN_KIND_INTERNAL otherwise
+            'kind': 2 if finished.name.startswith('HTTP ') else 1,
+            'startTimeUnixNano': str(finished.start_ns),
+            'endTimeUnixNano': str(finished.start_ns + int((finished.duration or 0) * 1e9)),
+            'attributes': [
+                {'key': key, 'value': _otlp_value(value)}
+                for key, value in finished.attributes.items()
+            ],
+            'status': {'code': 2 if finished.status == 'error' else 1},
+        }
+        if finished.parent_id:
+            entry['parentSpanId'] = finished.parent_id
+        spans.append(entry)
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': service_name}}
+            ]},
+            'scopeSpans': [{'scope': {'name': 'elginvault'}, 'spans': spans}],
+        }]
+    }
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                kind = get_setting('tracing', 'exporter', 'none').lower()
+                if kind in ('file', 'otlp'):
+                    _exporter = SpanExporter(
+                        kind,
+                        path=get_setting('tracing', 'file', 'logs/traces.jsonl'),
+                        endpoint=get_setting(
+                            'tracing', 'otlp_endpoint', 'http://localhost:4318/v1/traces'
+                        ),
+                        service_name=get_setting('tracing', 'service_name', 'elginvault'),
+                    )
+                else:
+                    _exporter = _NullExporter()
+    return _exporter
+
+
+class TracingMiddleware:
+    '''
+    ASGI middleware opening the root span of each request. The span ends
+    when the last body chunk is sent; spans finished before the response
+    starts are reported in a Server-Timing header, and the trace id is
+    returned as a traceparent header.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not tracing_enabled():
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers') or [])
+        trace_id, parent_id = parse_traceparent(headers.get(b'traceparent', b'').decode('latin-1'))
+        root = Span(
+            f'HTTP {scope["method"]}', Trace(trace_id), parent_id, method=scope['method']
+        )
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                route = scope.get('route')
+                root.name = f'HTTP {scope["method"]} {getattr(route, "path", "unmatched")}'
+                root.set_attribute('status', message['status'])
+                extra = [
+                    (b'traceparent', format_traceparent(root.trace_id, root.span_id).encode()),
+                ]
+                timing = server_timing(root.trace.spans)
+                if timing:
+                    extra.append((b'server-timing', timing.encode('latin-1')))
+                message = {**message, 'headers': list(message.get('headers', [])) + extra}
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                await send(message)
+                root.end()
+                return
+            await send(message)
+
+        token = _current_span.set(root)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            root.end(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            root.end()
@@ -0,0 +1,58 @@
+import importlib.util
+from functools import lru_cache
+from typing import Optional
+
+from app.compression import is_supported_csv_upload
+
+
+PARQUET_MAGIC = b'PAR1'
+ARROW_FILE_MAGIC = b'ARROW1'
+ARROW_STREAM_CONTINUATION = b'\xff\xff\xff\xff'
+
+COLUMNAR_UPLOAD_SUFFIXES = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.arrows': 'arrow_stream',
+}
+
+
+@lru_cache(maxsize=None)
+def columnar_support_available() -> bool:
+    '''
+    Parquet / Arrow uploads need the optional pyarrow package. It is only
+    looked up here and imported on the upload path, keeping startup fast.
+    '''
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def get_columnar_format(filename: str) -> Optional[str]:
+    name = filename.lower()
+    for suffix, upload_format in COLUMNAR_UPLOAD_SUFFIXES.items():
+        if name.endswith(suffix):
+            return upload_format
+    return None
+
+
+def is_supported_upload(filename: str) -> bool:
+    '''
+    Checks whether an uploaded file is a (compressed) CSV, Parquet or Arrow IPC file.
+    '''
+    return is_supported_csv_upload(filename) or get_columnar_format(filename) is not None
+
+
+def detect_upload_format(filename: str, content: bytes) -> str:
+    '''
+    Returns 'csv', 'parquet', 'arrow' (IPC file) or 'arrow_stream' (IPC stream).
+    '''
+    if content.startswith(PARQUET_MAGIC):
+        return 'parquet'
+    if content.startswith(ARROW_FILE_MAGIC):
+        return 'arrow'
+    columnar_format = get_columnar_format(filename)
+    if columnar_format:
+        return columnar_format
+    if content.startswith(ARROW_STREAM_CONTINUATION):
+        return 'arrow_stream'
+    return 'csv'
@@ -0,0 +1,320 @@
+'''
+Ingest and query benchmarks against a local TimescaleDB.
+
+Creates a scratch database (dropped afterwards unless --keep-db), loads
+synthetic OHLCV bars through each layer and records:
+
+- ingest rows/sec and peak Python memory for `prepare_bars` and
+  `insert_vault_data_bulk`
+- latency percentiles, rows/sec and peak memory for
+  `get_vault_data_by_ticker_and_time_range` and `query_stock_vault_data`
+
+Connection settings come from config.ini / DB_* environment variables, as for
+the API. Results are written as JSON so runs can be compared across commits:
+
+    python -m benchmarks.bench_ingest_query --tickers 1 10 --years 1 5
+    python -m benchmarks.bench_ingest_query --baseline benchmarks/results/<old>.json
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from benchmarks.synthetic import INTERVALS, generate_bars
+from db.connection import get_db_params, get_db_connection, close_db_connection
+from db.migrate import apply_migrations
+
+BENCH_DB_NAME = 'elginvault_bench'
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+QUERY_WINDOWS = {
+    '1w': pd.Timedelta(days=7),
+    '1m': pd.Timedelta(days=30),
+    '1y': pd.Timedelta(days=365),
+    'all': None,
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return 'unknown'
+
+
+def create_bench_database(db_name: str):
+    params = get_db_params()
+    params['dbname'] = 'postgres'
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS {db_name}')
+            cursor.execute(f'CREATE DATABASE {db_name}')
+    finally:
+        conn.close()
+
+    os.environ['DB_DBNAME'] = db_name
+    apply_migrations()
+
+
+def drop_bench_database(db_name: str):
+    params = get_db_params()
+    params['dbname'] = 'postgres'
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS {db_name}')
+    finally:
+        conn.close()
+
+
+def truncate_tables():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('TRUNCATE stock_data, stock_vault_catalog')
+        conn.commit()
+    finally:
+        close_db_connection(conn)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def peak_memory(fn, *args, **kwargs) -> int:
+    '''
+    Runs fn under tracemalloc and returns the peak traced Python memory in bytes.
+
+    Kept separate from the timed run because tracing slows allocation-heavy
+    code down considerably.
+    '''
+    tracemalloc.start()
+    try:
+        fn(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def latency_summary(samples: list[float]) -> dict:
+    values = np.array(samples) * 1000
+    return {
+        'count': len(samples),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+
+def bench_ingest(frames: list[pd.DataFrame], scenario: dict) -> list[dict]:
+    from app.bars import StockBars
+    from app.repositories.stock_data_repository import insert_vault_data_bulk
+    from app.repositories.stock_vault_catalog_repository import insert_vault_catalog
+    from app.services.stock_data_service import prepare_bars
+
+    rows = sum(len(df) for df in frames)
+    # CSV uploads reach prepare_bars with string timestamps
+    csv_frames = [df.assign(timestamp=df['timestamp'].astype(str)) for df in frames]
+
+    records_per_ticker, prepare_seconds = timed(
+        lambda: [prepare_bars(df) for df in csv_frames]
+    )
+    prepare_peak = peak_memory(lambda: [prepare_bars(df) for df in csv_frames[:1]])
+
+    def insert_all(records_list: list[StockBars]):
+        conn = get_db_connection()
+        try:
+            for records in records_list:
+                insert_vault_data_bulk(conn, records)
+                # Readers only see rows of the version named in the catalog
+                first, last = records.time_range()
+                insert_vault_catalog(conn, records.ticker[0], first, last)
+            conn.commit()
+        finally:
+            close_db_connection(conn)
+
+    _, insert_seconds = timed(insert_all, records_per_ticker)
+    truncate_tables()
+    insert_peak = peak_memory(insert_all, records_per_ticker[:1])
+    truncate_tables()
+    insert_all(records_per_ticker)
+
+    return [
+        {
+            'layer': 'service.prepare_bars',
+            'scenario': scenario,
+            'rows': rows,
+            'seconds': prepare_seconds,
+            'rows_per_sec': rows / prepare_seconds if prepare_seconds else None,
+            'peak_memory_bytes': prepare_peak,
+            'peak_memory_scope': 'first ticker',
+        },
+        {
+            'layer': 'repository.insert_vault_data_bulk',
+            'scenario': scenario,
+            'rows': rows,
+            'seconds': insert_seconds,
+            'rows_per_sec': rows / insert_seconds if insert_seconds else None,
+            'peak_memory_bytes': insert_peak,
+            'peak_memory_scope': 'first ticker',
+        },
+    ]
+
+
+def random_ranges(frames: list[pd.DataFrame], window: str, count: int, rng: random.Random):
+    first = frames[0]['timestamp'].iloc[0]
+    last = frames[0]['timestamp'].iloc[-1]
+    span = QUERY_WINDOWS[window]
+    tickers = [df['ticker'].iloc[0] for df in frames]
+    for _ in range(count):
+        ticker = rng.choice(tickers)
+        if span is None or span >= last - first:
+            yield ticker, str(first), str(last)
+            continue
+        offset = rng.random() * ((last - first) - span)
+        start = first + offset
+        yield ticker, str(start), str(start + span)
+
+
+def bench_queries(frames: list[pd.DataFrame], scenario: dict, queries: int, seed: int) -> list[dict]:
+    from app.repositories.stock_data_repository import get_vault_data_by_ticker_and_time_range
+    from app.services.stock_vault_services import query_stock_vault_data
+
+    def repository_query(ticker, start_time, end_time):
+        conn = get_db_connection()
+        try:
+            return len(get_vault_data_by_ticker_and_time_range(conn, ticker, start_time, end_time))
+        finally:
+            close_db_connection(conn)
+
+    def service_query(ticker, start_time, end_time):
+        return sum(len(bars) for bars in query_stock_vault_data(ticker, start_time, end_time))
+
+    results = []
+    for layer, fn in (
+        ('repository.get_vault_data_by_ticker_and_time_range', repository_query),
+        ('service.query_stock_vault_data', service_query),
+    ):
+        for window in QUERY_WINDOWS:
+            rng = random.Random(seed)
+            ranges = list(random_ranges(frames, window, queries, rng))
+            samples, total_rows = [], 0
+            for ticker, start_time, end_time in ranges:
+                row_count, seconds = timed(fn, ticker, start_time, end_time)
+                samples.append(seconds)
+                total_rows += row_count
+            peak = peak_memory(fn, *ranges[0])
+            total_seconds = sum(samples)
+            results.append({
+                'layer': layer,
+                'scenario': {**scenario, 'window': window},
+                'rows': total_rows,
+                'seconds': total_seconds,
+                'rows_per_sec': total_rows / total_seconds if total_seconds else None,
+                'latency': latency_summary(samples),
+                'peak_memory_bytes': peak,
+                'peak_memory_scope': 'single query',
+            })
+    return results
+
+
+def compare_with_baseline(results: list[dict], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def key(result):
+        return (result['layer'], json.dumps(result['scenario'], sort_keys=True))
+
+    previous = {key(r): r for r in baseline['results']}
+    print(f'\nComparison with {baseline_path} ({baseline["meta"]["git_commit"]}):')
+    for result in results:
+        old = previous.get(key(result))
+        if not old or not old.get('rows_per_sec') or not result.get('rows_per_sec'):
+            continue
+        ratio = result['rows_per_sec'] / old['rows_per_sec']
+        print(f'  {result["layer"]:<55} {json.dumps(result["scenario"])}: {ratio:6.2f}x rows/sec')
+
+
+def print_result(result: dict):
+    line = f'{result["layer"]:<55} {json.dumps(result["scenario"])}'
+    if result.get('rows_per_sec'):
+        line += f' {result["rows_per_sec"]:>12,.0f} rows/s'
+    if 'latency' in result:
+        latency = result['latency']
+        line += f' p50={latency["p50_ms"]:.1f}ms p99={latency["p99_ms"]:.1f}ms'
+    line += f' peak={result["peak_memory_bytes"] / 1024 / 1024:.1f}MiB'
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ingest and query paths.')
+    parser.add_argument('--tickers', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5])
+    parser.add_argument('--interval', default='1d', choices=list(INTERVALS))
+    parser.add_argument('--queries', type=int, default=30, help='Queries per window size')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db-name', default=BENCH_DB_NAME)
+    parser.add_argument('--keep-db', action='store_true')
+    parser.add_argument('--output', help='Result JSON path (default: benchmarks/results/)')
+    parser.add_argument('--baseline', help='Previous result JSON to compare against')
+    args = parser.parse_args()
+
+    create_bench_database(args.db_name)
+    results = []
+    try:
+        for tickers in args.tickers:
+            for years in args.years:
+                scenario = {'tickers': tickers, 'years': years, 'interval': args.interval}
+                frames = list(generate_bars(tickers, years, args.interval, seed=args.seed))
+                scenario_results = bench_ingest(frames, scenario)
+                scenario_results += bench_queries(frames, scenario, args.queries, args.seed)
+                for result in scenario_results:
+                    print_result(result)
+                results += scenario_results
+                truncate_tables()
+    finally:
+        if not args.keep_db:
+            drop_bench_database(args.db_name)
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'git_commit': commit,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f'ingest_query_{datetime.now():%Y%m%d_%H%M%S}_{commit}.json'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+'''
+End-to-end HTTP load driver for a running ElginVault API.
+
+Replays a weighted mix of requests with closed-loop workers and steps the
+concurrency up until the API saturates:
+
+- import:      POST /stock_vault/import with a gzipped synthetic CSV
+- stock_data:  GET /stock_data/{ticker} over ranges of varying size
+- catalog:     GET /stock_vault/catalog_all and /stock_vault/catalog/{ticker}
+- task_status: GET /task_status/{task_id} for previously started imports
+
+For every concurrency step it reports throughput, latency histograms and
+percentiles, and error rates per request kind. The saturation point is the
+first step where throughput stops growing (less than --min-gain) while p99
+latency keeps rising, or where the error rate crosses --max-error-rate.
+
+    python -m benchmarks.load_driver --base-url http://localhost:8001 \
+        --mix stock_data=6,catalog=2,task_status=1,import=1 \
+        --concurrency 1 2 4 8 16 32 64 --duration 30
+'''
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import time
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+from benchmarks.synthetic import generate_bars
+
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+RANGE_WINDOWS_DAYS = [7, 30, 365, 5 * 365]
+DEFAULT_MIX = 'stock_data=6,catalog=2,task_status=1,import=1'
+LOAD_START = '2015-01-01'
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in REQUEST_KINDS:
+            raise ValueError(f'Unknown request kind: {name}. Choose from {list(REQUEST_KINDS)}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class LoadState:
+    '''
+    Shared state between workers: known tickers, started import tasks and
+    the pre-encoded CSV payloads used for imports.
+    '''
+
+    def __init__(self, tickers: list[str], years: float, rng: random.Random):
+        self.tickers = tickers
+        self.years = years
+        self.rng = rng
+        self.task_ids: list[str] = []
+        self.payloads: dict[str, bytes] = {}
+        frames = generate_bars(len(tickers), years, '1d', start=LOAD_START)
+        for ticker, df in zip(tickers, frames):
+            csv_content = df.assign(ticker=ticker).to_csv(index=False).encode('utf-8')
+            self.payloads[ticker] = gzip.compress(csv_content)
+
+
+async def request_import(client: httpx.AsyncClient, state: LoadState):
+    ticker = state.rng.choice(state.tickers)
+    response = await client.post(
+        '/stock_vault/import',
+        data={'ticker': ticker, 'start_time': LOAD_START, 'end_time': '2100-01-01'},
+        files={'csv_file': (f'{ticker}.csv.gz', state.payloads[ticker], 'application/gzip')},
+    )
+    if response.status_code == 200:
+        state.task_ids.append(response.json()['task_id'])
+        # Only the most recent tasks are polled; keep the list bounded
+        del state.task_ids[:-1000]
+    return response
+
+
+async def request_stock_data(client: httpx.AsyncClient, state: LoadState):
+    ticker = state.rng.choice(state.tickers)
+    window = state.rng.choice(RANGE_WINDOWS_DAYS)
+    start = np.datetime64(LOAD_START) + np.timedelta64(
+        state.rng.randint(0, max(int(state.years * 365) - window, 0)), 'D'
+    )
+    end = start + np.timedelta64(window, 'D')
+    return await client.get(
+        f'/stock_data/{ticker}',
+        params={'start_time': str(start), 'end_time': str(end)},
+    )
+
+
+async def request_catalog(client: httpx.AsyncClient, state: LoadState):
+    if state.rng.random() < 0.5:
+        return await client.get('/stock_vault/catalog_all')
+    return await client.get(f'/stock_vault/catalog/{state.rng.choice(state.tickers)}')
+
+
+async def request_task_status(client: httpx.AsyncClient, state: LoadState):
+    if not state.task_ids:
+        return None
+    return await client.get(f'/task_status/{state.rng.choice(state.task_ids)}')
+
+
+REQUEST_KINDS = {
+    'import': request_import,
+    'stock_data': request_stock_data,
+    'catalog': request_catalog,
+    'task_status': request_task_status,
+}
+
+
+class StepStats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {kind: [] for kind in REQUEST_KINDS}
+        self.errors: dict[str, int] = {kind: 0 for kind in REQUEST_KINDS}
+        self.status_codes: dict[str, int] = {}
+        self.bytes_received = 0
+
+    def record(self, kind: str, seconds: float, status_code, size: int):
+        self.latencies[kind].append(seconds)
+        self.bytes_received += size
+        key = str(status_code) if status_code is not None else 'transport_error'
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+        if status_code is None or status_code >= 400:
+            self.errors[kind] += 1
+
+    def summary(self, concurrency: int, elapsed: float) -> dict:
+        all_latencies = [s for samples in self.latencies.values() for s in samples]
+        total = len(all_latencies)
+        errors = sum(self.errors.values())
+        return {
+            'concurrency': concurrency,
+            'elapsed_seconds': elapsed,
+            'requests': total,
+            'throughput_rps': total / elapsed if elapsed else 0.0,
+            'mb_per_sec': self.bytes_received / elapsed / 1e6 if elapsed else 0.0,
+            'error_rate': errors / total if total else 0.0,
+            'status_codes': self.status_codes,
+            'latency': latency_summary(all_latencies),
+            'histogram_ms': histogram(all_latencies),
+            'by_kind': {
+                kind: {
+                    'requests': len(samples),
+                    'errors': self.errors[kind],
+                    'latency': latency_summary(samples),
+                }
+                for kind, samples in self.latencies.items()
+                if samples
+            },
+        }
+
+
+def latency_summary(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    values = np.array(samples) * 1000
+    return {
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+
+def histogram(samples: list[float]) -> dict[str, int]:
+    values = np.array(samples) * 1000
+    edges = HISTOGRAM_BUCKETS_MS + [float('inf')]
+    counts = np.histogram(values, bins=[0] + edges)[0] if len(values) else [0] * len(edges)
+    return {f'le_{edge}': int(count) for edge, count in zip(edges, counts)}
+
+
+async def worker(client, state: LoadState, weights: dict[str, float], stats: StepStats, deadline: float):
+    kinds = list(weights)
+    kind_weights = [weights[kind] for kind in kinds]
+    while time.perf_counter() < deadline:
+        kind = state.rng.choices(kinds, kind_weights)[0]
+        start = time.perf_counter()
+        status_code, size = None, 0
+        try:
+            response = await REQUEST_KINDS[kind](client, state)
+            if response is None:
+                await asyncio.sleep(0.01)
+                continue
+            status_code, size = response.status_code, len(response.content)
+        except httpx.HTTPError:
+            pass
+        stats.record(kind, time.perf_counter() - start, status_code, size)
+
+
+async def run_step(base_url: str, state: LoadState, weights, concurrency: int, duration: float, timeout: float):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        stats = StepStats()
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(worker(client, state, weights, stats, deadline) for _ in range(concurrency)))
+        return stats.summary(concurrency, time.perf_counter() - start)
+
+
+async def seed_tickers(base_url: str, state: LoadState, timeout: float):
+    '''
+    Imports every load ticker once and waits for the imports to finish, so
+    read requests hit real data.
+    '''
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        task_ids = []
+        for ticker, payload in state.payloads.items():
+            response = await client.post(
+                '/stock_vault/import',
+                data={'ticker': ticker, 'start_time': LOAD_START, 'end_time': '2100-01-01'},
+                files={'csv_file': (f'{ticker}.csv.gz', payload, 'application/gzip')},
+            )
+            response.raise_for_status()
+            task_ids.append(response.json()['task_id'])
+        pending = set(task_ids)
+        while pending:
+            await asyncio.sleep(0.5)
+            for task_id in list(pending):
+                status = (await client.get(f'/task_status/{task_id}')).json()['status']
+                if status == 'Completed':
+                    pending.discard(task_id)
+                elif 'Failed' in status:
+                    raise RuntimeError(f'Seed import {task_id} failed: {status}')
+        state.task_ids.extend(task_ids)
+
+
+def find_saturation(steps: list[dict], min_gain: float, max_error_rate: float):
+    for previous, current in zip(steps, steps[1:]):
+        if current['error_rate'] > max_error_rate:
+            return {'concurrency': current['concurrency'], 'reason': 'error rate'}
+        gain = current['throughput_rps'] / previous['throughput_rps'] - 1 if previous['throughput_rps'] else 0
+        p99_growth = (
+            current['latency'].get('p99_ms', 0) / previous['latency']['p99_ms']
+            if previous['latency'].get('p99_ms') else 1
+        )
+        if gain < min_gain and p99_growth > 1:
+            return {
+                'concurrency': previous['concurrency'],
+                'reason': f'throughput gain {gain:.1%} at concurrency {current["concurrency"]}',
+                'throughput_rps': previous['throughput_rps'],
+            }
+    return None
+
+
+def print_step(step: dict):
+    latency = step['latency']
+    print(
+        f'c={step["concurrency"]:<4} {step["throughput_rps"]:8.1f} req/s '
+        f'p50={latency.get("p50_ms", 0):7.1f}ms p90={latency.get("p90_ms", 0):7.1f}ms '
+        f'p99={latency.get("p99_ms", 0):7.1f}ms errors={step["error_rate"]:.2%}'
+    )
+
+
+async def run(args):
+    weights = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    state = LoadState([f'LOAD{i:03d}' for i in range(args.tickers)], args.years, rng)
+    if not args.skip_seed:
+        print(f'Seeding {args.tickers} tickers...')
+        await seed_tickers(args.base_url, state, args.timeout)
+
+    steps = []
+    for concurrency in args.concurrency:
+        step = await run_step(args.base_url, state, weights, concurrency, args.duration, args.timeout)
+        print_step(step)
+        steps.append(step)
+        saturation = find_saturation(steps, args.min_gain, args.max_error_rate)
+        if saturation and args.stop_at_saturation:
+            break
+    return steps, find_saturation(steps, args.min_gain, args.max_error_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mixed-traffic HTTP load test for the API.')
+    parser.add_argument('--base-url', default='http://localhost:8001')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Weighted request mix, e.g. stock_data=6,catalog=2')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per concurrency step')
+    parser.add_argument('--tickers', type=int, default=10)
+    parser.add_argument('--years', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--min-gain', type=float, default=0.1)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--stop-at-saturation', action='store_true')
+    parser.add_argument('--skip-seed', action='store_true', help='Assume the load tickers are already imported')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Result JSON path (default: benchmarks/results/)')
+    args = parser.parse_args()
+
+    steps, saturation = asyncio.run(run(args))
+    if saturation:
+        print(f'\nSaturation at concurrency {saturation["concurrency"]} ({saturation["reason"]})')
+    else:
+        print('\nNo saturation point reached; try higher --concurrency steps.')
+
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), 'results', f'load_{datetime.now():%Y%m%d_%H%M%S}.json'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'args': vars(args),
+            },
+            'steps': steps,
+            'saturation': saturation,
+        }, f, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+'''
+Cold-start benchmark for the API.
+
+Measures, each in a fresh interpreter:
+
+- import time of `app.main` (plus the slowest modules with --importtime)
+- time from launching uvicorn to the first successful response on --path,
+  and the latency of that first request compared with the next one
+
+Connection settings come from config.ini / DB_* environment variables, as for
+the API. Run from the repository root:
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --path /stock_vault/data/AAPL --importtime
+'''
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from benchmarks.bench_ingest_query import RESULTS_DIR, git_commit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_SNIPPET = (
+    'import time; start = time.perf_counter(); import app.main; '
+    'print(time.perf_counter() - start)'
+)
+
+
+def measure_import() -> float:
+    output = subprocess.check_output(
+        [sys.executable, '-c', IMPORT_SNIPPET], cwd=REPO_ROOT, text=True,
+        stderr=subprocess.DEVNULL,
+    )
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(count: int = 15) -> list[dict]:
+    '''
+    Runs `python -X importtime` and returns the modules with the largest
+    cumulative import time.
+    '''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app.main'],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = (
+            part.strip() for part in line[len('import time:'):].split('|')
+        )
+        modules.append({
+            'module': name,
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+        })
+    modules.sort(key=lambda m: m['cumulative_ms'], reverse=True)
+    return modules[:count]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def request(url: str, timeout: float = 5.0) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def measure_first_request(path: str, deadline: float) -> dict:
+    '''
+    Starts uvicorn and polls `path` until it returns 200. Returns the time
+    to the first success and the latency of the first and second successful
+    requests.
+    '''
+    port = free_port()
+    url = f'http://127.0.0.1:{port}{path}'
+    launched = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - launched < deadline:
+            start = time.perf_counter()
+            try:
+                status = request(url)
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+                continue
+            if status != 200:
+                raise RuntimeError(f'{path} returned HTTP {status}')
+            first_latency = time.perf_counter() - start
+            ready = time.perf_counter() - launched
+            start = time.perf_counter()
+            request(url)
+            second_latency = time.perf_counter() - start
+            return {
+                'time_to_first_success_s': ready,
+                'first_request_ms': first_latency * 1000,
+                'second_request_ms': second_latency * 1000,
+            }
+        raise TimeoutError(f'No successful response from {path} within {deadline}s')
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        'median': statistics.median(values),
+        'min': min(values),
+        'max': max(values),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark API cold start.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/stock_vault/catalog_all',
+                        help='Endpoint polled until the first successful response')
+    parser.add_argument('--deadline', type=float, default=60.0)
+    parser.add_argument('--importtime', action='store_true',
+                        help='Also report the slowest imports')
+    parser.add_argument('--output', help='Result JSON path (default: benchmarks/results/)')
+    args = parser.parse_args()
+
+    import_times = [measure_import() for _ in range(args.runs)]
+    first_requests = [measure_first_request(args.path, args.deadline) for _ in range(args.runs)]
+    results = {
+        'import_s': summarize(import_times),
+        'time_to_first_success_s': summarize(
+            [run['time_to_first_success_s'] for run in first_requests]
+        ),
+        'first_request_ms': summarize([run['first_request_ms'] for run in first_requests]),
+        'second_request_ms': summarize([run['second_request_ms'] for run in first_requests]),
+    }
+    if args.importtime:
+        results['slowest_imports'] = slowest_imports()
+
+    print(f'import app.main          median {results["import_s"]["median"] * 1000:8.1f} ms')
+    print(f'time to first success    median {results["time_to_first_success_s"]["median"] * 1000:8.1f} ms')
+    print(f'first request latency    median {results["first_request_ms"]["median"]:8.1f} ms')
+    print(f'second request latency   median {results["second_request_ms"]["median"]:8.1f} ms')
+    for module in results.get('slowest_imports', []):
+        print(f'  {module["cumulative_ms"]:8.1f} ms  {module["module"]}')
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'git_commit': commit,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f'startup_{datetime.now():%Y%m%d_%H%M%S}_{commit}.json'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults written to {output}')
+
+
+if __name__ == '__main__':
+    main()
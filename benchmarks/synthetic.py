@@ -0,0 +1,121 @@
+'''
+Synthetic OHLCV generator for benchmarks.
+
+Prices follow a geometric Brownian motion per ticker; each bar's open/high/low
+are derived from the previous close so the OHLC invariants always hold
+(low <= open, close <= high). Output is deterministic for a given seed.
+
+Usage:
+    python -m benchmarks.synthetic --tickers 5 --years 2 --interval 1h --out data/
+'''
+import argparse
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Bars per session for the supported intervals (US equities, 09:30-16:00)
+INTERVALS = {
+    '1d': None,
+    '1h': '1h',
+    '30m': '30min',
+    '15m': '15min',
+    '5m': '5min',
+    '1m': '1min',
+}
+
+
+def make_tickers(count: int) -> list[str]:
+    '''
+    Returns `count` distinct synthetic ticker symbols (SYN0000, SYN0001, ...).
+    '''
+    return [f'SYN{i:04d}' for i in range(count)]
+
+
+def make_timestamps(start: str, years: float, interval: str) -> pd.DatetimeIndex:
+    '''
+    Builds the bar timestamps for `years` of business days starting at `start`.
+    '''
+    if interval not in INTERVALS:
+        raise ValueError(f'Unsupported interval: {interval}. Choose from {list(INTERVALS)}')
+    start_dt = pd.Timestamp(start)
+    end_dt = start_dt + pd.DateOffset(days=int(round(years * 365)))
+    days = pd.bdate_range(start_dt, end_dt, inclusive='left')
+    freq = INTERVALS[interval]
+    if freq is None:
+        return days
+    session = pd.timedelta_range('09:30:00', '15:59:59', freq=freq)
+    return pd.DatetimeIndex(
+        (days.values[:, None] + session.values[None, :]).ravel()
+    )
+
+
+def generate_ticker_bars(
+    ticker: str,
+    timestamps: pd.DatetimeIndex,
+    rng: np.random.Generator,
+    start_price: float = 100.0,
+    volatility: float = 0.02,
+) -> pd.DataFrame:
+    '''
+    Generates OHLCV bars for one ticker over the given timestamps.
+    '''
+    n = len(timestamps)
+    returns = rng.normal(0.0, volatility, n)
+    close = start_price * np.exp(np.cumsum(returns))
+    open_ = np.empty(n)
+    open_[0] = start_price
+    open_[1:] = close[:-1]
+    spread = np.abs(rng.normal(0.0, volatility / 2, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.maximum(np.minimum(open_, close) - spread, 0.01)
+    volume = rng.integers(1_000, 1_000_000, n)
+    return pd.DataFrame({
+        'timestamp': timestamps,
+        'ticker': ticker,
+        'open': open_.round(4),
+        'high': high.round(4),
+        'low': low.round(4),
+        'close': close.round(4),
+        'volume': volume,
+    })
+
+
+def generate_bars(
+    tickers: int = 1,
+    years: float = 1.0,
+    interval: str = '1d',
+    start: str = '2015-01-01',
+    seed: int = 42,
+):
+    '''
+    Yields one DataFrame of OHLCV bars per synthetic ticker.
+    '''
+    rng = np.random.default_rng(seed)
+    timestamps = make_timestamps(start, years, interval)
+    for ticker in make_tickers(tickers):
+        start_price = float(rng.uniform(10, 500))
+        yield generate_ticker_bars(ticker, timestamps, rng, start_price=start_price)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic OHLCV CSV files.')
+    parser.add_argument('--tickers', type=int, default=1)
+    parser.add_argument('--years', type=float, default=1.0)
+    parser.add_argument('--interval', default='1d', choices=list(INTERVALS))
+    parser.add_argument('--start', default='2015-01-01')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='synthetic_data')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for df in generate_bars(args.tickers, args.years, args.interval, args.start, args.seed):
+        ticker = df['ticker'].iloc[0]
+        path = os.path.join(args.out, f'{ticker}_{args.interval}.csv')
+        df.to_csv(path, index=False)
+        print(f'{datetime.now():%H:%M:%S} wrote {len(df)} bars to {path}')
+
+
+if __name__ == '__main__':
+    main()
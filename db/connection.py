@@ -1,7 +1,25 @@
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 import configparser
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from dotenv import load_dotenv, find_dotenv
+import logging
 import os
+from typing import Optional
+
+from app.config import get_setting
+from app.metrics import (
+    DB_CONNECTIONS_OPEN,
+    DB_CONNECTIONS_OPENED,
+    DB_POOL_CONNECTIONS,
+    DB_POOL_WAIT,
+)
+from db.replicas import Replica, ReplicaRouter, parse_replica_dsns
+from db.shards import ShardMap, load_shard_map, node_settings
 
 # Ensure the .env file is loaded only once
 load_dotenv(find_dotenv(), override=False)
@@ -12,7 +30,12 @@ def get_db_params():
     config = configparser.ConfigParser()
     config_path = os.path.join(os.path.dirname(__file__), '../config.ini')
     config.read(config_path)
-    db_params = dict(config['database'])
+    # pool_* settings configure the connection pool, not the connection
+    db_params = {
+        key: value
+        for key, value in config['database'].items()
+        if not key.startswith('pool_')
+    }
 
     # Override config values with environment variables if they exist
     for key in ['host', 'port', 'dbname', 'user', 'password']:
@@ -23,19 +46,310 @@ def get_db_params():
     return db_params
 
 
-def get_db_connection():
-    params = get_db_params()
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """
+    psycopg2 connection tracked for the open-connection gauge. Instances are
+    held in a WeakSet, so connections that are dropped without close() stop
+    counting once they are garbage collected.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _open_connections.add(self)
+        DB_CONNECTIONS_OPENED.inc()
+
+
+_open_connections = weakref.WeakSet()
+DB_CONNECTIONS_OPEN.callback = lambda: sum(
+    1 for conn in list(_open_connections) if not conn.closed
+)
+
+
+def get_db_connection(node: Optional[str] = None):
+    """
+    Opens an unpooled connection to a database node (see db/shards.py), by
+    default the first one.
+    """
+    if node is None and not get_shard_map().sharded:
+        params = get_db_params()
+    else:
+        params = get_node(node).params
     try:
-        connection = psycopg2.connect(**params)
-        return connection
+        return psycopg2.connect(**params, connection_factory=InstrumentedConnection)
     except Exception as e:
-        print(f"Error connecting to the database: {e}")
+        logging.error(f'Error connecting to the database: {e}')
         return None
 
 
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool that waits up to `timeout` seconds for a free
+    connection instead of raising as soon as maxconn connections are out.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, *args, **kwargs):
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError(
+                f'No database connection available after {self.timeout}s.'
+            )
+        DB_POOL_WAIT.observe(time.perf_counter() - start)
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        try:
+            # Closed or broken connections are discarded; ones left inside a
+            # transaction are rolled back before going back to the pool.
+            super().putconn(conn, key, close or conn.closed)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {('idle',): len(self._pool), ('in_use',): len(self._used)}
+
+
+def _replica_pool(params: dict) -> BlockingConnectionPool:
+    return BlockingConnectionPool(
+        get_setting('replicas', 'pool_min', 0, int),
+        get_setting('replicas', 'pool_max', 10, int),
+        # A saturated replica is passed over rather than waited for
+        get_setting('replicas', 'pool_timeout', 0.0, float),
+        **params,
+        connection_factory=InstrumentedConnection,
+    )
+
+
+def _replica_name(params: dict) -> str:
+    return f"{params.get('host')}:{params.get('port', 5432)}/{params.get('dbname')}"
+
+
+class DatabaseNode:
+    """
+    One database node (see db/shards.py): its connection pool, created on
+    first use, and the router for its read replicas.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        dsn, replica_dsns = node_settings(name)
+        self.params = get_db_params()
+        if dsn:
+            self.params.update(psycopg2.extensions.parse_dsn(dsn))
+        self.router = ReplicaRouter(
+            [
+                Replica(_replica_name(params), params, _replica_pool)
+                for params in parse_replica_dsns(replica_dsns, self.params)
+            ],
+            strategy=get_setting('replicas', 'strategy', 'round_robin'),
+            retry_after=get_setting('replicas', 'retry_after', 30.0, float),
+            freshness_window=get_setting('replicas', 'freshness_window', 5.0, float),
+        )
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> BlockingConnectionPool:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = BlockingConnectionPool(
+                        get_setting('database', 'pool_min', 1, int),
+                        get_setting('database', 'pool_max', 10, int),
+                        get_setting('database', 'pool_timeout', 30.0, float),
+                        **self.params,
+                        connection_factory=InstrumentedConnection,
+                    )
+        return self._pool
+
+    def stats(self) -> dict:
+        return self._pool.stats() if self._pool is not None else {}
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.closeall()
+        self.router.close()
+
+
+_nodes: dict = {}
+_shard_map: Optional[ShardMap] = None
+_pool_lock = threading.Lock()
+
+
+def get_shard_map() -> ShardMap:
+    global _shard_map
+    if _shard_map is None:
+        with _pool_lock:
+            if _shard_map is None:
+                _shard_map = load_shard_map()
+    return _shard_map
+
+
+def get_node(name: Optional[str] = None) -> DatabaseNode:
+    """
+    Returns a database node, by default the first configured one (the only
+    one when the database is not sharded).
+    """
+    shard_map = get_shard_map()
+    name = name or shard_map.nodes[0]
+    if name not in shard_map.all_nodes:
+        raise ValueError(f'Unknown database node {name!r}.')
+    node = _nodes.get(name)
+    if node is None:
+        with _pool_lock:
+            node = _nodes.get(name)
+            if node is None:
+                node = _nodes[name] = DatabaseNode(name)
+    return node
+
+
+def get_db_pool() -> BlockingConnectionPool:
+    """
+    Returns the process-wide connection pool of the first node, creating it
+    on first use.
+    """
+    return get_node().pool
+
+
+def get_replica_router() -> ReplicaRouter:
+    """
+    Returns the first node's read-replica router (see db/replicas.py). With
+    no replicas configured it routes every read to the primary.
+    """
+    return get_node().router
+
+
+def mark_ticker_written(ticker: str):
+    """
+    Sends the ticker's reads to the primary for the freshness window.
+    """
+    shard_map = get_shard_map()
+    get_node(shard_map.owner(ticker)).router.mark_written(ticker)
+
+
+def close_db_pool():
+    global _shard_map
+    with _pool_lock:
+        nodes = list(_nodes.values())
+        _nodes.clear()
+        _shard_map = None
+    for node in nodes:
+        node.close()
+
+
+def _pool_stats() -> dict:
+    totals = {}
+    for node in list(_nodes.values()):
+        for key, value in node.stats().items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+DB_POOL_CONNECTIONS.callback = _pool_stats
+
+
+def get_statement_timeout(name: str) -> Optional[int]:
+    """
+    Returns the statement_timeout in milliseconds for an endpoint, from the
+    [statement_timeout] section of config.ini (falling back to `default`).
+    0 or an empty value means no timeout.
+    """
+    timeout = get_setting('statement_timeout', name, None, int)
+    if timeout is None:
+        timeout = get_setting('statement_timeout', 'default', 0, int)
+    return timeout or None
+
+
+class QueryCancellation:
+    """
+    Cancels the statements running on the connections attached to it. Safe
+    to call from any thread (psycopg2's cancel() does not need the
+    connection's lock); used to stop the query behind a stream whose client
+    has gone away.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def attach(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise psycopg2.extensions.QueryCanceledError('Query cancelled before it started.')
+            self._connections.add(conn)
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+
+    def cancel(self):
+        # The lock is held while the cancel requests are sent, so a connection
+        # cannot be detached and handed to another request in the meantime,
+        # whose statement the cancel would then abort
+        with self._lock:
+            self.cancelled = True
+            for conn in self._connections:
+                try:
+                    conn.cancel()
+                except psycopg2.Error as e:
+                    logging.warning(f'Error cancelling query: {e}')
+
+
+@contextmanager
+def db_connection(
+    statement_timeout: Optional[int] = None,
+    cancellation: Optional[QueryCancellation] = None,
+    read_only: bool = False,
+    ticker: Optional[str] = None,
+    node: Optional[str] = None,
+):
+    """
+    Borrows a connection from the pool for the duration of the block. Callers
+    commit or roll back as before; the connection is returned (and any open
+    transaction rolled back) when the block exits.
+
+    `statement_timeout` (ms) is set with SET LOCAL, so it only lasts until
+    the block's transaction ends. With a `cancellation`, statements on the
+    connection can be cancelled from another thread. `read_only` blocks may
+    be served by a read replica, unless `ticker` changed too recently (see
+    db/replicas.py). `node` picks the database node (see db/shards.py);
+    callers route by ticker with get_shard_map().owner().
+    """
+    database = get_node(node)
+    pool = None
+    replica, conn = database.router.getconn(ticker) if read_only else (None, None)
+    if conn is None:
+        pool = database.pool
+        conn = pool.getconn()
+    try:
+        if statement_timeout:
+            with conn.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', (int(statement_timeout),))
+        if cancellation is None:
+            yield conn
+        else:
+            with cancellation.attach(conn):
+                yield conn
+    finally:
+        (pool or replica).putconn(conn)
+
+
 def close_db_connection(connection):
     if connection:
         connection.close()
-        print("Database connection closed.")
+        logging.debug('Database connection closed.')
     else:
-        print("No connection to close.")
+        logging.debug('No connection to close.')
@@ -0,0 +1,295 @@
+'''
+Versioned schema migrations.
+
+`db/migrations/create_tables.sql` is the baseline (version 0000). Later
+changes are numbered files, `db/migrations/NNNN_<name>.sql`, applied in
+order and recorded in `schema_migrations`. A database created from the
+baseline before this runner existed is adopted: the baseline is recorded as
+applied without being run again. The baseline is therefore frozen at the
+schema it deployed; every later change, however small, is a numbered
+migration written to apply to such a database (ADD COLUMN IF NOT EXISTS,
+CREATE ... IF NOT EXISTS).
+
+A migration whose first line is `-- migrate: no-transaction` runs statement
+by statement in autocommit mode, which `CREATE INDEX CONCURRENTLY` needs in
+order to build an index without blocking writes, and which lets a DO block
+COMMIT as it goes to keep a backfill's transactions short. TimescaleDB does not
+support CONCURRENTLY on hypertables; there the index is built with
+`timescaledb.transaction_per_chunk`, which only locks one chunk at a time.
+
+Usage: python -m db.migrate [--status]. With sharding (db/shards.py) every
+node is migrated.
+'''
+import argparse
+import glob
+import hashlib
+import logging
+import os
+import re
+import time
+from typing import NamedTuple
+
+from db.connection import close_db_connection, get_db_connection, get_shard_map
+
+MIGRATIONS_DIR = 'db/migrations'
+BASELINE = 'create_tables.sql'
+NO_TRANSACTION = '-- migrate: no-transaction'
+# pg_advisory_lock key ('elg'), so concurrent runners apply each migration once
+LOCK_KEY = 0x656C67
+
+CREATE_SCHEMA_MIGRATIONS = '''
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    duration_ms DOUBLE PRECISION,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+'''
+
+_CREATE_INDEX_CONCURRENTLY = re.compile(
+    r'^CREATE\s+(UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(IF\s+NOT\s+EXISTS\s+)?(\w+)\s+ON\s+(?:ONLY\s+)?([\w.]+)',
+    re.IGNORECASE,
+)
+_DROP_INDEX_CONCURRENTLY = re.compile(
+    r'^DROP\s+INDEX\s+CONCURRENTLY\s+(IF\s+EXISTS\s+)?([\w.]+)', re.IGNORECASE
+)
+
+
+class Migration(NamedTuple):
+    version: str
+    name: str
+    path: str
+    sql: str
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode()).hexdigest()
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.lstrip().startswith(NO_TRANSACTION)
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> list[Migration]:
+    migrations = []
+    with open(os.path.join(directory, BASELINE), 'r') as f:
+        migrations.append(Migration('0000', 'create_tables', f.name, f.read()))
+    for path in sorted(glob.glob(os.path.join(directory, '[0-9][0-9][0-9][0-9]_*.sql'))):
+        version, name = os.path.basename(path)[:-len('.sql')].split('_', 1)
+        with open(path, 'r') as f:
+            migrations.append(Migration(version, name, path, f.read()))
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f'Duplicate migration versions in {directory}.')
+    return migrations
+
+
+def split_statements(sql: str) -> list[str]:
+    '''
+    Splits a migration into statements at semicolons that end a line.
+    Comment lines are dropped. A `$$`-quoted body (e.g. of a DO block) is
+    kept in one statement; other quoting is not parsed.
+    '''
+    statements, current = [], []
+    quoted = False
+    for line in sql.splitlines():
+        if line.strip().startswith('--'):
+            continue
+        current.append(line)
+        if line.count('$$') % 2:
+            quoted = not quoted
+        if not quoted and line.rstrip().endswith(';'):
+            statement = '\n'.join(current).strip()
+            if statement != ';':
+                statements.append(statement)
+            current = []
+    if '\n'.join(current).strip():
+        statements.append('\n'.join(current).strip())
+    return statements
+
+
+def _is_hypertable(cursor, table: str) -> bool:
+    cursor.execute("SELECT to_regclass('timescaledb_information.hypertables') IS NOT NULL;")
+    if not cursor.fetchone()[0]:
+        return False
+    cursor.execute(
+        'SELECT 1 FROM timescaledb_information.hypertables WHERE hypertable_name = %s;',
+        (table.split('.')[-1],),
+    )
+    return cursor.fetchone() is not None
+
+
+def _index_table(cursor, index: str):
+    cursor.execute(
+        'SELECT tablename FROM pg_indexes WHERE indexname = %s;', (index.split('.')[-1],)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def online_statement(cursor, statement: str) -> str:
+    '''
+    Rewrites CONCURRENTLY index statements on hypertables to their
+    TimescaleDB equivalent. Other statements are returned unchanged.
+    '''
+    match = _CREATE_INDEX_CONCURRENTLY.match(statement)
+    if match and _is_hypertable(cursor, match.group(4)):
+        statement = re.sub(r'\s+CONCURRENTLY', '', statement, count=1, flags=re.IGNORECASE)
+        return statement.rstrip().rstrip(';') + ' WITH (timescaledb.transaction_per_chunk);'
+    match = _DROP_INDEX_CONCURRENTLY.match(statement)
+    if match:
+        table = _index_table(cursor, match.group(2))
+        if table and _is_hypertable(cursor, table):
+            return re.sub(r'\s+CONCURRENTLY', '', statement, count=1, flags=re.IGNORECASE)
+    return statement
+
+
+def _drop_invalid_index(cursor, statement: str):
+    '''
+    A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind, which
+    IF NOT EXISTS would then skip. Drop it so that a retry rebuilds it.
+    '''
+    match = _CREATE_INDEX_CONCURRENTLY.match(statement)
+    if not match:
+        return
+    cursor.execute(
+        '''
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid;
+        ''',
+        (match.group(3),),
+    )
+    if cursor.fetchone():
+        logging.warning(f'Dropping invalid index {match.group(3)} left by an earlier attempt.')
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {match.group(3)};')
+
+
+def _record(cursor, migration: Migration, duration_ms=None):
+    cursor.execute(
+        '''
+        INSERT INTO schema_migrations (version, name, checksum, duration_ms)
+        VALUES (%s, %s, %s, %s);
+        ''',
+        (migration.version, migration.name, migration.checksum, duration_ms),
+    )
+
+
+def get_applied_migrations(conn) -> dict:
+    '''
+    Returns {version: checksum} of the applied migrations.
+    '''
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL;")
+        if not cursor.fetchone()[0]:
+            return {}
+        cursor.execute('SELECT version, checksum FROM schema_migrations;')
+        return dict(cursor.fetchall())
+
+
+# Tables created by create_tables.sql
+BASELINE_TABLES = ('stock_data', 'forex_data', 'crypto_data', 'stock_vault_catalog')
+
+
+def _has_baseline_schema(conn) -> bool:
+    '''
+    Whether the tables the baseline creates all exist, i.e. the database
+    was deployed from it.
+    '''
+    with conn.cursor() as cursor:
+        cursor.execute(
+            'SELECT bool_and(to_regclass(name) IS NOT NULL) FROM unnest(%s::TEXT[]) AS name;',
+            (list(BASELINE_TABLES),),
+        )
+        return cursor.fetchone()[0]
+
+
+def _apply(conn, migration: Migration):
+    start = time.perf_counter()
+    if migration.transactional:
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(migration.sql)
+                _record(cursor, migration, (time.perf_counter() - start) * 1000)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+        return
+    with conn.cursor() as cursor:
+        for statement in split_statements(migration.sql):
+            _drop_invalid_index(cursor, statement)
+            cursor.execute(online_statement(cursor, statement))
+        _record(cursor, migration, (time.perf_counter() - start) * 1000)
+
+
+def apply_migrations(conn=None, directory: str = MIGRATIONS_DIR, node=None) -> list[str]:
+    '''
+    Applies the pending migrations in order and returns their versions.
+    Uses (and leaves in autocommit mode) `conn` if given, otherwise connects
+    to `node` (by default the first one).
+    '''
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection(node)
+        if conn is None:
+            raise RuntimeError('Database not reachable.')
+    applied_now = []
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s);', (LOCK_KEY,))
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(CREATE_SCHEMA_MIGRATIONS)
+            applied = get_applied_migrations(conn)
+            for migration in load_migrations(directory):
+                if migration.version in applied:
+                    if applied[migration.version] != migration.checksum:
+                        logging.warning(
+                            f'Migration {migration.version}_{migration.name} changed after it was applied.'
+                        )
+                    continue
+                if migration.version == '0000' and _has_baseline_schema(conn):
+                    # Created from create_tables.sql before migrations were tracked
+                    with conn.cursor() as cursor:
+                        _record(cursor, migration)
+                    logging.info('Adopted existing schema as migration 0000.')
+                    continue
+                logging.info(f'Applying migration {migration.version}_{migration.name}...')
+                _apply(conn, migration)
+                applied_now.append(migration.version)
+        finally:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s);', (LOCK_KEY,))
+    finally:
+        if own_conn:
+            close_db_connection(conn)
+    return applied_now
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply pending schema migrations.')
+    parser.add_argument('--status', action='store_true', help='List migrations without applying them.')
+    args = parser.parse_args()
+    for node in get_shard_map().all_nodes:
+        if args.status:
+            conn = get_db_connection(node)
+            try:
+                applied = get_applied_migrations(conn)
+            finally:
+                close_db_connection(conn)
+            for migration in load_migrations():
+                state = 'applied' if migration.version in applied else 'pending'
+                print(f'[{node}] {migration.version}_{migration.name}: {state}')
+            continue
+        versions = apply_migrations(node=node)
+        print(f'[{node}] Applied {len(versions)} migration(s): {", ".join(versions) or "none"}.')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
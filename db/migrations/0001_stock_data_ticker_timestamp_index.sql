@@ -0,0 +1,7 @@
+-- migrate: no-transaction
+-- (ticker, timestamp) index for range reads of a ticker that do not filter
+-- on version: chunk checks, catalog statistics and ad-hoc queries.
+-- TimescaleDB already creates it for a hypertable partitioned by ticker, so
+-- there this is a no-op; plain PostgreSQL installs need it explicitly.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS stock_data_ticker_timestamp_idx
+    ON stock_data (ticker, timestamp DESC);
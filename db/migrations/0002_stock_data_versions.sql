@@ -0,0 +1,14 @@
+-- Import versions (see import_stock_vault_columns): every stock_data row
+-- carries the version of the import that wrote it, and readers only see the
+-- version named by the ticker's catalog entry.
+-- The constant default fills the existing rows with version 0 without
+-- rewriting the table, so existing catalog entries and their rows keep
+-- matching at version 0.
+ALTER TABLE stock_data
+    ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
+ALTER TABLE stock_vault_catalog
+    ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
+-- Versions for imports; 0 is data loaded before versioning
+CREATE SEQUENCE IF NOT EXISTS stock_data_version_seq;
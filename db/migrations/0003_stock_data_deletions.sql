@@ -0,0 +1,19 @@
+-- Background deletions of stock_data rows (see app/deletion.py): removed
+-- tickers and the versions replaced by reimports
+CREATE TABLE IF NOT EXISTS stock_data_deletions (
+    id BIGSERIAL PRIMARY KEY,
+    ticker TEXT NOT NULL,
+    min_version BIGINT NOT NULL,
+    max_version BIGINT NOT NULL,
+    -- pending, running, completed or failed
+    status TEXT NOT NULL DEFAULT 'pending',
+    rows_total BIGINT,
+    rows_deleted BIGINT NOT NULL DEFAULT 0,
+    chunks_truncated INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    -- A running job whose lease expired is picked up again by any worker
+    lease_expires_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,13 @@
+-- migrate: no-transaction
+-- Covering index for the read path:
+--   ticker = ? AND version = ? AND timestamp BETWEEN ? AND ? ORDER BY timestamp
+-- The OHLCV columns are stored in the index leaf pages, so range reads are
+-- index-only scans and do not visit the heap for pages vacuum has marked
+-- all-visible.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS stock_data_ticker_version_timestamp_ohlcv_idx
+    ON stock_data (ticker, version, timestamp)
+    INCLUDE (open, high, low, close, volume);
+
+-- Databases set up before this migration may have a plain index on the same
+-- key; next to the covering index it only costs writes
+DROP INDEX CONCURRENTLY IF EXISTS stock_data_ticker_version_timestamp_idx;
@@ -0,0 +1,15 @@
+-- Per-ticker statistics kept in the catalog entry (see app/catalog_stats.py).
+-- Imports write them; 0006 backfills the entries imported before.
+-- Adding nullable columns only changes the catalog's metadata, so the
+-- ACCESS EXCLUSIVE lock is brief. Give up rather than queue behind a long
+-- reader, which would stall every read queued behind the ALTER.
+SET LOCAL lock_timeout = '5s';
+
+ALTER TABLE stock_vault_catalog
+    ADD COLUMN IF NOT EXISTS row_count BIGINT,
+    ADD COLUMN IF NOT EXISTS first_bar TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS last_bar TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS min_price DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS max_price DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS total_volume BIGINT,
+    ADD COLUMN IF NOT EXISTS size_bytes BIGINT;
@@ -0,0 +1,42 @@
+-- migrate: no-transaction
+-- Fills in the statistics of catalog entries imported before 0005, one
+-- ticker per transaction. Each ticker's aggregate reads only its current
+-- version through the covering index (0004), and only that ticker's
+-- catalog row is locked, for the length of its own aggregate. Entries that
+-- an import filled in meanwhile are skipped.
+DO $$
+DECLARE
+    entry RECORD;
+BEGIN
+    FOR entry IN
+        SELECT ticker, version FROM stock_vault_catalog WHERE row_count IS NULL ORDER BY ticker
+    LOOP
+        UPDATE stock_vault_catalog AS c
+        SET
+            row_count = s.row_count,
+            first_bar = s.first_bar,
+            last_bar = s.last_bar,
+            min_price = s.min_price,
+            max_price = s.max_price,
+            total_volume = s.total_volume,
+            -- Same estimate as app.catalog_stats.estimate_storage_bytes
+            size_bytes = s.row_count * (182 + 3 * ((OCTET_LENGTH(c.ticker) + 8) / 8 * 8))
+        FROM (
+            SELECT
+                COUNT(*) AS row_count,
+                MIN(d.timestamp) AS first_bar,
+                MAX(d.timestamp) AS last_bar,
+                LEAST(MIN(d.open), MIN(d.high), MIN(d.low), MIN(d.close)) AS min_price,
+                GREATEST(MAX(d.open), MAX(d.high), MAX(d.low), MAX(d.close)) AS max_price,
+                COALESCE(SUM(d.volume), 0) AS total_volume
+            FROM stock_data AS d
+            WHERE d.ticker = entry.ticker
+                AND d.version = entry.version
+        ) AS s
+        WHERE c.ticker = entry.ticker
+            AND c.version = entry.version
+            AND c.row_count IS NULL;
+        COMMIT;
+    END LOOP;
+END
+$$;
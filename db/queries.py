@@ -1,16 +1,70 @@
+import itertools
+import os
+import time
 import psycopg2
-from psycopg2.extras import execute_values  # Import execute_values for bulk inserts
+
+from app.metrics import DB_QUERY_DURATION, DB_QUERY_ERRORS, DB_QUERY_ROWS
+from app.tracing import span, traced_iterator
+from db.slow_query_log import check_slow_query
+
+
+class SqlQuery(str):
+    """
+    SQL text loaded from a file. Behaves like a plain string; `name` is the
+    file name without extension and labels the query's metrics.
+    """
+
+    name = 'inline'
+
+
+_sql_cache: dict[str, SqlQuery] = {}
+# Server-side cursor names must be unique within a connection
+_cursor_ids = itertools.count()
 
 
 def load_sql_query(filepath):
     """
-    Load a SQL query from a file.
+    Load a SQL query from a file. Files are read once and cached.
 
     :param filepath: Path to the SQL file.
     :return: SQL query as a string.
     """
-    with open(filepath, 'r') as f:
-        return f.read()
+    query = _sql_cache.get(filepath)
+    if query is None:
+        with open(filepath, 'r') as f:
+            query = SqlQuery(f.read())
+        query.name = os.path.splitext(os.path.basename(filepath))[0]
+        _sql_cache[filepath] = query
+    return query
+
+
+def preload_sql_queries(directory='db/queries'):
+    """
+    Read every SQL file in the directory into the cache (startup warm-up).
+
+    :param directory: Directory containing the .sql files.
+    :return: Number of files loaded.
+    """
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.sql'))
+    for name in names:
+        load_sql_query(f'{directory}/{name}')
+    return len(names)
+
+
+def _query_name(sql):
+    return getattr(sql, 'name', 'inline')
+
+
+def _record_query(conn, sql, params, seconds, rows, bulk=False):
+    name = _query_name(sql)
+    DB_QUERY_DURATION.observe(seconds, query=name)
+    if rows and rows > 0:
+        DB_QUERY_ROWS.inc(rows, query=name)
+    check_slow_query(conn, sql, params, seconds, rows, bulk=bulk)
+
+
+def _record_query_error(sql):
+    DB_QUERY_ERRORS.inc(query=_query_name(sql))
 
 
 def execute_nonquery(conn, sql, params=None, bulk=False):
@@ -21,16 +75,29 @@ def execute_nonquery(conn, sql, params=None, bulk=False):
     :param sql: SQL query to execute.
     :param params: Optional parameters for the SQL query.
     :param bulk: Whether to execute a bulk insert.
-    :return: None
+    :return: Number of rows affected.
     """
-    with conn.cursor() as cursor:
-        if bulk and params:
-            # Use execute_values for bulk inserts
-            execute_values(cursor, sql, params)
-        elif params:
-            cursor.execute(sql, params)
-        else:
-            cursor.execute(sql)
+    start = time.perf_counter()
+    with span(f'db.{_query_name(sql)}') as db_span, conn.cursor() as cursor:
+        try:
+            if bulk and params:
+                # Use execute_values for bulk inserts (imported on first use)
+                from psycopg2.extras import execute_values
+
+                execute_values(cursor, sql, params)
+            elif params:
+                cursor.execute(sql, params)
+            else:
+                cursor.execute(sql)
+        except Exception:
+            _record_query_error(sql)
+            raise
+        # execute_values runs in pages, so rowcount only covers the last page
+        rows = len(params) if bulk and params else cursor.rowcount
+        if db_span:
+            db_span.set_attribute('rows', rows)
+    _record_query(conn, sql, params, time.perf_counter() - start, rows, bulk=bulk)
+    return rows
 
 
 def fetch_query_results(conn, sql, params=None):
@@ -41,12 +108,57 @@ def fetch_query_results(conn, sql, params=None):
     :param params: Optional parameters for the SQL query.
     :return: Query results.
     '''
-    with conn.cursor() as cursor:
-        if params:
+    start = time.perf_counter()
+    with span(f'db.{_query_name(sql)}') as db_span, conn.cursor() as cursor:
+        try:
+            if params:
+                cursor.execute(sql, params)
+            else:
+                cursor.execute(sql)
+            results = cursor.fetchall()
+        except Exception:
+            _record_query_error(sql)
+            raise
+        if db_span:
+            db_span.set_attribute('rows', len(results))
+    _record_query(conn, sql, params, time.perf_counter() - start, len(results))
+    return results
+
+
+def fetch_query_batches(conn, sql, params=None, batch_size=10000):
+    '''
+    Fetch results from a SQL query in batches through a server-side cursor,
+    so at most batch_size rows are held in memory at a time.
+    :param conn: Database connection object (must not be in autocommit mode).
+    :param sql: SQL query to execute.
+    :param params: Optional parameters for the SQL query.
+    :param batch_size: Number of rows per batch.
+    :return: Iterator of lists of rows.
+    '''
+    return traced_iterator(
+        _iter_query_batches(conn, sql, params, batch_size), f'db.{_query_name(sql)}'
+    )
+
+
+def _iter_query_batches(conn, sql, params, batch_size):
+    # Only time spent in the database counts, not the consumer's work between batches
+    rows = 0
+    start = time.perf_counter()
+    with conn.cursor(name=f'{_query_name(sql)}_{next(_cursor_ids)}') as cursor:
+        try:
             cursor.execute(sql, params)
-        else:
-            cursor.execute(sql)
-        return cursor.fetchall()
+            batch = cursor.fetchmany(batch_size)
+            seconds = time.perf_counter() - start
+            while batch:
+                rows += len(batch)
+                yield batch
+                start = time.perf_counter()
+                batch = cursor.fetchmany(batch_size)
+                seconds += time.perf_counter() - start
+        except Exception:
+            _record_query_error(sql)
+            raise
+    _record_query(conn, sql, params, seconds, rows)
 
 
 def fetch_query_single_result(conn, sql, params=None):
@@ -57,9 +169,16 @@ def fetch_query_single_result(conn, sql, params=None):
     :param params: Optional parameters for the SQL query.
     :return: Single query result.
     '''
-    with conn.cursor() as cursor:
-        if params:
-            cursor.execute(sql, params)
-        else:
-            cursor.execute(sql)
-        return cursor.fetchone()
+    start = time.perf_counter()
+    with span(f'db.{_query_name(sql)}'), conn.cursor() as cursor:
+        try:
+            if params:
+                cursor.execute(sql, params)
+            else:
+                cursor.execute(sql)
+            result = cursor.fetchone()
+        except Exception:
+            _record_query_error(sql)
+            raise
+    _record_query(conn, sql, params, time.perf_counter() - start, 1 if result else 0)
+    return result
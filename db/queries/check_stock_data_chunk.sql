@@ -0,0 +1,9 @@
+SELECT
+    EXISTS (
+        SELECT 1 FROM {chunk}
+        WHERE ticker = %(ticker)s AND version BETWEEN %(min_version)s AND %(max_version)s
+    ),
+    EXISTS (
+        SELECT 1 FROM {chunk}
+        WHERE ticker <> %(ticker)s OR version NOT BETWEEN %(min_version)s AND %(max_version)s
+    );
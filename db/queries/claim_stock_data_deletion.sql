@@ -0,0 +1,16 @@
+UPDATE stock_data_deletions
+SET
+    status = 'running',
+    attempts = attempts + 1,
+    lease_expires_at = NOW() + %s * INTERVAL '1 second',
+    updated_at = NOW()
+WHERE id = (
+    SELECT id
+    FROM stock_data_deletions
+    WHERE status IN ('pending', 'running')
+        AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+    ORDER BY id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, ticker, min_version, max_version, rows_total, attempts;
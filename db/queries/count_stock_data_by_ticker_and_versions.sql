@@ -0,0 +1,4 @@
+SELECT count(*)
+FROM stock_data
+WHERE ticker = %s
+    AND version BETWEEN %s AND %s;
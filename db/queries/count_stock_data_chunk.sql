@@ -0,0 +1,6 @@
+SELECT
+    count(*) FILTER (
+        WHERE ticker = %(ticker)s AND version BETWEEN %(min_version)s AND %(max_version)s
+    ),
+    count(*)
+FROM {chunk};
@@ -0,0 +1,15 @@
+-- At most batch_size rows of the ticker's doomed versions, picked by their
+-- physical address: several versions can share a timestamp, so a batch of
+-- timestamps could delete batch_size rows per version. A ctid is only unique
+-- within one table (a TimescaleDB chunk), so rows are matched on
+-- (tableoid, ctid); the ctid list alone lets the delete use a TID scan.
+WITH batch AS MATERIALIZED (
+    SELECT tableoid, ctid
+    FROM stock_data
+    WHERE ticker = %(ticker)s
+        AND version BETWEEN %(min_version)s AND %(max_version)s
+    LIMIT %(batch_size)s
+)
+DELETE FROM stock_data
+WHERE ctid = ANY(ARRAY(SELECT ctid FROM batch))
+    AND (tableoid, ctid) IN (SELECT tableoid, ctid FROM batch);
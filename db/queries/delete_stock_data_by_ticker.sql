@@ -1,2 +0,0 @@
-DELETE FROM stock_data
-WHERE ticker = %s;
\ No newline at end of file
@@ -1,2 +1,3 @@
 DELETE FROM stock_vault_catalog
-WHERE ticker = %s;
\ No newline at end of file
+WHERE ticker = %s
+RETURNING version;
@@ -0,0 +1,8 @@
+UPDATE stock_data_deletions
+SET
+    status = %s,
+    error = %s,
+    -- A retried job waits until then before it is claimed again
+    lease_expires_at = NOW() + %s * INTERVAL '1 second',
+    updated_at = NOW()
+WHERE id = %s;
@@ -0,0 +1,21 @@
+-- Latest bar of every catalogued ticker (or of the listed ones): one
+-- backward index probe per ticker on (ticker, version, timestamp)
+SELECT
+    c.ticker,
+    (EXTRACT(EPOCH FROM b.timestamp) * 1000000)::BIGINT,
+    b.open,
+    b.high,
+    b.low,
+    b.close,
+    b.volume
+FROM stock_vault_catalog c
+CROSS JOIN LATERAL (
+    SELECT timestamp, open, high, low, close, volume
+    FROM stock_data
+    WHERE ticker = c.ticker
+        AND version = c.version
+    ORDER BY timestamp DESC
+    LIMIT 1
+) b
+WHERE %(tickers)s::TEXT[] IS NULL
+    OR c.ticker = ANY(%(tickers)s::TEXT[]);
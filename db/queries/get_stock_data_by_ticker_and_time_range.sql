@@ -1,5 +1,6 @@
-SELECT *
+SELECT timestamp, ticker, open, high, low, close, volume
 FROM stock_data
-WHERE ticker = %s
-    AND timestamp BETWEEN %s AND %s
-ORDER BY timestamp;
\ No newline at end of file
+WHERE ticker = %(ticker)s
+    AND version = (SELECT version FROM stock_vault_catalog WHERE ticker = %(ticker)s)
+    AND timestamp BETWEEN %(start_time)s AND %(end_time)s
+ORDER BY timestamp;
@@ -0,0 +1,4 @@
+SELECT chunk_schema, chunk_name
+FROM timescaledb_information.chunks
+WHERE hypertable_name = %s
+ORDER BY range_start;
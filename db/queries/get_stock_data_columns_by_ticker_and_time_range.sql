@@ -0,0 +1,6 @@
+SELECT (EXTRACT(EPOCH FROM timestamp) * 1000000)::BIGINT, open, high, low, close, volume
+FROM stock_data
+WHERE ticker = %(ticker)s
+    AND version = (SELECT version FROM stock_vault_catalog WHERE ticker = %(ticker)s)
+    AND timestamp BETWEEN %(start_time)s AND %(end_time)s
+ORDER BY timestamp;
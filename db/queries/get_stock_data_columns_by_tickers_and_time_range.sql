@@ -0,0 +1,14 @@
+SELECT
+    d.ticker,
+    (EXTRACT(EPOCH FROM d.timestamp) * 1000000)::BIGINT,
+    d.open,
+    d.high,
+    d.low,
+    d.close,
+    d.volume
+FROM stock_vault_catalog c
+JOIN stock_data d
+    ON d.ticker = c.ticker
+    AND d.version = c.version
+WHERE c.ticker = ANY(%(tickers)s::TEXT[])
+    AND d.timestamp BETWEEN %(start_time)s AND %(end_time)s;
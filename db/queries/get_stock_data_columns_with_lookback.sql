@@ -0,0 +1,20 @@
+SELECT (EXTRACT(EPOCH FROM timestamp) * 1000000)::BIGINT, open, high, low, close, volume
+FROM stock_data
+WHERE ticker = %(ticker)s
+    AND version = (SELECT version FROM stock_vault_catalog WHERE ticker = %(ticker)s)
+    -- Start at the lookback-th bar before start_time, or at the first bar if there are fewer
+    AND timestamp >= COALESCE(
+        (
+            SELECT timestamp
+            FROM stock_data
+            WHERE ticker = %(ticker)s
+                AND version = (SELECT version FROM stock_vault_catalog WHERE ticker = %(ticker)s)
+                AND timestamp < %(start_time)s
+            ORDER BY timestamp DESC
+            OFFSET %(lookback)s - 1
+            LIMIT 1
+        ),
+        '-infinity'
+    )
+    AND timestamp <= %(end_time)s
+ORDER BY timestamp;
@@ -0,0 +1,13 @@
+SELECT
+    id,
+    ticker,
+    status,
+    rows_total,
+    rows_deleted,
+    chunks_truncated,
+    attempts,
+    error,
+    created_at,
+    updated_at
+FROM stock_data_deletions
+WHERE id = %s;
@@ -2,6 +2,14 @@ SELECT
     ticker,
     start_time,
     end_time,
-    inserted_at
+    inserted_at,
+    version,
+    row_count,
+    first_bar,
+    last_bar,
+    min_price,
+    max_price,
+    total_volume,
+    size_bytes
 FROM stock_vault_catalog
 WHERE ticker = %s;
\ No newline at end of file
@@ -0,0 +1 @@
+SELECT to_regclass('timescaledb_information.chunks') IS NOT NULL;
\ No newline at end of file
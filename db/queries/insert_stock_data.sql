@@ -1,2 +1,2 @@
-INSERT INTO stock_data (timestamp, ticker, open, high, low, close, volume)
+INSERT INTO stock_data (timestamp, ticker, open, high, low, close, volume, version)
 VALUES %s;
\ No newline at end of file
@@ -0,0 +1,3 @@
+INSERT INTO stock_data_deletions (ticker, min_version, max_version)
+VALUES (%s, %s, %s)
+RETURNING id;
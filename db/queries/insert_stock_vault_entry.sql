@@ -2,7 +2,16 @@ INSERT INTO stock_vault_catalog (
     ticker,
     start_time,
     end_time,
-    inserted_at
+    inserted_at,
+    version,
+    row_count,
+    first_bar,
+    last_bar,
+    min_price,
+    max_price,
+    total_volume,
+    size_bytes
 ) VALUES (
-    %s, %s, %s, NOW()
-);
\ No newline at end of file
+    %s, %s, %s, NOW(), %s, %s, %s, %s, %s, %s, %s, %s
+)
+ON CONFLICT (ticker) DO NOTHING;
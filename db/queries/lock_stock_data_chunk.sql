@@ -0,0 +1,2 @@
+SET LOCAL lock_timeout = %s;
+LOCK TABLE {chunk} IN ACCESS EXCLUSIVE MODE;
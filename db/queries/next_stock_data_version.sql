@@ -0,0 +1 @@
+SELECT nextval('stock_data_version_seq');
\ No newline at end of file
@@ -0,0 +1 @@
+SELECT pg_notify(%s, %s);
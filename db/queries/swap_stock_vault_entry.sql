@@ -0,0 +1,15 @@
+UPDATE stock_vault_catalog
+SET
+    start_time = %s,
+    end_time = %s,
+    inserted_at = NOW(),
+    version = %s,
+    row_count = %s,
+    first_bar = %s,
+    last_bar = %s,
+    min_price = %s,
+    max_price = %s,
+    total_volume = %s,
+    size_bytes = %s
+WHERE ticker = %s
+    AND version = %s;
@@ -0,0 +1 @@
+TRUNCATE {chunk};
\ No newline at end of file
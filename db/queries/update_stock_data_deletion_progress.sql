@@ -0,0 +1,8 @@
+UPDATE stock_data_deletions
+SET
+    rows_total = COALESCE(%s, rows_total),
+    rows_deleted = rows_deleted + %s,
+    chunks_truncated = chunks_truncated + %s,
+    lease_expires_at = NOW() + %s * INTERVAL '1 second',
+    updated_at = NOW()
+WHERE id = %s;
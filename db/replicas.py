@@ -0,0 +1,179 @@
+'''
+Routing of read-only connections to read replicas.
+
+Replicas are listed in `[replicas] dsns`. Reads that ask for a read-only
+connection (catalog and stock data queries) borrow one from a replica chosen
+round-robin or by fewest connections in use; imports, deletions and
+everything else stay on the primary.
+
+- A replica whose pool is exhausted is passed over for this read, without
+  waiting (`[replicas] pool_timeout`), for the next replica or the primary.
+- A replica that cannot be connected to is skipped for `retry_after`
+  seconds, and the read falls back to the next replica or the primary.
+- Freshness guard: for `freshness_window` seconds after a ticker changes
+  (an import or delete in this process, or one announced by another process
+  over LISTEN/NOTIFY), its reads go to the primary. This covers both the
+  client that has just imported a ticker and the cache, which must not be
+  refilled from a replica that has not replayed the change yet.
+'''
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+from app.metrics import DB_READ_ROUTES
+
+logger = logging.getLogger('elginvault.replicas')
+
+STRATEGIES = ('round_robin', 'least_connections')
+
+
+def parse_replica_dsns(value: Optional[str], primary_params: dict) -> list[dict]:
+    '''
+    Parses a comma-separated list of DSNs (libpq key=value strings or
+    postgresql:// URIs) into connection parameters. Parameters a DSN leaves
+    out (user, password, dbname, ...) are taken from the primary's.
+    '''
+    replicas = []
+    for dsn in (value or '').split(','):
+        dsn = dsn.strip()
+        if dsn:
+            replicas.append({**primary_params, **psycopg2.extensions.parse_dsn(dsn)})
+    return replicas
+
+
+class Replica:
+    '''
+    One replica and its connection pool, created on first use so that an
+    unreachable replica does not keep the app from starting.
+    '''
+
+    def __init__(self, name: str, params: dict, pool_factory: Callable):
+        self.name = name
+        self.params = params
+        self.down_until = 0.0
+        self.in_use = 0
+        self._pool_factory = pool_factory
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._pool_factory(self.params)
+            pool = self._pool
+        conn = pool.getconn()
+        with self._lock:
+            self.in_use += 1
+        return conn
+
+    def putconn(self, conn):
+        with self._lock:
+            self.in_use -= 1
+            pool = self._pool
+        if pool is not None:
+            pool.putconn(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.closeall()
+
+
+class ReplicaRouter:
+    '''
+    Chooses the replica for a read-only connection, if any.
+    '''
+
+    def __init__(
+        self,
+        replicas: list[Replica],
+        strategy: str = 'round_robin',
+        retry_after: float = 30.0,
+        freshness_window: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f'Unknown replica strategy {strategy!r}; expected one of {STRATEGIES}.')
+        self.replicas = replicas
+        self.strategy = strategy
+        self.retry_after = retry_after
+        self.freshness_window = freshness_window
+        self._clock = clock
+        self._next = itertools.count()
+        self._written = {}
+        self._last_write = float('-inf')
+        self._lock = threading.Lock()
+
+    def mark_written(self, ticker: str):
+        if not self.freshness_window:
+            return
+        now = self._clock()
+        with self._lock:
+            self._written[ticker] = now
+            self._last_write = now
+            # Forget tickers whose window is over
+            if len(self._written) > 1024:
+                cutoff = now - self.freshness_window
+                self._written = {t: at for t, at in self._written.items() if at > cutoff}
+
+    def needs_primary(self, ticker: Optional[str] = None) -> bool:
+        '''
+        True while `ticker` (or, with no ticker, any ticker) changed within
+        the freshness window.
+        '''
+        if not self.freshness_window:
+            return False
+        with self._lock:
+            written = self._last_write if ticker is None else self._written.get(ticker)
+        return written is not None and self._clock() - written < self.freshness_window
+
+    def candidates(self) -> list[Replica]:
+        now = self._clock()
+        available = [r for r in self.replicas if r.down_until <= now]
+        if self.strategy == 'least_connections':
+            return sorted(available, key=lambda r: r.in_use)
+        if not available:
+            return []
+        start = next(self._next) % len(available)
+        return available[start:] + available[:start]
+
+    def getconn(self, ticker: Optional[str] = None):
+        '''
+        Returns (replica, connection) for a read, or (None, None) when the
+        read should use the primary.
+        '''
+        if not self.replicas:
+            return None, None
+        if self.needs_primary(ticker):
+            DB_READ_ROUTES.inc(target='primary', reason='freshness')
+            return None, None
+        for replica in self.candidates():
+            try:
+                conn = replica.getconn()
+            except psycopg2.pool.PoolError as e:
+                # Busy, not down: the next read may find a free connection
+                logger.debug(f'Replica {replica.name} is saturated: {e}')
+                continue
+            except psycopg2.OperationalError as e:
+                replica.down_until = self._clock() + self.retry_after
+                logger.warning(
+                    f'Replica {replica.name} unavailable, skipping it for {self.retry_after}s: {e}'
+                )
+                continue
+            DB_READ_ROUTES.inc(target=replica.name, reason='replica')
+            return replica, conn
+        DB_READ_ROUTES.inc(target='primary', reason='fallback')
+        return None, None
+
+    def close(self):
+        for replica in self.replicas:
+            replica.close()
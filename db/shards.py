@@ -0,0 +1,88 @@
+'''
+Ticker-hash sharding across database nodes.
+
+`[shards] nodes` names the nodes; each one's connection parameters are in
+`<name>_dsn` (parameters it leaves out come from `[database]`) and its read
+replicas, if any, in `<name>_replicas`. Every node has the full schema. A
+ticker's rows, catalog entry and deletion jobs all live on its owner node,
+so imports and swaps stay single-node transactions. Listing the catalog is a
+scatter-gather over all nodes.
+
+The owner is chosen by rendezvous (highest random weight) hashing: each node
+scores hash(node, ticker) and the highest score wins. The hash is stable
+across processes and Python versions, and adding a node only moves the
+tickers the new node now wins, about 1/n of them.
+
+While tickers are being moved to a new node (see app/rebalance.py), list
+the old node set in `previous_nodes`: a ticker whose owner changed is read
+from its previous owner until it has been copied to the new one.
+'''
+import hashlib
+from typing import Optional
+
+from app.config import get_setting
+
+DEFAULT_NODE = 'default'
+
+
+def _node_list(value: Optional[str]) -> list[str]:
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def _score(node: str, ticker: str) -> int:
+    digest = hashlib.blake2b(f'{node}\0{ticker}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class ShardMap:
+    '''
+    Maps tickers to the node that owns them.
+    '''
+
+    def __init__(self, nodes: list[str], previous_nodes: Optional[list[str]] = None):
+        if not nodes:
+            raise ValueError('At least one database node is required.')
+        if len(set(nodes)) != len(nodes):
+            raise ValueError(f'Duplicate database node names: {nodes}.')
+        self.nodes = list(nodes)
+        self.previous_nodes = list(previous_nodes) if previous_nodes else None
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.nodes) > 1 or self.previous_nodes is not None
+
+    @property
+    def all_nodes(self) -> list[str]:
+        '''
+        Current nodes, followed by nodes that are only in previous_nodes.
+        '''
+        extra = [n for n in self.previous_nodes or () if n not in self.nodes]
+        return self.nodes + extra
+
+    def owner(self, ticker: str) -> str:
+        return max(self.nodes, key=lambda node: _score(node, ticker))
+
+    def previous_owner(self, ticker: str) -> Optional[str]:
+        '''
+        The ticker's owner before the rebalance in progress, if it differs.
+        '''
+        if not self.previous_nodes:
+            return None
+        previous = max(self.previous_nodes, key=lambda node: _score(node, ticker))
+        return previous if previous != self.owner(ticker) else None
+
+
+def load_shard_map() -> ShardMap:
+    nodes = _node_list(get_setting('shards', 'nodes', ''))
+    previous = _node_list(get_setting('shards', 'previous_nodes', ''))
+    return ShardMap(nodes or [DEFAULT_NODE], previous or None)
+
+
+def node_settings(name: str) -> tuple[Optional[str], Optional[str]]:
+    '''
+    Returns the node's (dsn, replica dsns) settings. The default node uses
+    [database] and [replicas].
+    '''
+    if name == DEFAULT_NODE:
+        return None, get_setting('replicas', 'dsns', '')
+    return get_setting('shards', f'{name}_dsn', ''), get_setting('shards', f'{name}_replicas', '')
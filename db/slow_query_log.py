@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timezone
+
+from app.config import get_setting
+
+logger = logging.getLogger('elginvault.slow_query')
+
+MAX_PARAMS_LENGTH = 500
+
+_settings = None
+_explain_lock = threading.Lock()
+
+
+class SlowQuerySettings:
+    def __init__(self, threshold_ms: float, explain_sample_rate: float, explain_log: str):
+        self.threshold_seconds = threshold_ms / 1000
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_log = explain_log
+
+
+def get_slow_query_settings() -> SlowQuerySettings:
+    global _settings
+    if _settings is None:
+        _settings = SlowQuerySettings(
+            threshold_ms=get_setting('slow_query', 'threshold_ms', 500.0, float),
+            explain_sample_rate=get_setting('slow_query', 'explain_sample_rate', 0.0, float),
+            explain_log=get_setting(
+                'slow_query', 'explain_log', 'logs/slow_query_plans.jsonl'
+            ),
+        )
+    return _settings
+
+
+def configure_slow_query_log(
+    threshold_ms: float = None, explain_sample_rate: float = None, explain_log: str = None
+):
+    '''
+    Overrides the slow-query settings at runtime (e.g. from tests or a shell).
+    '''
+    settings = get_slow_query_settings()
+    if threshold_ms is not None:
+        settings.threshold_seconds = threshold_ms / 1000
+    if explain_sample_rate is not None:
+        settings.explain_sample_rate = explain_sample_rate
+    if explain_log is not None:
+        settings.explain_log = explain_log
+
+
+def summarize_params(params, bulk: bool = False) -> str:
+    if params is None:
+        return 'None'
+    if bulk:
+        return f'<{len(params)} rows>'
+    text = repr(params)
+    if len(text) > MAX_PARAMS_LENGTH:
+        text = text[:MAX_PARAMS_LENGTH] + '...'
+    return text
+
+
+def is_explainable(sql) -> bool:
+    '''
+    Only plain reads are re-run under EXPLAIN ANALYZE, which executes the
+    statement; repeating an INSERT or DELETE would apply it twice.
+    '''
+    return str(sql).lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+def check_slow_query(conn, sql, params, seconds: float, rows: int, bulk: bool = False):
+    '''
+    Logs the statement if it took longer than the configured threshold and,
+    for a sampled fraction of slow reads, captures its execution plan.
+    '''
+    settings = get_slow_query_settings()
+    if seconds < settings.threshold_seconds:
+        return
+    name = getattr(sql, 'name', 'inline')
+    logger.warning(
+        'Slow query %s took %.1f ms (%s rows) params=%s',
+        name,
+        seconds * 1000,
+        rows,
+        summarize_params(params, bulk),
+    )
+    if (
+        settings.explain_sample_rate > 0
+        and not bulk
+        and is_explainable(sql)
+        and random.random() < settings.explain_sample_rate
+    ):
+        capture_explain(conn, sql, params, name, seconds, rows, settings.explain_log)
+
+
+def capture_explain(conn, sql, params, name: str, seconds: float, rows: int, path: str):
+    '''
+    Re-runs the statement under EXPLAIN (ANALYZE, BUFFERS) and appends the
+    JSON plan to the explain log. Runs inside a savepoint so a failing
+    EXPLAIN cannot abort the caller's transaction.
+    '''
+    use_savepoint = not conn.autocommit
+    try:
+        with conn.cursor() as cursor:
+            if use_savepoint:
+                cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                cursor.execute(
+                    'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + str(sql), params
+                )
+                plan = cursor.fetchone()[0]
+            except Exception:
+                if use_savepoint:
+                    cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                raise
+            if use_savepoint:
+                cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+    except Exception as e:
+        logger.info('Could not capture plan for %s: %s', name, e)
+        return
+
+    entry = {
+        'logged_at': datetime.now(timezone.utc).isoformat(),
+        'query': name,
+        'duration_ms': round(seconds * 1000, 3),
+        'rows': rows,
+        'params': summarize_params(params),
+        'plan': plan,
+    }
+    directory = os.path.dirname(path)
+    with _explain_lock:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
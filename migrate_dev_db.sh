@@ -60,7 +60,7 @@ update_env_dbname() {
     sed -i "s/^DB_DBNAME=.*/DB_DBNAME=$dbname/" .env
 }
 
-# Function to run create_tables.sql using psql
+# Function to create the database and apply the migrations
 run_create_tables() {
     local dbname=$1
 
@@ -71,10 +71,11 @@ run_create_tables() {
     PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -p $DB_PORT -U $DB_USER -d postgres -c "DROP DATABASE IF EXISTS $dbname;"
     PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -p $DB_PORT -U $DB_USER -d postgres -c "CREATE DATABASE $dbname;"
 
-    # Apply the create_tables.sql file to the new database
-    PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -p $DB_PORT -U $DB_USER -d $dbname -f db/migrations/create_tables.sql
+    # Apply create_tables.sql and the numbered migrations to the new database
+    DB_HOST=$DB_HOST DB_PORT=$DB_PORT DB_USER=$DB_USER DB_PASSWORD=$DB_PASSWORD DB_DBNAME=$dbname \
+        python -m db.migrate
     if [[ $? -ne 0 ]]; then
-        echo "Error: Failed to apply create_tables.sql."
+        echo "Error: Failed to apply migrations."
         exit 1
     fi
     echo "Database $dbname created and tables initialized successfully."
@@ -1,4 +1,5 @@
 import requests
+import gzip
 import os
 
 
@@ -32,7 +33,9 @@ def delete_stock_vault_ticker(ticker):
     return res.json()
 
 
-def import_stock_vault(ticker, start_time: str, end_time: str, csv_file: str):
+def import_stock_vault(
+    ticker, start_time: str, end_time: str, csv_file: str, compress: bool = True
+):
     if not ticker:
         raise ValueError('Ticker is required.')
     if not start_time or not end_time:
@@ -44,6 +47,15 @@ def import_stock_vault(ticker, start_time: str, end_time: str, csv_file: str):
         raise FileNotFoundError(f'CSV file: {csv_file} does not exist.')
 
     with open(csv_file, 'rb') as file:
+        if compress:
+            # CSVs shrink 5-10x with gzip; the server inflates them while parsing
+            upload = (
+                f'{os.path.basename(csv_file)}.gz',
+                gzip.compress(file.read(), compresslevel=6),
+                'application/gzip',
+            )
+        else:
+            upload = file
         res = requests.post(
             apiurls['import_stockvault_ticker_timerange'](baseurl),
             data={
@@ -51,7 +63,7 @@ def import_stock_vault(ticker, start_time: str, end_time: str, csv_file: str):
                 'start_time': start_time,
                 'end_time': end_time,
             },
-            files={'csv_file': file},
+            files={'csv_file': upload},
         )
         res.raise_for_status()
         return res.json()
@@ -2,6 +2,7 @@ import os
 import pytest
 import psycopg2
 from db.connection import get_db_params, get_db_connection, close_db_connection
+from db.migrate import apply_migrations
 
 TEST_DB_NAME = 'test_db'
 
@@ -46,10 +47,7 @@ def setup_testing_databse():
             assert os.getenv('DB_DBNAME') == TEST_DB_NAME, f'DB_DBNAME should be set to {TEST_DB_NAME}'
             test_conn = get_db_connection()
             try:
-                with test_conn.cursor() as test_cursor:
-                    with open('db/migrations/create_tables.sql', 'r') as f:
-                        test_cursor.execute(f.read())
-                    test_conn.commit()
+                apply_migrations(test_conn)
             finally:
                 close_db_connection(test_conn)
     finally:
@@ -1,3 +1,8 @@
+import json
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
 import pytest
 from db.connection import get_db_connection, close_db_connection
 from db.queries import load_sql_query, execute_nonquery, fetch_query_results
@@ -95,4 +100,708 @@ def test_all_tables_exist():
                 result = cursor.fetchone()
                 assert result is not None, f'Table ''{table}'' is missing in the database'
     finally:
-        close_db_connection(conn)
\ No newline at end of file
+        close_db_connection(conn)
+
+@pytest.mark.integration
+def test_slow_query_explain_capture(tmp_path):
+    from db.slow_query_log import configure_slow_query_log, get_slow_query_settings
+
+    settings = get_slow_query_settings()
+    saved = vars(settings).copy()
+    explain_log = tmp_path / 'plans.jsonl'
+    configure_slow_query_log(threshold_ms=0, explain_sample_rate=1.0, explain_log=str(explain_log))
+    conn = get_db_connection()
+    try:
+        sql = load_sql_query('db/queries/get_stock_data_by_ticker_and_time_range.sql')
+        fetch_query_results(
+            conn, sql, {'ticker': 'AAPL', 'start_time': '2023-01-01', 'end_time': '2023-01-02'}
+        )
+        # The EXPLAIN runs in a savepoint, so the connection is still usable
+        assert fetch_query_results(conn, 'SELECT 1;') == [(1,)]
+    finally:
+        vars(settings).update(saved)
+        close_db_connection(conn)
+    entry = json.loads(explain_log.read_text().splitlines()[0])
+    assert entry['query'] == 'get_stock_data_by_ticker_and_time_range'
+    assert 'Plan' in entry['plan'][0]
+
+@pytest.mark.integration
+def test_cache_invalidation_over_notify():
+    from app.cache import InvalidationListener, VaultCache
+    from app.services.stock_vault_services import publish_vault_change
+
+    cache = VaultCache()
+    listener = InvalidationListener(cache, poll_interval=0.1)
+    listener.start()
+    try:
+        assert listener.connected.wait(5), 'Listener did not connect'
+        cache.set('catalog', 'NOTIFY', 'cached', ticker='NOTIFY')
+        conn = get_db_connection()
+        try:
+            publish_vault_change(conn, 'import', 'NOTIFY', '2023-01-01', '2023-01-31')
+            # NOTIFY is only delivered once the transaction commits
+            conn.commit()
+        finally:
+            close_db_connection(conn)
+        for _ in range(50):
+            if cache.get('catalog', 'NOTIFY') is None:
+                break
+            listener.join(0.1)
+        assert cache.get('catalog', 'NOTIFY') is None
+    finally:
+        listener.stop()
+        listener.join(5)
+
+@pytest.fixture(scope='function')
+def db_pool():
+    from db.connection import close_db_pool
+
+    yield
+    # Pooled connections would keep the test database from being dropped
+    close_db_pool()
+
+@pytest.mark.integration
+def test_statement_timeout_is_local_to_the_block(db_pool):
+    import psycopg2
+    from db.connection import db_connection
+
+    with db_connection(statement_timeout=50) as conn:
+        with pytest.raises(psycopg2.extensions.QueryCanceledError):
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT pg_sleep(2);')
+    # SET LOCAL ended with the transaction: the pooled connection is clean again
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout;')
+            assert cursor.fetchone()[0] == '0'
+
+@pytest.mark.integration
+def test_query_cancellation_from_another_thread(db_pool):
+    import threading
+    import time
+    import psycopg2
+    from db.connection import QueryCancellation, db_connection
+
+    cancellation = QueryCancellation()
+    errors = []
+
+    def run_query():
+        try:
+            with db_connection(cancellation=cancellation) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT pg_sleep(10);')
+        except psycopg2.extensions.QueryCanceledError as e:
+            errors.append(e)
+
+    worker = threading.Thread(target=run_query)
+    start = time.perf_counter()
+    worker.start()
+    time.sleep(0.3)
+    cancellation.cancel()
+    worker.join(timeout=5)
+    assert not worker.is_alive()
+    assert errors and time.perf_counter() - start < 5
+    # Once cancelled, new queries are refused before they start
+    with pytest.raises(psycopg2.extensions.QueryCanceledError):
+        with db_connection(cancellation=cancellation):
+            pass
+
+def _swap_bars(close, count, ticker='SWAP'):
+    from app.bars import StockBars
+
+    return StockBars.from_db_rows(ticker, [
+        (1672531200000000 + i * 60_000_000, 1.0, 2.0, 0.5, close, 10) for i in range(count)
+    ])
+
+def _stored_versions(ticker):
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                'SELECT version, count(*) FROM stock_data WHERE ticker = %s GROUP BY version',
+                (ticker,),
+            )
+            return dict(cursor.fetchall())
+    finally:
+        close_db_connection(conn)
+
+def _run_deletions(**kwargs):
+    from app.deletion import DeletionWorker
+
+    worker = DeletionWorker(**kwargs)
+    while worker.run_next():
+        pass
+
+@pytest.mark.integration
+def test_reimport_swaps_in_new_version(db_pool):
+    from app.services.stock_vault_services import (
+        import_stock_vault,
+        import_stock_vault_columns,
+        query_stock_vault_data,
+        remove_stock_vault,
+    )
+
+    try:
+        import_stock_vault('SWAP', '2023-01-01', '2023-01-02', _swap_bars(1.0, 5))
+        [first_version] = _stored_versions('SWAP')
+
+        def reimport_batches():
+            # While the reimport is loading, readers still see the old rows
+            yield _swap_bars(2.0, 3)
+            bars = list(query_stock_vault_data('SWAP', '2023-01-01', '2023-01-02'))
+            assert sum(len(b) for b in bars) == 5
+            assert set(bars[0].close.tolist()) == {1.0}
+
+        assert import_stock_vault_columns('SWAP', '2023-01-01', '2023-01-02', reimport_batches()) == 3
+        bars = list(query_stock_vault_data('SWAP', '2023-01-01', '2023-01-02'))
+        assert sum(len(b) for b in bars) == 3
+        assert set(bars[0].close.tolist()) == {2.0}
+        # The replaced version is deleted in the background
+        assert first_version in _stored_versions('SWAP')
+        _run_deletions()
+        versions = _stored_versions('SWAP')
+        assert list(versions.values()) == [3]
+        assert first_version not in versions
+    finally:
+        remove_stock_vault('SWAP')
+
+@pytest.mark.integration
+def test_reimport_conflict_discards_staged_rows(db_pool):
+    from app.services.stock_vault_services import (
+        import_stock_vault,
+        import_stock_vault_columns,
+        remove_stock_vault,
+    )
+
+    import_stock_vault('SWAP', '2023-01-01', '2023-01-02', _swap_bars(1.0, 5))
+
+    def batches():
+        yield _swap_bars(2.0, 3)
+        # Another request deletes the ticker while the reimport is loading
+        remove_stock_vault('SWAP')
+
+    with pytest.raises(ValueError, match='changed by another request'):
+        import_stock_vault_columns('SWAP', '2023-01-01', '2023-01-02', batches())
+    _run_deletions()
+    assert _stored_versions('SWAP') == {}
+
+@pytest.mark.integration
+def test_remove_hides_ticker_and_deletes_rows_in_batches(db_pool):
+    from app.services.stock_vault_services import (
+        import_stock_vault,
+        query_stock_vault_catalog_ticker,
+        query_stock_vault_data,
+        query_stock_vault_deletion,
+        remove_stock_vault,
+    )
+
+    import_stock_vault('SWAP', '2023-01-01', '2023-01-02', _swap_bars(1.0, 25))
+    deletion_id = remove_stock_vault('SWAP')['deletion_id']
+    # Readers stop seeing the ticker before its rows are gone
+    assert query_stock_vault_catalog_ticker('SWAP') is None
+    assert list(query_stock_vault_data('SWAP', '2023-01-01', '2023-01-02')) == []
+    assert _stored_versions('SWAP') != {}
+    assert query_stock_vault_deletion(deletion_id).status == 'pending'
+
+    _run_deletions(batch_size=10, truncate_chunks=False)
+    assert _stored_versions('SWAP') == {}
+    deletion = query_stock_vault_deletion(deletion_id)
+    assert deletion.status == 'completed'
+    assert (deletion.rows_total, deletion.rows_deleted) == (25, 25)
+    assert deletion.chunks_truncated == 0
+
+@pytest.mark.integration
+def test_deletion_batches_are_bounded_across_overlapping_versions(db_pool):
+    from app.repositories.stock_data_deletion_repository import delete_vault_data_batch
+    from db.connection import db_connection
+
+    # Two leftover versions of the same five timestamps
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO stock_data (timestamp, ticker, open, high, low, close, volume, version)
+                SELECT '2023-01-01'::timestamp + i * interval '1 minute', 'OVLP', 1, 1, 1, 1, 1, v
+                FROM generate_series(0, 4) i, generate_series(1, 2) v
+                '''
+            )
+        conn.commit()
+    try:
+        deleted = []
+        while True:
+            with db_connection() as conn:
+                count = delete_vault_data_batch(conn, 'OVLP', 0, 2, 3)
+                conn.commit()
+            if not count:
+                break
+            deleted.append(count)
+        assert deleted == [3, 3, 3, 1]
+        assert _stored_versions('OVLP') == {}
+    finally:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM stock_data WHERE ticker = 'OVLP'")
+            conn.commit()
+
+@pytest.mark.integration
+def test_indicators_read_history_before_the_range(db_pool):
+    from datetime import datetime
+    from app.bars import StockBars
+    from app.indicators import parse_indicators
+    from app.services.stock_vault_services import (
+        import_stock_vault,
+        query_stock_vault_indicators,
+        remove_stock_vault,
+    )
+
+    # Closes 1..100, one bar a minute from 2023-01-01 00:00
+    import_stock_vault('IND', '2023-01-01', '2023-01-02', StockBars.from_db_rows('IND', [
+        (1672531200000000 + i * 60_000_000, i + 1.0, i + 1.0, i + 1.0, i + 1.0, 10)
+        for i in range(100)
+    ]))
+    try:
+        batches = list(query_stock_vault_indicators(
+            'IND',
+            datetime(2023, 1, 1, 1, 0),
+            datetime(2023, 1, 2),
+            parse_indicators('sma:10,returns:60'),
+        ))
+        timestamps, columns = batches[0]
+        assert len(timestamps) == 40
+        assert timestamps[0] == np.datetime64('2023-01-01T01:00')
+        # Bar 60 (close 61) averages closes 52..61
+        assert columns['sma_10'][0] == 56.5
+        assert columns['returns_60'][0] == 61.0 / 1.0 - 1
+    finally:
+        remove_stock_vault('IND')
+        _run_deletions()
+
+
+@pytest.mark.integration
+def test_snapshot_follows_imports_and_removals(db_pool):
+    from app.services.stock_vault_services import import_stock_vault, remove_stock_vault
+    from app.snapshot import LatestBars, latest_bars
+
+    import_stock_vault('SNAP', '2023-01-01', '2023-01-02', _swap_bars(1.0, 5, 'SNAP'))
+    try:
+        # Built from the database like at startup
+        fresh = LatestBars()
+        [record], missing = fresh.snapshot(['SNAP', 'NOSUCH'])
+        assert json.loads(record) == {
+            'timestamp': '2023-01-01T00:04:00', 'ticker': 'SNAP',
+            'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.0, 'volume': 10,
+        }
+        assert missing == ['NOSUCH']
+
+        # The import's invalidation marks the ticker stale in the shared
+        # table, and the refresher (run inline here) re-reads it
+        latest_bars.snapshot(['SNAP'])
+        import_stock_vault('SNAP', '2023-01-01', '2023-01-02', _swap_bars(3.0, 8, 'SNAP'))
+        assert latest_bars.pending
+        latest_bars.refresh()
+        [record], _ = latest_bars.snapshot(['SNAP'])
+        assert json.loads(record)['timestamp'] == '2023-01-01T00:07:00'
+        assert json.loads(record)['close'] == 3.0
+    finally:
+        remove_stock_vault('SNAP')
+        _run_deletions()
+    latest_bars.refresh()
+    assert latest_bars.snapshot(['SNAP']) == ([], ['SNAP'])
+
+
+@pytest.mark.integration
+def test_matrix_aligns_tickers_read_in_one_query(db_pool):
+    from app.services.stock_vault_services import (
+        import_stock_vault,
+        query_stock_vault_matrix,
+        remove_stock_vault,
+    )
+
+    import_stock_vault('MXA', '2023-01-01', '2023-01-02', _swap_bars(1.0, 3, 'MXA'))
+    import_stock_vault('MXB', '2023-01-01', '2023-01-02', _swap_bars(2.0, 5, 'MXB'))
+    try:
+        matrix = query_stock_vault_matrix(
+            ['MXB', 'MXA'], '2023-01-01', '2023-01-02', ['close'], 'ffill'
+        )
+        assert len(matrix) == 5
+        assert list(matrix.columns) == ['close.MXB', 'close.MXA']
+        assert matrix.columns['close.MXA'].tolist() == [1.0] * 5
+        with pytest.raises(ValueError):
+            query_stock_vault_matrix(
+                ['MXA', 'MXB'], '2023-01-01', '2023-01-02', ['close'], max_rows=6
+            )
+    finally:
+        remove_stock_vault('MXA')
+        remove_stock_vault('MXB')
+        _run_deletions()
+
+
+def test_import_maintains_catalog_statistics(db_pool):
+    from app.bars import StockBars
+    from app.services.stock_vault_services import (
+        import_stock_vault,
+        query_stock_vault_catalog_ticker,
+        remove_stock_vault,
+    )
+
+    import_stock_vault('STAT', '2023-01-01', '2023-01-02', _swap_bars(1.0, 3, 'STAT'))
+    try:
+        catalog = query_stock_vault_catalog_ticker('STAT')
+        assert catalog.row_count == 3
+        assert catalog.first_bar == datetime(2023, 1, 1)
+        assert catalog.last_bar == datetime(2023, 1, 1, 0, 2)
+        assert (catalog.min_price, catalog.max_price) == (0.5, 2.0)
+        assert catalog.total_volume == 30
+        assert catalog.size_bytes > 0
+
+        # A reimport replaces the statistics with the new version's
+        import_stock_vault('STAT', '2023-01-01', '2023-01-02', StockBars.from_db_rows('STAT', [
+            (1672531200000000, 1.0, 9.0, 0.25, 5.0, 7),
+        ]))
+        catalog = query_stock_vault_catalog_ticker('STAT')
+        assert (catalog.row_count, catalog.total_volume) == (1, 7)
+        assert (catalog.min_price, catalog.max_price) == (0.25, 9.0)
+    finally:
+        remove_stock_vault('STAT')
+        _run_deletions()
+    assert query_stock_vault_catalog_ticker('STAT') is None
+
+
+@pytest.fixture(scope='function')
+def fake_chunks():
+    '''
+    Stands in for TimescaleDB's chunk catalog with two plain tables shaped
+    like stock_data chunks.
+    '''
+    conn = get_db_connection()
+    try:
+        execute_nonquery(conn, '''
+            CREATE TABLE chunk_a (LIKE stock_data);
+            CREATE TABLE chunk_b (LIKE stock_data);
+            CREATE SCHEMA timescaledb_information;
+            CREATE VIEW timescaledb_information.chunks AS
+            SELECT 'public'::name AS chunk_schema, name AS chunk_name,
+                'stock_data'::name AS hypertable_name, NOW() AS range_start
+            FROM unnest(ARRAY['chunk_a', 'chunk_b']::name[]) AS name;
+        ''')
+        conn.commit()
+        yield conn
+    finally:
+        conn.rollback()
+        execute_nonquery(conn, '''
+            DROP SCHEMA timescaledb_information CASCADE;
+            DROP TABLE chunk_a, chunk_b;
+        ''')
+        conn.commit()
+        close_db_connection(conn)
+
+@pytest.mark.integration
+def test_deletion_truncates_chunks_holding_only_doomed_rows(db_pool, fake_chunks):
+    from app.services.stock_vault_services import query_stock_vault_deletion
+    from app.repositories.stock_data_deletion_repository import insert_vault_data_deletion
+
+    conn = fake_chunks
+    rows = [('2023-01-01', 'GONE', 1.0, 1.0, 1.0, 1.0, 1, 7)] * 3
+    execute_nonquery(conn, 'INSERT INTO chunk_a VALUES %s', rows, bulk=True)
+    # chunk_b also holds another ticker, so it is left to the batched delete
+    execute_nonquery(conn, 'INSERT INTO chunk_b VALUES %s', rows[:1], bulk=True)
+    execute_nonquery(
+        conn, 'INSERT INTO chunk_b VALUES %s',
+        [('2023-01-01', 'KEEP', 1.0, 1.0, 1.0, 1.0, 1, 7)], bulk=True,
+    )
+    deletion_id = insert_vault_data_deletion(conn, 'GONE', 0, 7)
+    conn.commit()
+
+    _run_deletions()
+    assert fetch_query_results(conn, 'SELECT count(*) FROM chunk_a') == [(0,)]
+    assert fetch_query_results(conn, 'SELECT count(*) FROM chunk_b') == [(2,)]
+    deletion = query_stock_vault_deletion(deletion_id)
+    assert deletion.status == 'completed'
+    assert deletion.chunks_truncated == 1
+
+def _explain_stock_data_range(conn):
+    sql = load_sql_query('db/queries/get_stock_data_by_ticker_and_time_range.sql')
+    with conn.cursor() as cursor:
+        cursor.execute(
+            'EXPLAIN ' + sql,
+            {'ticker': 'PLAN7', 'start_time': '2023-01-01', 'end_time': '2023-01-02'},
+        )
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+@pytest.mark.integration
+def test_migrations_are_tracked_and_idempotent():
+    from db.migrate import apply_migrations, get_applied_migrations, load_migrations
+
+    conn = get_db_connection()
+    try:
+        # conftest applied everything; a second run is a no-op
+        assert apply_migrations(conn) == []
+        applied = get_applied_migrations(conn)
+        assert applied == {m.version: m.checksum for m in load_migrations()}
+        rows = fetch_query_results(
+            conn,
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'stock_data';",
+        )
+        indexes = {row[0] for row in rows}
+        assert 'stock_data_ticker_timestamp_idx' in indexes
+        assert 'stock_data_ticker_version_timestamp_ohlcv_idx' in indexes
+        # Superseded by the covering index
+        assert 'stock_data_ticker_version_timestamp_idx' not in indexes
+    finally:
+        close_db_connection(conn)
+
+@pytest.mark.integration
+def test_covering_index_turns_range_reads_into_index_only_scans():
+    conn = get_db_connection()
+    conn.autocommit = True
+    try:
+        rows = [
+            (f'2023-01-01 {hour:02d}:00', f'PLAN{t}', 1.0, 2.0, 0.5, 1.5, 100, 0)
+            for t in range(50) for hour in range(24)
+        ]
+        execute_nonquery(conn, 'INSERT INTO stock_data VALUES %s', rows, bulk=True)
+        execute_nonquery(
+            conn,
+            "INSERT INTO stock_vault_catalog (ticker, start_time, end_time) "
+            "VALUES ('PLAN7', '2023-01-01', '2023-01-02');",
+        )
+        # Marks the pages all-visible, as autovacuum would after a load
+        execute_nonquery(conn, 'VACUUM ANALYZE stock_data;')
+
+        after = _explain_stock_data_range(conn)
+        assert 'Index Only Scan using stock_data_ticker_version_timestamp_ohlcv_idx' in after
+
+        # Before migration 0004: only the key indexes, so every row visits the heap
+        conn.autocommit = False
+        execute_nonquery(conn, 'DROP INDEX stock_data_ticker_version_timestamp_ohlcv_idx;')
+        before = _explain_stock_data_range(conn)
+        conn.rollback()
+        assert 'Index Only Scan' not in before
+        assert 'stock_data_ticker_timestamp_idx' in before
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        execute_nonquery(conn, "DELETE FROM stock_data WHERE ticker LIKE 'PLAN%';")
+        execute_nonquery(conn, "DELETE FROM stock_vault_catalog WHERE ticker = 'PLAN7';")
+        close_db_connection(conn)
+
+REPLICA_DB_NAME = 'test_db_replica'
+SHARD_DB_NAME = 'test_db_shard_b'
+BASELINE_DB_NAME = 'test_db_baseline'
+
+@contextmanager
+def _extra_database(name, migrate=True):
+    '''
+    Creates a second database on the test server, migrated unless `migrate`
+    is False, and yields a connection to it; dropped afterwards.
+    '''
+    import psycopg2
+    from db.connection import close_db_pool, get_db_params
+    from db.migrate import apply_migrations
+
+    admin = get_db_connection()
+    admin.autocommit = True
+    execute_nonquery(admin, f'DROP DATABASE IF EXISTS {name};')
+    execute_nonquery(admin, f'CREATE DATABASE {name};')
+    conn = psycopg2.connect(**{**get_db_params(), 'dbname': name})
+    try:
+        if migrate:
+            apply_migrations(conn)
+        yield conn
+    finally:
+        conn.close()
+        close_db_pool()
+        execute_nonquery(admin, f'DROP DATABASE IF EXISTS {name};')
+        admin.close()
+
+@pytest.mark.integration
+def test_migrations_upgrade_a_database_built_from_the_baseline():
+    '''
+    A database deployed from create_tables.sql before migrations were
+    tracked is adopted, and the numbered migrations bring it and its data
+    up to date.
+    '''
+    import os
+    from db.migrate import (
+        BASELINE,
+        MIGRATIONS_DIR,
+        apply_migrations,
+        get_applied_migrations,
+        load_migrations,
+    )
+
+    with _extra_database(BASELINE_DB_NAME, migrate=False) as conn:
+        conn.autocommit = True
+        with open(os.path.join(MIGRATIONS_DIR, BASELINE)) as f, conn.cursor() as cursor:
+            cursor.execute(f.read())
+        execute_nonquery(
+            conn,
+            "INSERT INTO stock_vault_catalog (ticker, start_time, end_time) "
+            "VALUES ('OLD', '2023-01-01', '2023-01-02');",
+        )
+        execute_nonquery(
+            conn, 'INSERT INTO stock_data VALUES %s',
+            [
+                ('2023-01-01 10:00', 'OLD', 1.0, 2.0, 0.5, 1.5, 100),
+                ('2023-01-01 11:00', 'OLD', 1.5, 3.0, 1.0, 2.5, 200),
+            ],
+            bulk=True,
+        )
+
+        versions = [m.version for m in load_migrations()]
+        assert apply_migrations(conn) == versions[1:]
+        assert sorted(get_applied_migrations(conn)) == versions
+
+        # Rows loaded before versioning are still what readers see
+        rows = fetch_query_results(
+            conn,
+            load_sql_query('db/queries/get_stock_data_columns_by_ticker_and_time_range.sql'),
+            {'ticker': 'OLD', 'start_time': '2023-01-01', 'end_time': '2023-01-02'},
+        )
+        assert len(rows) == 2
+        entry = fetch_query_results(
+            conn, load_sql_query('db/queries/get_stock_vault_entry_by_ticker.sql'), ('OLD',)
+        )[0]
+        assert entry[4] == 0
+        # Catalog statistics were backfilled
+        assert (entry[5], entry[8], entry[9], entry[10]) == (2, 0.5, 3.0, 300)
+        assert fetch_query_results(conn, "SELECT nextval('stock_data_version_seq');")[0][0] > 0
+        assert fetch_query_results(conn, 'SELECT COUNT(*) FROM stock_data_deletions;') == [(0,)]
+        assert apply_migrations(conn) == []
+
+@pytest.fixture(scope='function')
+def replica_db(monkeypatch):
+    '''
+    A second database standing in for a read replica. It holds rows the
+    primary does not have, so a read shows where it was served from.
+    '''
+    from db.connection import close_db_pool
+
+    with _extra_database(REPLICA_DB_NAME) as replica:
+        execute_nonquery(
+            replica,
+            "INSERT INTO stock_vault_catalog (ticker, start_time, end_time) "
+            "VALUES ('REPL', '2023-01-01', '2023-01-02');",
+        )
+        execute_nonquery(
+            replica, 'INSERT INTO stock_data VALUES %s',
+            [('2023-01-01 10:00', 'REPL', 1.0, 2.0, 0.5, 1.5, 100, 0)], bulk=True,
+        )
+        monkeypatch.setenv('REPLICAS_DSNS', f'dbname={REPLICA_DB_NAME}')
+        close_db_pool()
+        yield
+
+def _repl_rows():
+    from app.services.stock_vault_services import query_stock_vault_data
+
+    return sum(len(b) for b in query_stock_vault_data('REPL', '2023-01-01', '2023-01-02'))
+
+@pytest.mark.integration
+def test_reads_are_served_by_replica(replica_db):
+    from db.connection import db_connection
+
+    assert _repl_rows() == 1
+    # Writes (no read_only) stay on the primary
+    with db_connection() as conn:
+        assert fetch_query_results(conn, 'SELECT current_database();') == [(TEST_DB_NAME,)]
+
+@pytest.mark.integration
+def test_recently_written_ticker_is_read_from_primary(replica_db):
+    from db.connection import mark_ticker_written
+
+    mark_ticker_written('REPL')
+    assert _repl_rows() == 0
+
+@pytest.mark.integration
+def test_unreachable_replica_falls_back_to_primary(replica_db, monkeypatch):
+    from db.connection import close_db_pool, get_replica_router
+
+    monkeypatch.setenv('REPLICAS_DSNS', 'dbname=no_such_replica')
+    close_db_pool()
+    assert _repl_rows() == 0
+    [replica] = get_replica_router().replicas
+    assert replica.down_until > 0
+
+def _use_shards(monkeypatch, nodes, previous_nodes=''):
+    from db.connection import close_db_pool
+
+    monkeypatch.setenv('SHARDS_NODES', nodes)
+    monkeypatch.setenv('SHARDS_PREVIOUS_NODES', previous_nodes)
+    close_db_pool()
+
+def _tickers_owned_by(node, count):
+    from db.shards import ShardMap
+
+    shard_map = ShardMap(['a', 'b'])
+    return [t for t in (f'SH{i}' for i in range(100)) if shard_map.owner(t) == node][:count]
+
+def _catalog_tickers(node):
+    from db.connection import db_connection
+
+    with db_connection(node=node) as conn:
+        rows = fetch_query_results(
+            conn, "SELECT ticker FROM stock_vault_catalog WHERE ticker LIKE 'SH%';"
+        )
+        return {row[0] for row in rows}
+
+@pytest.fixture(scope='function')
+def two_shards(monkeypatch):
+    '''
+    Node "a" is the test database, node "b" a second one on the same server.
+    '''
+    monkeypatch.setenv('SHARDS_A_DSN', f'dbname={TEST_DB_NAME}')
+    monkeypatch.setenv('SHARDS_B_DSN', f'dbname={SHARD_DB_NAME}')
+    monkeypatch.setenv('CACHE_ENABLED', 'false')
+    with _extra_database(SHARD_DB_NAME):
+        _use_shards(monkeypatch, 'a,b')
+        yield
+        from app.services.stock_vault_services import remove_stock_vault
+
+        _use_shards(monkeypatch, 'a,b')
+        for ticker in _catalog_tickers('a') | _catalog_tickers('b'):
+            remove_stock_vault(ticker)
+        _run_deletions()
+
+@pytest.mark.integration
+def test_sharded_imports_and_scatter_gather_catalog(two_shards):
+    from app.services.stock_vault_services import (
+        fetch_stock_vault_catalog_list,
+        import_stock_vault,
+        query_stock_vault_data,
+    )
+
+    [on_a] = _tickers_owned_by('a', 1)
+    [on_b] = _tickers_owned_by('b', 1)
+    for ticker, count in ((on_a, 2), (on_b, 3)):
+        import_stock_vault(ticker, '2023-01-01', '2023-01-02', _swap_bars(1.0, count, ticker))
+    assert _catalog_tickers('a') == {on_a}
+    assert _catalog_tickers('b') == {on_b}
+    # Reads go to the owner node; the list merges both, newest first
+    assert sum(len(b) for b in query_stock_vault_data(on_b, '2023-01-01', '2023-01-02')) == 3
+    listed = [c.ticker for c in fetch_stock_vault_catalog_list()]
+    assert [t for t in listed if t.startswith('SH')] == [on_b, on_a]
+
+@pytest.mark.integration
+def test_rebalance_moves_tickers_to_a_new_node(two_shards, monkeypatch):
+    from app.rebalance import move_ticker, plan_moves
+    from app.services.stock_vault_services import import_stock_vault, query_stock_vault_data
+
+    _use_shards(monkeypatch, 'a')
+    tickers = _tickers_owned_by('b', 2)
+    for ticker in tickers:
+        import_stock_vault(ticker, '2023-01-01', '2023-01-02', _swap_bars(1.0, 4, ticker))
+
+    # Node b is added; until the move, reads fall back to the old owner
+    _use_shards(monkeypatch, 'a,b', previous_nodes='a')
+    assert sum(len(b) for b in query_stock_vault_data(tickers[0], '2023-01-01', '2023-01-02')) == 4
+    moves = [move for move in plan_moves() if move[0].startswith('SH')]
+    assert sorted(moves) == sorted((t, 'a', 'b') for t in tickers)
+    for ticker, source, target in moves:
+        assert move_ticker(ticker, source, target) == 4
+    assert not [move for move in plan_moves() if move[0].startswith('SH')]
+    assert _catalog_tickers('b') >= set(tickers)
+    assert not _catalog_tickers('a') & set(tickers)
+    assert sum(len(b) for b in query_stock_vault_data(tickers[0], '2023-01-01', '2023-01-02')) == 4
+    # The old copies are deleted by node a's deletion jobs
+    _run_deletions()
+    assert _stored_versions(tickers[0]) == {}
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.admission import (
+    AdmissionQueue,
+    AdmissionRejected,
+    admission_queues,
+    classify_request,
+)
+from app.main import app
+from app.metrics import ADMISSION_REJECTED
+
+
+def test_classify_request():
+    assert classify_request('POST', '/stock_vault/import') == 'import'
+    assert classify_request('GET', '/stock_data/AAPL') == 'scan'
+    assert classify_request(
+        'GET', '/stock_data/AAPL', b'start_time=2024-01-01&end_time=2024-01-05'
+    ) == 'light'
+    assert classify_request('GET', '/stock_data/AAPL', b'start_time=bad') == 'light'
+    assert classify_request('GET', '/stock_vault/matrix', b'tickers=A,B') == 'scan'
+    assert classify_request('GET', '/stock_vault/catalog/AAPL') == 'light'
+    assert classify_request('GET', '/metrics') is None
+
+
+def test_queue_hands_slots_over_in_order():
+    async def scenario():
+        queue = AdmissionQueue('scan', limit=1, queue_size=1, timeout=1.0)
+        await queue.acquire()
+        waiter = asyncio.ensure_future(queue.acquire())
+        await asyncio.sleep(0)
+        assert queue.waiting == 1
+        with pytest.raises(AdmissionRejected) as rejected:
+            await queue.acquire()
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+        queue.release(0.5)
+        await waiter
+        assert (queue.active, queue.waiting) == (1, 0)
+        queue.release(0.5)
+        assert queue.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_queue_times_out_waiters():
+    async def scenario():
+        queue = AdmissionQueue('import', limit=1, queue_size=4, timeout=0.01)
+        await queue.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await queue.acquire()
+        assert rejected.value.status_code == 503
+        assert queue.waiting == 0
+        queue.release()
+        assert queue.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_shed_with_retry_after(monkeypatch):
+    queue = AdmissionQueue('light', limit=1, queue_size=0, timeout=1.0)
+    queue.active = 1
+    monkeypatch.setitem(admission_queues, 'light', queue)
+    before = ADMISSION_REJECTED.value(request_class='light', reason='queue_full')
+    with TestClient(app) as client:
+        response = client.get('/task_status/unknown')
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        # /metrics is never held back
+        assert client.get('/metrics').status_code == 200
+    assert ADMISSION_REJECTED.value(request_class='light', reason='queue_full') == before + 1
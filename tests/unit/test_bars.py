@@ -0,0 +1,76 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.bars import StockBars
+from app.models import StockData
+from app.serializers import bars_to_json_records
+
+
+def _bars():
+    return StockBars.from_db_rows('AAPL', [
+        (1672531200000000, 150.0, 155.0, 149.0, 154.0, 1000),
+        (1672531260123000, 154.0, 156.5, 153.0, None, 1200),
+    ])
+
+
+def test_from_db_rows():
+    bars = _bars()
+    assert len(bars) == 2
+    assert bars[0].timestamp == datetime(2023, 1, 1)
+    assert bars[-1].timestamp == datetime(2023, 1, 1, 0, 1, 0, 123000)
+    assert bars[1].ticker == 'AAPL'
+    assert np.isnan(bars[1].close)
+    assert bars.time_range() == (datetime(2023, 1, 1), datetime(2023, 1, 1, 0, 1, 0, 123000))
+    with pytest.raises(IndexError):
+        bars[2]
+
+
+def test_slice_and_concat():
+    bars = _bars()
+    assert len(bars[:1]) == 1
+    joined = StockBars.concat([bars, bars[1:]])
+    assert joined.volume.tolist() == [1000, 1200, 1200]
+    assert len(StockBars.concat([])) == 0
+
+
+def test_from_frame_converts_aware_timestamps_to_utc():
+    df = pd.DataFrame({
+        'timestamp': ['2023-01-01T09:30:00-05:00'],
+        'ticker': ['AAPL'],
+        'open': [1], 'high': [2], 'low': [0.5], 'close': [1.5], 'volume': [10],
+    })
+    bars = StockBars.from_frame(df)
+    assert bars[0].timestamp == datetime(2023, 1, 1, 14, 30)
+    assert bars.to_rows() == [(datetime(2023, 1, 1, 14, 30), 'AAPL', 1.0, 2.0, 0.5, 1.5, 10)]
+
+
+def test_from_frame_rejects_fractional_volume():
+    df = pd.DataFrame({
+        'timestamp': ['2023-01-01'],
+        'ticker': ['AAPL'],
+        'open': [1], 'high': [2], 'low': [0.5], 'close': [1.5], 'volume': [10.5],
+    })
+    with pytest.raises(ValueError, match='volume'):
+        StockBars.from_frame(df)
+
+
+def test_json_records_match_pydantic():
+    bars = StockBars.from_db_rows('A"É', [
+        (1672531200000000, 150.0, 1e16, 0.1, float('inf'), 1000),
+        (1672531260123000, float('nan'), 2.5, 3.0, 4.0, 5),
+    ])
+    records = bars_to_json_records(bars)
+    expected = [
+        StockData.model_construct(
+            timestamp=bar.timestamp, ticker=bar.ticker, open=bar.open, high=bar.high,
+            low=bar.low, close=bar.close, volume=bar.volume,
+        ).model_dump_json()
+        for bar in bars
+    ]
+    assert records == expected
+    assert json.loads(records[1])['open'] is None
+    assert bars_to_json_records(StockBars.empty()) == []
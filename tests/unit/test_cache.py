@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from app.cache import MISSING, VaultCache, apply_change, change_payload
+
+
+def test_get_set_and_negative_entries():
+    cache = VaultCache()
+    assert cache.get('catalog', 'AAPL', MISSING) is MISSING
+    cache.set('catalog', 'AAPL', None, ticker='AAPL')
+    assert cache.get('catalog', 'AAPL', MISSING) is None
+
+
+def test_invalidate_by_ticker_and_range():
+    cache = VaultCache()
+    cache.set('data', ('AAPL', 'jan'), 'jan', ticker='AAPL',
+              start_time='2023-01-01', end_time='2023-01-31')
+    cache.set('data', ('AAPL', 'mar'), 'mar', ticker='AAPL',
+              start_time='2023-03-01', end_time='2023-03-31')
+    cache.set('data', ('MSFT', 'jan'), 'msft', ticker='MSFT',
+              start_time='2023-01-01', end_time='2023-01-31')
+    cache.set('catalog_list', 'all', ['AAPL', 'MSFT'])
+
+    removed = cache.invalidate('AAPL', datetime(2023, 1, 15), datetime(2023, 2, 15))
+    assert removed == 2  # AAPL January and the catalog list
+    assert cache.get('data', ('AAPL', 'jan')) is None
+    assert cache.get('data', ('AAPL', 'mar')) == 'mar'
+    assert cache.get('data', ('MSFT', 'jan')) == 'msft'
+    assert cache.get('catalog_list', 'all') is None
+
+
+def test_stale_generation_is_not_stored():
+    cache = VaultCache()
+    generation = cache.generation
+    cache.invalidate('AAPL')
+    cache.set('catalog', 'AAPL', 'stale', ticker='AAPL', generation=generation)
+    assert cache.get('catalog', 'AAPL') is None
+
+
+def test_unavailable_cache_is_bypassed():
+    cache = VaultCache()
+    cache.available = False
+    cache.set('catalog', 'AAPL', 'value', ticker='AAPL')
+    assert cache.get('catalog', 'AAPL') is None
+
+
+def test_lru_eviction():
+    cache = VaultCache(max_entries=2)
+    for ticker in ('A', 'B', 'C'):
+        cache.set('catalog', ticker, ticker, ticker=ticker)
+    assert cache.get('catalog', 'A') is None
+    assert len(cache) == 2
+
+
+def test_apply_change():
+    cache = VaultCache()
+    cache.set('catalog', 'AAPL', 'value', ticker='AAPL')
+    cache.set('catalog', 'MSFT', 'value', ticker='MSFT')
+    apply_change(change_payload('remove', 'AAPL'), cache)
+    assert cache.get('catalog', 'AAPL') is None
+    assert cache.get('catalog', 'MSFT') == 'value'
+    # Garbage clears everything rather than risk serving stale entries
+    apply_change('not json', cache)
+    assert len(cache) == 0
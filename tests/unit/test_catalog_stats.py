@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from app.bars import StockBars
+from app.catalog_stats import STATS_COLUMNS, BarStatistics, estimate_storage_bytes
+
+
+def test_statistics_accumulate_over_batches():
+    stats = BarStatistics('AAPL')
+    stats.add(StockBars.from_db_rows('AAPL', [
+        (1672531260000000, 150.0, 155.0, 149.0, None, 1000),
+    ]))
+    stats.add(StockBars.empty())
+    stats.add(StockBars.from_db_rows('AAPL', [
+        (1672531200000000, 148.0, 151.0, 147.5, 150.0, 200),
+        (1672531320000000, 154.0, 156.5, 153.0, 156.0, 300),
+    ]))
+    assert stats.row_count == 3
+    assert stats.first_bar == datetime(2023, 1, 1)
+    assert stats.last_bar == datetime(2023, 1, 1, 0, 2)
+    assert (stats.min_price, stats.max_price) == (147.5, 156.5)
+    assert stats.total_volume == 1500
+    assert stats.size_bytes == estimate_storage_bytes('AAPL', 3)
+    assert dict(zip(STATS_COLUMNS, stats.values()))['row_count'] == 3
+
+
+def test_empty_statistics():
+    stats = BarStatistics('AAPL')
+    assert stats.values() == (0, None, None, None, None, 0, 0)
+
+
+def test_storage_estimate_grows_with_ticker_length():
+    assert estimate_storage_bytes('A', 0) == 0
+    assert estimate_storage_bytes('AAPL', 10) == 10 * estimate_storage_bytes('AAPL', 1)
+    assert estimate_storage_bytes('AAPL', 1) < estimate_storage_bytes('A' * 12, 1)
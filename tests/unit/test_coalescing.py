@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pytest
+
+from app.coalescing import QueryCoalescer
+from db.connection import QueryCancellation
+
+KEY = ('stock_data', 'AAPL', '2023-01-01', '2023-01-02', 'json')
+
+
+def _gated_source(calls, gate, chunks=('[', '1', ']')):
+    def source(cancellation):
+        calls.append(cancellation)
+        gate.wait(5)
+        for chunk in chunks:
+            yield chunk, len(chunk)
+
+    return source
+
+
+def _read_in_threads(streams):
+    results = [None] * len(streams)
+
+    def read(i):
+        try:
+            results[i] = [chunk for chunk, _ in streams[i]]
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(len(streams))]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_identical_streams_share_one_query():
+    coalescer = QueryCoalescer()
+    calls, gate = [], threading.Event()
+    source = _gated_source(calls, gate)
+    other_key = ('stock_data', 'MSFT') + KEY[2:]
+    threads, results = _read_in_threads([
+        coalescer.stream(KEY, source, QueryCancellation()),
+        coalescer.stream(KEY, source, QueryCancellation()),
+        coalescer.stream(other_key, source, QueryCancellation()),
+    ])
+    _wait_for(lambda: len(calls) == 2 and coalescer._flights[KEY]._next_id == 2)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [['[', '1', ']']] * 3
+    assert len(calls) == 2
+    # Finished flights are forgotten
+    _wait_for(lambda: len(coalescer) == 0)
+
+
+def test_unstarted_stream_does_not_join():
+    coalescer = QueryCoalescer()
+    calls, gate = [], threading.Event()
+    gate.set()
+    coalescer.stream(KEY, _gated_source(calls, gate), QueryCancellation()).close()
+    assert calls == [] and len(coalescer) == 0
+
+
+def test_sealed_flight_takes_no_new_streams():
+    coalescer = QueryCoalescer()
+    calls, gate = [], threading.Event()
+    source = _gated_source(calls, gate)
+    threads, results = _read_in_threads([coalescer.stream(KEY, source, QueryCancellation())])
+    _wait_for(lambda: len(calls) == 1)
+    coalescer.seal('AAPL')
+    more_threads, more_results = _read_in_threads([
+        coalescer.stream(KEY, source, QueryCancellation())
+    ])
+    _wait_for(lambda: len(calls) == 2)
+    gate.set()
+    for thread in threads + more_threads:
+        thread.join(5)
+    assert results == more_results == [['[', '1', ']']]
+
+
+def test_flight_past_its_buffer_drops_read_chunks():
+    coalescer = QueryCoalescer(max_buffer_bytes=2)
+    calls, gate = [], threading.Event()
+    gate.set()
+    source = _gated_source(calls, gate, chunks=('ab', 'cd', 'ef', 'gh'))
+    first = coalescer.stream(KEY, source, QueryCancellation())
+    assert next(first) == ('ab', 2)
+    assert next(first) == ('cd', 2)
+    # The flight can no longer serve the first chunk, so a new one starts
+    assert [chunk for chunk, _ in coalescer.stream(KEY, source, QueryCancellation())] == [
+        'ab', 'cd', 'ef', 'gh'
+    ]
+    assert [chunk for chunk, _ in first] == ['ef', 'gh']
+    assert len(calls) == 2
+
+
+def test_query_is_cancelled_when_every_stream_leaves():
+    coalescer = QueryCoalescer()
+    calls, gate = [], threading.Event()
+    leader, follower = QueryCancellation(), QueryCancellation()
+    threads, results = _read_in_threads([
+        coalescer.stream(KEY, _gated_source(calls, gate), leader),
+        coalescer.stream(KEY, _gated_source(calls, gate), follower),
+    ])
+    _wait_for(lambda: len(calls) == 1 and coalescer._flights[KEY]._next_id == 2)
+    follower.cancel()
+    threads[1].join(5)
+    assert results[1] == [] and not calls[0].cancelled
+    leader.cancel()
+    threads[0].join(5)
+    assert results[0] == [] and calls[0].cancelled
+    gate.set()
+
+
+def test_flights_wait_for_a_free_producer():
+    coalescer = QueryCoalescer(max_flights=1)
+    calls, gate = [], threading.Event()
+    source = _gated_source(calls, gate)
+    other_key = ('stock_data', 'MSFT') + KEY[2:]
+    abandoned_key = ('stock_data', 'NVDA') + KEY[2:]
+    abandoned = QueryCancellation()
+    threads, results = _read_in_threads([coalescer.stream(KEY, source, QueryCancellation())])
+    _wait_for(lambda: len(calls) == 1)
+    queued_threads, queued_results = _read_in_threads([
+        coalescer.stream(other_key, source, QueryCancellation()),
+        coalescer.stream(abandoned_key, source, abandoned),
+    ])
+    _wait_for(lambda: len(coalescer) == 3)
+    # Leaving a flight that is still waiting for a producer skips its query
+    abandoned.cancel()
+    queued_threads[1].join(5)
+    assert len(calls) == 1
+    gate.set()
+    for thread in threads + queued_threads:
+        thread.join(5)
+    assert results + queued_results == [['[', '1', ']'], ['[', '1', ']'], []]
+    assert len(calls) == 2
+
+
+def test_query_errors_reach_every_stream():
+    coalescer = QueryCoalescer()
+    gate = threading.Event()
+
+    def failing(cancellation):
+        gate.wait(5)
+        yield '[', 0
+        raise RuntimeError('boom')
+
+    threads, results = _read_in_threads([
+        coalescer.stream(KEY, failing, QueryCancellation()),
+        coalescer.stream(KEY, failing, QueryCancellation()),
+    ])
+    _wait_for(lambda: KEY in coalescer._flights and coalescer._flights[KEY]._next_id == 2)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_disabled_coalescer_runs_the_source_directly():
+    coalescer = QueryCoalescer(enabled=False)
+    cancellation = QueryCancellation()
+    calls, gate = [], threading.Event()
+    gate.set()
+    assert list(coalescer.stream(KEY, _gated_source(calls, gate), cancellation)) == [
+        ('[', 1), ('1', 1), (']', 1)
+    ]
+    assert calls == [cancellation]
@@ -0,0 +1,139 @@
+import gzip
+import pytest
+import pandas as pd
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.compression import (
+    CompressionMiddleware,
+    detect_upload_compression,
+    is_supported_csv_upload,
+    negotiate_encoding,
+    open_upload_stream,
+    verify_upload_stream,
+)
+
+CSV_CONTENT = (
+    b'timestamp,ticker,open,high,low,close,volume\n'
+    b'2023-01-01,AAPL,150.0,155.0,149.0,154.0,1000\n'
+    b'2023-01-02,AAPL,152.0,156.0,151.0,155.0,1200\n'
+)
+
+
+def test_is_supported_csv_upload():
+    assert is_supported_csv_upload('data.csv')
+    assert is_supported_csv_upload('data.CSV.GZ')
+    assert is_supported_csv_upload('data.csv.zst')
+    assert not is_supported_csv_upload('data.txt')
+    assert not is_supported_csv_upload('data.gz')
+
+
+def test_detect_upload_compression():
+    assert detect_upload_compression('data.csv', CSV_CONTENT) is None
+    assert detect_upload_compression('data.csv.gz', gzip.compress(CSV_CONTENT)) == 'gzip'
+    # Magic bytes take precedence over a misleading file name
+    assert detect_upload_compression('data.csv', gzip.compress(CSV_CONTENT)) == 'gzip'
+
+
+def test_open_upload_stream_gzip():
+    with open_upload_stream(gzip.compress(CSV_CONTENT), 'gzip') as stream:
+        df = pd.read_csv(stream)
+    assert len(df) == 2
+    assert list(df['ticker']) == ['AAPL', 'AAPL']
+
+
+def test_open_upload_stream_zstd():
+    zstandard = pytest.importorskip('zstandard')
+    content = zstandard.ZstdCompressor().compress(CSV_CONTENT)
+    with open_upload_stream(content, 'zstd') as stream:
+        df = pd.read_csv(stream)
+    assert len(df) == 2
+
+
+def test_verify_upload_stream_accepts_complete_uploads():
+    verify_upload_stream(CSV_CONTENT, None)
+    verify_upload_stream(gzip.compress(CSV_CONTENT), 'gzip')
+    # gzip allows concatenated members
+    verify_upload_stream(gzip.compress(CSV_CONTENT) * 2, 'gzip')
+
+
+def test_verify_upload_stream_rejects_truncated_gzip():
+    content = gzip.compress(CSV_CONTENT * 100)
+    with pytest.raises(ValueError, match='truncated'):
+        verify_upload_stream(content[: len(content) // 2], 'gzip')
+    with pytest.raises(ValueError, match='corrupt'):
+        verify_upload_stream(content[:10] + b'garbage' * 10, 'gzip')
+
+
+def test_verify_upload_stream_rejects_truncated_zstd():
+    zstandard = pytest.importorskip('zstandard')
+    content = zstandard.ZstdCompressor().compress(CSV_CONTENT * 100)
+    verify_upload_stream(content, 'zstd')
+    # The streaming reader would silently return the rows before the cut
+    with pytest.raises(ValueError, match='truncated'):
+        verify_upload_stream(content[: len(content) // 2], 'zstd')
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding('') is None
+    assert negotiate_encoding('gzip') == 'gzip'
+    assert negotiate_encoding('gzip;q=0, identity') is None
+    assert negotiate_encoding('br, gzip;q=0.5') == 'gzip'
+
+
+def test_compression_middleware_streaming():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get('/rows')
+    def rows():
+        def stream_data():
+            yield '{"data": ['
+            yield ','.join(f'{{"i": {i}}}' for i in range(1000))
+            yield ']}'
+
+        return StreamingResponse(stream_data(), media_type='application/json')
+
+    with TestClient(app) as client:
+        response = client.get('/rows', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['content-encoding'] == 'gzip'
+        assert len(response.json()['data']) == 1000
+
+        response = client.get('/rows', headers={'Accept-Encoding': 'identity'})
+        assert 'content-encoding' not in response.headers
+        assert len(response.json()['data']) == 1000
+
+
+def test_compression_middleware_varies_on_every_negotiable_response():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get('/small')
+    def small():
+        return {'status': 'success'}
+
+    @app.get('/large')
+    def large():
+        return {'data': list(range(1000))}
+
+    @app.get('/image')
+    def image():
+        return Response(b'\x89PNG' * 1000, media_type='image/png')
+
+    @app.get('/cors')
+    def cors():
+        return Response('{}', media_type='application/json', headers={'Vary': 'Origin'})
+
+    with TestClient(app) as client:
+        compressed = client.get('/large', headers={'Accept-Encoding': 'gzip'})
+        assert compressed.headers['content-encoding'] == 'gzip'
+        assert compressed.headers['vary'] == 'Accept-Encoding'
+        identity = client.get('/large', headers={'Accept-Encoding': 'identity'})
+        assert 'content-encoding' not in identity.headers
+        assert identity.headers['vary'] == 'Accept-Encoding'
+        below_threshold = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+        assert 'content-encoding' not in below_threshold.headers
+        assert below_threshold.headers['vary'] == 'Accept-Encoding'
+        assert 'vary' not in client.get('/image', headers={'Accept-Encoding': 'gzip'}).headers
+        assert client.get('/cors').headers['vary'] == 'Origin, Accept-Encoding'
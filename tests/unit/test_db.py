@@ -1,5 +1,7 @@
+import threading
+
 import pytest
-from db.connection import get_db_connection, close_db_connection
+from db.connection import QueryCancellation, get_db_connection, close_db_connection
 
 def test_get_db_connection(mocker):
     # Mock psycopg2.connect
@@ -12,4 +14,31 @@ def test_get_db_connection(mocker):
 def test_close_db_connection(mocker):
     mock_conn = mocker.Mock()
     close_db_connection(mock_conn)
-    mock_conn.close.assert_called_once()
\ No newline at end of file
+    mock_conn.close.assert_called_once()
+
+def test_query_cancellation_keeps_connection_attached_until_cancel_is_sent(mocker):
+    attached, cancelling, release = threading.Event(), threading.Event(), threading.Event()
+    conn = mocker.Mock()
+    conn.cancel.side_effect = lambda: (cancelling.set(), release.wait(5))
+    cancellation = QueryCancellation()
+    detached = threading.Event()
+
+    def run_query():
+        with cancellation.attach(conn):
+            attached.set()
+            cancelling.wait(5)
+        detached.set()
+
+    worker = threading.Thread(target=run_query)
+    worker.start()
+    assert attached.wait(5)
+    canceller = threading.Thread(target=cancellation.cancel)
+    canceller.start()
+    assert cancelling.wait(5)
+    # The connection is not released to the pool while its cancel is in flight
+    assert not detached.wait(0.1)
+    release.set()
+    worker.join(5)
+    canceller.join(5)
+    assert detached.is_set()
+    conn.cancel.assert_called_once()
@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+
+from app.http_cache import (
+    cache_headers,
+    catalog_list_etag,
+    http_date,
+    is_not_modified,
+    stock_data_validators,
+)
+from app.models import StockCatalog
+
+INSERTED_AT = datetime(2024, 5, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+
+
+def _catalog(ticker='AAPL', inserted_at=INSERTED_AT):
+    return StockCatalog(
+        ticker=ticker,
+        start_time=datetime(2023, 1, 1),
+        end_time=datetime(2023, 12, 31),
+        inserted_at=inserted_at,
+    )
+
+
+def test_stock_data_etag_changes_with_import_and_range():
+    etag, last_modified = stock_data_validators(_catalog(), '2023-01-01', '2023-06-30')
+    assert etag.startswith('W/"')
+    assert last_modified == INSERTED_AT
+    assert stock_data_validators(_catalog(), '2023-01-01', '2023-06-30')[0] == etag
+    assert stock_data_validators(_catalog(), '2023-01-01', '2023-07-31')[0] != etag
+    reimported = _catalog(inserted_at=datetime(2024, 5, 2, tzinfo=timezone.utc))
+    assert stock_data_validators(reimported, '2023-01-01', '2023-06-30')[0] != etag
+
+
+def test_catalog_list_etag_changes_when_a_ticker_is_removed():
+    catalogs = [_catalog('AAPL'), _catalog('MSFT')]
+    assert catalog_list_etag(catalogs) == catalog_list_etag(list(catalogs))
+    assert catalog_list_etag(catalogs[:1]) != catalog_list_etag(catalogs)
+
+
+def test_if_none_match():
+    etag = 'W/"abc"'
+    assert is_not_modified({'if-none-match': 'W/"abc"'}, etag)
+    assert is_not_modified({'if-none-match': '"abc"'}, etag)
+    assert is_not_modified({'if-none-match': '"x", W/"abc"'}, etag)
+    assert is_not_modified({'if-none-match': '*'}, etag)
+    assert not is_not_modified({'if-none-match': 'W/"abd"'}, etag)
+    # If-None-Match takes precedence over If-Modified-Since
+    assert not is_not_modified(
+        {'if-none-match': 'W/"abd"', 'if-modified-since': http_date(INSERTED_AT)},
+        etag,
+        INSERTED_AT,
+    )
+
+
+def test_if_modified_since_has_second_resolution():
+    etag = 'W/"abc"'
+    assert is_not_modified({'if-modified-since': http_date(INSERTED_AT)}, etag, INSERTED_AT)
+    assert not is_not_modified(
+        {'if-modified-since': 'Wed, 01 May 2024 12:30:14 GMT'}, etag, INSERTED_AT
+    )
+    assert not is_not_modified({'if-modified-since': 'yesterday'}, etag, INSERTED_AT)
+    assert not is_not_modified({'if-modified-since': http_date(INSERTED_AT)}, etag)
+
+
+def test_cache_headers(monkeypatch):
+    monkeypatch.setenv('HTTP_CACHE_MAX_AGE', '300')
+    headers = cache_headers('W/"abc"', INSERTED_AT)
+    assert headers == {
+        'ETag': 'W/"abc"',
+        'Cache-Control': 'public, max-age=300',
+        'Last-Modified': 'Wed, 01 May 2024 12:30:15 GMT',
+    }
+    assert 'Last-Modified' not in cache_headers('W/"abc"')
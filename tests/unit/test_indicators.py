@@ -0,0 +1,98 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.bars import StockBars
+from app.indicators import (
+    EMA_WARMUP,
+    Indicator,
+    IndicatorCalculator,
+    ema,
+    parse_indicators,
+    vwap,
+)
+from app.serializers import indicators_to_json_records
+
+START_US = 1672531200000000  # 2023-01-01
+
+
+def _bars(count, offset=0):
+    rng = np.random.default_rng(7)
+    close = 100 + np.cumsum(rng.normal(size=count + offset))[offset:]
+    return StockBars.from_db_rows('AAPL', [
+        (START_US + (offset + i) * 60_000_000, c, c + 1, c - 1, c, 100 + i)
+        for i, c in enumerate(close.tolist())
+    ])
+
+
+def test_parse_indicators():
+    assert parse_indicators('sma:10, EMA,returns:5,sma:10') == [
+        Indicator('sma', 10), Indicator('ema', 20), Indicator('returns', 5),
+    ]
+    assert Indicator('volatility', 20).lookback == 20
+    assert Indicator('ema', 10).lookback == EMA_WARMUP * 10
+    for spec in ('', 'macd', 'sma:x', 'sma:0', 'sma:100001'):
+        with pytest.raises(ValueError):
+            parse_indicators(spec, max_period=100000)
+
+
+def test_indicators_match_pandas():
+    bars = _bars(500)
+    close = pd.Series(bars.close)
+    typical = (bars.high + bars.low + bars.close) / 3 * bars.volume
+    calculator = IndicatorCalculator(
+        parse_indicators('sma:20,ema:10,returns:3,volatility:15,vwap:5'), datetime(2023, 1, 1)
+    )
+    _, columns = calculator.update(bars)
+
+    expected = {
+        'sma_20': close.rolling(20).mean(),
+        'ema_10': close.ewm(span=10, adjust=False).mean().where(close.index >= 9),
+        'returns_3': close / close.shift(3) - 1,
+        'volatility_15': np.log(close / close.shift(1)).rolling(15).std(),
+        'vwap_5': pd.Series(typical).rolling(5).sum() / pd.Series(bars.volume).rolling(5).sum(),
+    }
+    for name, values in expected.items():
+        np.testing.assert_allclose(columns[name], values.to_numpy(), rtol=1e-9, equal_nan=True)
+
+
+def test_batches_and_lookback_give_the_same_values():
+    bars = _bars(1000)
+    indicators = parse_indicators('sma:30,ema:8,volatility:10')
+    _, whole = IndicatorCalculator(indicators, datetime(2023, 1, 1)).update(bars)
+
+    # Start the output 600 bars in, reading only the lookback before it, in small batches
+    start = datetime(2023, 1, 1, 10, 0)
+    calculator = IndicatorCalculator(indicators, start)
+    first = 600 - calculator.lookback
+    results = [calculator.update(bars[i:i + 97]) for i in range(first, 1000, 97)]
+    timestamps = np.concatenate([r[0] for r in results])
+    assert timestamps[0] == np.datetime64(start) and len(timestamps) == 400
+    for name, values in whole.items():
+        got = np.concatenate([r[1][name] for r in results])
+        # The EMA's seed is forgotten after the warm-up; the rolling values are exact
+        np.testing.assert_allclose(got, values[600:], rtol=1e-5 if name == 'ema_8' else 1e-9)
+
+
+def test_ema_continues_from_previous_and_fills_gaps():
+    values = np.array([1.0, np.nan, 3.0, 4.0])
+    out = ema(values, 1, previous=np.nan)
+    np.testing.assert_allclose(out, [1.0, 1.0, 3.0, 4.0])
+    out = ema(np.array([2.0, 2.0]), 3, previous=4.0)
+    np.testing.assert_allclose(out, [3.0, 2.5])
+    assert np.isnan(vwap(*(np.ones(3),) * 3, np.zeros(3), 2)).all()
+
+
+def test_indicators_to_json_records():
+    timestamps = np.array(['2023-01-01T00:00:00', '2023-01-01T00:01:00.5'], dtype='datetime64[us]')
+    records = indicators_to_json_records(
+        timestamps, {'sma_2': np.array([np.nan, 1.5]), 'returns_1': np.array([0.0, -0.25])}
+    )
+    assert [json.loads(r) for r in records] == [
+        {'timestamp': '2023-01-01T00:00:00', 'sma_2': None, 'returns_1': 0.0},
+        {'timestamp': '2023-01-01T00:01:00.500000', 'sma_2': 1.5, 'returns_1': -0.25},
+    ]
+    assert indicators_to_json_records(timestamps[:0], {}) == []
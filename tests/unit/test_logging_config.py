@@ -0,0 +1,57 @@
+import json
+import logging
+import queue
+
+from app.logging_config import (
+    DroppingQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+    TraceContextFilter,
+    parse_mapping,
+)
+from app.metrics import LOG_RECORDS_DROPPED
+from app.tracing import start_trace
+
+
+def make_record(name='elginvault.requests', level=logging.INFO, **extra):
+    record = logging.makeLogRecord(
+        {'name': name, 'levelno': level, 'msg': 'hello %s', 'args': ('x',)}
+    )
+    record.levelname = logging.getLevelName(level)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_parse_mapping():
+    assert parse_mapping('a.b:0.5, c:1', float) == {'a.b': 0.5, 'c': 1.0}
+    assert parse_mapping('') == {}
+
+
+def test_sampling_filter():
+    sampler = SamplingFilter({'elginvault.requests': 0.0})
+    assert not sampler.filter(make_record())
+    assert not sampler.filter(make_record('elginvault.requests.child'))
+    # Warnings are never sampled out; other loggers are untouched
+    assert sampler.filter(make_record(level=logging.WARNING))
+    assert sampler.filter(make_record('root'))
+
+
+def test_queue_handler_drops_when_full():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    before = LOG_RECORDS_DROPPED.value()
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert handler.queue.qsize() == 1
+    assert LOG_RECORDS_DROPPED.value() == before + 1
+
+
+def test_json_formatter_includes_extra_and_trace():
+    handler = DroppingQueueHandler(queue.Queue())
+    handler.addFilter(TraceContextFilter())
+    with start_trace('task.import') as root:
+        handler.handle(make_record(task_id='abc'))
+    entry = json.loads(JsonFormatter().format(handler.queue.get_nowait()))
+    assert entry['message'] == 'hello x'
+    assert entry['logger'] == 'elginvault.requests'
+    assert entry['task_id'] == 'abc'
+    assert entry['trace_id'] == root.trace_id
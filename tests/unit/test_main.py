@@ -1,3 +1,6 @@
+import gzip
+import subprocess
+import sys
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
@@ -40,3 +43,202 @@ async def test_bulk_insert_stock_data(mocker, mock_csv_file):
     assert response.json()['task_id'] is not None
     mock_process_bulk_insert_stock_data.assert_called_once()
     assert 'task_id' in response.json()
+
+
+def test_bulk_insert_stock_data_gzip(mocker, mock_csv_file):
+    mock_process_bulk_insert_stock_data = mocker.patch(
+        'app.main.process_bulk_insert_stock_data', return_value=None
+    )
+
+    with open(mock_csv_file, 'rb') as f:
+        compressed = gzip.compress(f.read())
+    with TestClient(app) as client:
+        response = client.post(
+            '/bulk_insert_stock_data',
+            data={
+                'ticker': 'AAPL',
+                'start_time': '2023-01-01',
+                'end_time': '2023-01-02',
+            },
+            files={'csv_file': ('test.csv.gz', compressed)},
+        )
+
+    assert response.status_code == 200
+    args = mock_process_bulk_insert_stock_data.call_args.args
+    assert args[3] == compressed
+    assert args[5] == 'gzip'
+
+
+def test_bulk_insert_stock_data_truncated_gzip(mocker, mock_csv_file):
+    mock_process_bulk_insert_stock_data = mocker.patch(
+        'app.main.process_bulk_insert_stock_data', return_value=None
+    )
+
+    with open(mock_csv_file, 'rb') as f:
+        compressed = gzip.compress(f.read())
+    with TestClient(app) as client:
+        response = client.post(
+            '/bulk_insert_stock_data',
+            data={
+                'ticker': 'AAPL',
+                'start_time': '2023-01-01',
+                'end_time': '2023-01-02',
+            },
+            files={'csv_file': ('test.csv.gz', compressed[:-12])},
+        )
+
+    assert response.status_code == 400
+    assert 'truncated' in response.json()['detail']
+    mock_process_bulk_insert_stock_data.assert_not_called()
+
+
+def test_stockvault_import_parquet(mocker):
+    pa = pytest.importorskip('pyarrow')
+    import io
+    import pyarrow.parquet as pq
+
+    mocker.patch('app.main.query_stock_vault_catalog_ticker', return_value=None)
+    mock_process_bulk_insert_stock_data = mocker.patch(
+        'app.main.process_bulk_insert_stock_data', return_value=None
+    )
+    buffer = io.BytesIO()
+    pq.write_table(pa.table({'timestamp': ['2023-01-01'], 'ticker': ['AAPL']}), buffer)
+
+    with TestClient(app) as client:
+        response = client.post(
+            '/stock_vault/import',
+            data={
+                'ticker': 'AAPL',
+                'start_time': '2023-01-01',
+                'end_time': '2023-01-02',
+            },
+            files={'csv_file': ('bars.parquet', buffer.getvalue())},
+        )
+
+    assert response.status_code == 200
+    assert mock_process_bulk_insert_stock_data.call_args.args[6] == 'parquet'
+
+
+def test_import_does_not_load_heavy_dependencies():
+    # pandas / pyarrow / psycopg2.extras are imported lazily on their hot paths
+    code = (
+        'import sys, app.main; '
+        'print(sorted(m for m in ("pandas", "pyarrow", "psycopg2.extras") if m in sys.modules))'
+    )
+    output = subprocess.check_output([sys.executable, '-c', code], text=True)
+    assert output.strip().splitlines()[-1] == '[]'
+
+
+def test_stock_data_conditional_request_skips_the_query(mocker):
+    from datetime import datetime, timezone
+    from app.models import StockCatalog
+
+    mocker.patch(
+        'app.main.query_stock_vault_catalog_ticker',
+        return_value=StockCatalog(
+            ticker='AAPL',
+            start_time=datetime(2023, 1, 1),
+            end_time=datetime(2023, 1, 2),
+            inserted_at=datetime(2024, 5, 1, tzinfo=timezone.utc),
+        ),
+    )
+
+    def no_bars(*args, **kwargs):
+        yield from ()
+
+    query = mocker.patch('app.main.query_stock_vault_data', side_effect=no_bars)
+
+    with TestClient(app) as client:
+        response = client.get('/stock_data/AAPL?start_time=2023-01-01&end_time=2023-01-02')
+        assert response.status_code == 200
+        assert response.headers['cache-control'].startswith('public, max-age=')
+        assert response.headers['last-modified'] == 'Wed, 01 May 2024 00:00:00 GMT'
+        etag = response.headers['etag']
+
+        revalidated = client.get(
+            '/stock_data/AAPL?start_time=2023-01-01&end_time=2023-01-02',
+            headers={'If-None-Match': etag},
+        )
+        assert revalidated.status_code == 304
+        assert revalidated.content == b''
+        assert revalidated.headers['etag'] == etag
+
+        other_range = client.get(
+            '/stock_data/AAPL?start_time=2023-01-01&end_time=2023-01-03',
+            headers={'If-None-Match': etag},
+        )
+        assert other_range.status_code == 200
+
+        since = client.get(
+            '/stock_vault/data/AAPL',
+            headers={'If-Modified-Since': 'Wed, 01 May 2024 00:00:00 GMT'},
+        )
+        assert since.status_code == 304
+
+    assert query.call_count == 2
+
+
+def test_stockvault_indicators(mocker):
+    import numpy as np
+
+    mocker.patch('app.main.query_stock_vault_catalog_ticker', return_value=None)
+
+    def batches(*args, **kwargs):
+        yield (
+            np.array(['2023-01-01T00:00', '2023-01-01T00:01'], dtype='datetime64[us]'),
+            {'sma_2': np.array([np.nan, 1.5])},
+        )
+
+    query = mocker.patch('app.main.query_stock_vault_indicators', side_effect=batches)
+
+    with TestClient(app) as client:
+        response = client.get('/stock_vault/indicators/AAPL?indicators=sma:2')
+        assert response.status_code == 200
+        assert response.json() == {
+            'data': [
+                {'timestamp': '2023-01-01T00:00:00', 'sma_2': None},
+                {'timestamp': '2023-01-01T00:01:00', 'sma_2': 1.5},
+            ],
+            'count': 2,
+            'status': 'success',
+        }
+        assert client.get('/stock_vault/indicators/AAPL?indicators=macd').status_code == 400
+        assert client.get('/stock_vault/indicators/AAPL').status_code == 422
+    assert query.call_args.args[3][0].column == 'sma_2'
+
+
+def test_stockvault_snapshot(mocker):
+    snapshot = mocker.patch(
+        'app.main.latest_bars.snapshot', return_value=(['{"ticker":"AAPL"}'], ['NONE'])
+    )
+
+    with TestClient(app) as client:
+        response = client.get('/stock_vault/snapshot?tickers=AAPL, NONE')
+        assert response.json() == {
+            'data': [{'ticker': 'AAPL'}], 'missing': ['NONE'], 'count': 1, 'status': 'success',
+        }
+        assert client.get('/stock_vault/snapshot?tickers=,').status_code == 400
+    snapshot.assert_called_once_with(['AAPL', 'NONE'])
+
+
+def test_stockvault_matrix(mocker):
+    import numpy as np
+    from app.matrix import PriceMatrix
+
+    query = mocker.patch(
+        'app.main.query_stock_vault_matrix',
+        return_value=PriceMatrix(
+            np.array(['2023-01-01'], dtype='datetime64[us]'),
+            {'close.AAPL': np.array([1.5]), 'close.MSFT': np.array([np.nan])},
+        ),
+    )
+
+    with TestClient(app) as client:
+        response = client.get('/stock_vault/matrix?tickers=AAPL,MSFT&format=csv&fill=ffill')
+        assert response.status_code == 200
+        assert response.text == 'timestamp,close.AAPL,close.MSFT\n2023-01-01T00:00:00,1.5,\n'
+        assert client.get('/stock_vault/matrix?tickers=AAPL&fields=vwap').status_code == 400
+        assert client.get('/stock_vault/matrix?tickers=AAPL&format=xlsx').status_code == 400
+    assert query.call_args.args[:5] == (
+        ['AAPL', 'MSFT'], '2000-01-01', '2025-01-25', ['close'], 'ffill'
+    )
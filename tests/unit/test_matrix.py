@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+
+import numpy as np
+import pytest
+
+from app.bars import StockBars
+from app.matrix import PriceMatrix, align_bars, matrix_to_arrow, parse_fields, parse_list
+from app.serializers import matrix_to_csv, matrix_to_json
+
+MINUTE = 60_000_000
+START_US = 1672531200000000  # 2023-01-01
+
+
+def _batches():
+    # AAPL at minutes 0, 1, 2; MSFT at minutes 1 and 3 (close missing at 3)
+    return [
+        StockBars.from_ticker_rows([
+            ('MSFT', START_US + 3 * MINUTE, 1.0, 1.0, 1.0, None, 30),
+            ('AAPL', START_US, 1.0, 1.0, 1.0, 10.0, 100),
+            ('AAPL', START_US + 2 * MINUTE, 1.0, 1.0, 1.0, 12.0, 120),
+        ]),
+        StockBars.from_ticker_rows([
+            ('MSFT', START_US + MINUTE, 1.0, 1.0, 1.0, 20.0, 10),
+            ('AAPL', START_US + MINUTE, 1.0, 1.0, 1.0, 11.0, 110),
+        ]),
+    ]
+
+
+def _column(matrix, name):
+    return [None if np.isnan(v) else v for v in matrix.columns[name].tolist()]
+
+
+def test_align_bars_fill_methods():
+    tickers = ['AAPL', 'MSFT', 'NONE']
+    matrix = align_bars(_batches(), tickers, ['close', 'volume'])
+    assert len(matrix) == 4
+    assert list(matrix.columns) == [
+        'close.AAPL', 'close.MSFT', 'close.NONE', 'volume.AAPL', 'volume.MSFT', 'volume.NONE',
+    ]
+    assert _column(matrix, 'close.AAPL') == [10.0, 11.0, 12.0, None]
+    assert _column(matrix, 'close.MSFT') == [None, 20.0, None, None]
+    assert _column(matrix, 'volume.MSFT') == [None, 10.0, None, 30.0]
+
+    ffill = align_bars(_batches(), tickers, ['close'], 'ffill')
+    assert _column(ffill, 'close.AAPL') == [10.0, 11.0, 12.0, 12.0]
+    assert _column(ffill, 'close.MSFT') == [None, 20.0, 20.0, 20.0]
+    assert _column(ffill, 'close.NONE') == [None] * 4
+    assert _column(align_bars(_batches(), tickers, ['close'], 'zero'), 'close.MSFT') == [
+        0.0, 20.0, 0.0, 0.0,
+    ]
+
+    # Only minute 1 has bars of both; a missing close still counts as a bar
+    drop = align_bars(_batches(), ['AAPL', 'MSFT'], ['close'], 'drop')
+    assert drop.index.tolist() == [np.datetime64('2023-01-01T00:01').item()]
+    assert _column(drop, 'close.MSFT') == [20.0]
+    assert len(align_bars(_batches(), tickers, ['close'], 'drop')) == 0
+    with pytest.raises(ValueError):
+        align_bars(_batches(), tickers, ['close'], 'bfill')
+
+
+def test_parse_parameters():
+    assert parse_list(' AAPL,MSFT,,AAPL ', 'ticker') == ['AAPL', 'MSFT']
+    assert parse_fields('Close,volume') == ['close', 'volume']
+    for value in ('', 'close,vwap'):
+        with pytest.raises(ValueError):
+            parse_fields(value)
+
+
+def test_matrix_serializers():
+    matrix = align_bars(_batches(), ['AAPL', 'MSFT'], ['close', 'volume'])
+    assert json.loads(''.join(matrix_to_json(matrix))) == {
+        'index': [
+            '2023-01-01T00:00:00', '2023-01-01T00:01:00',
+            '2023-01-01T00:02:00', '2023-01-01T00:03:00',
+        ],
+        'columns': {
+            'close.AAPL': [10.0, 11.0, 12.0, None],
+            'close.MSFT': [None, 20.0, None, None],
+            'volume.AAPL': [100, 110, 120, None],
+            'volume.MSFT': [None, 10, None, 30],
+        },
+        'count': 4,
+        'status': 'success',
+    }
+    lines = ''.join(matrix_to_csv(matrix, chunk_rows=3)).splitlines()
+    assert lines[0] == 'timestamp,close.AAPL,close.MSFT,volume.AAPL,volume.MSFT'
+    assert lines[1:] == [
+        '2023-01-01T00:00:00,10.0,,100,',
+        '2023-01-01T00:01:00,11.0,20.0,110,10',
+        '2023-01-01T00:02:00,12.0,,120,',
+        '2023-01-01T00:03:00,,,,30',
+    ]
+
+
+def test_matrix_to_csv_quotes_column_names():
+    names = ['close.A"B', 'close.C,D', 'close.E']
+    matrix = PriceMatrix(
+        np.array([START_US], dtype='datetime64[us]'),
+        {name: np.array([1.0]) for name in names},
+    )
+    text = ''.join(matrix_to_csv(matrix))
+    assert text.splitlines()[0] == 'timestamp,"close.A""B","close.C,D",close.E'
+    assert next(csv.reader(io.StringIO(text))) == ['timestamp'] + names
+
+
+def test_matrix_to_arrow():
+    pa = pytest.importorskip('pyarrow')
+    table = matrix_to_arrow(align_bars(_batches(), ['AAPL', 'MSFT'], ['close', 'volume']))
+    assert table.schema.field('timestamp').type == pa.timestamp('us')
+    assert table.schema.field('volume.MSFT').type == pa.int64()
+    assert table.column('close.MSFT').to_pylist() == [None, 20.0, None, None]
+    assert table.column('volume.MSFT').to_pylist() == [None, 10, None, 30]
@@ -0,0 +1,79 @@
+import time
+
+from fastapi import BackgroundTasks, FastAPI
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.main import app
+from app.metrics import Counter, Gauge, Histogram, MetricsMiddleware, render_metrics
+from db.queries import SqlQuery, fetch_query_results, load_sql_query
+
+
+def test_histogram_render():
+    histogram = Histogram('test_latency_seconds', 'Test latency.', labels=('route',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, route='/a')
+    histogram.observe(0.5, route='/a')
+    histogram.observe(5.0, route='/a')
+    text = '\n'.join(histogram.render())
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{route="/a"} 3' in text
+
+
+def test_counter_and_callback_gauge():
+    counter = Counter('test_rows_total', 'Test rows.', labels=('endpoint',))
+    counter.inc(3, endpoint='x')
+    counter.inc(2, endpoint='x')
+    assert counter.value(endpoint='x') == 5
+    gauge = Gauge('test_pending', 'Test pending.', labels=('status',), callback=lambda: {('a',): 2})
+    assert 'test_pending{status="a"} 2' in render_metrics()
+
+
+def test_load_sql_query_names_query():
+    sql = load_sql_query('db/queries/get_stock_data_by_ticker_and_time_range.sql')
+    assert isinstance(sql, SqlQuery)
+    assert sql.name == 'get_stock_data_by_ticker_and_time_range'
+
+
+def test_query_timings_recorded(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [(1,), (2,)]
+    sql = SqlQuery('SELECT 1')
+    sql.name = 'test_select'
+    assert fetch_query_results(conn, sql) == [(1,), (2,)]
+    text = render_metrics()
+    assert 'elginvault_db_query_duration_seconds_count{query="test_select"} 1' in text
+    assert 'elginvault_db_query_rows_total{query="test_select"} 2' in text
+
+
+def test_metrics_endpoint():
+    with TestClient(app) as client:
+        client.get('/task_status/unknown')
+        response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    assert (
+        'elginvault_http_request_duration_seconds_count'
+        '{method="GET",route="/task_status/{task_id}",status="404"}'
+    ) in response.text
+    assert 'elginvault_background_tasks{status="In Progress"}' in response.text
+
+
+def test_request_duration_excludes_background_tasks(monkeypatch):
+    histogram = Histogram('test_request_seconds', 'Test.', labels=('method', 'route', 'status'), buckets=(0.2,))
+    monkeypatch.setattr(metrics, 'HTTP_REQUEST_DURATION', histogram)
+    test_app = FastAPI()
+    test_app.add_middleware(MetricsMiddleware)
+
+    @test_app.post('/import')
+    def start_import(background_tasks: BackgroundTasks):
+        background_tasks.add_task(time.sleep, 0.3)
+        return {'message': 'started'}
+
+    with TestClient(test_app) as client:
+        assert client.post('/import').status_code == 200
+    text = '\n'.join(histogram.render())
+    assert 'test_request_seconds_bucket{method="POST",route="/import",status="200",le="0.2"} 1' in text
+    assert 'test_request_seconds_count{method="POST",route="/import",status="200"} 1' in text
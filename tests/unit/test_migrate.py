@@ -0,0 +1,95 @@
+from db.migrate import load_migrations, online_statement, split_statements
+
+
+class FakeCursor:
+    '''
+    Answers the catalog lookups of online_statement: whether TimescaleDB is
+    installed, which table an index belongs to and whether it is a hypertable.
+    '''
+
+    def __init__(self, hypertables=(), indexes=None, timescale=True):
+        self.hypertables = set(hypertables)
+        self.indexes = indexes or {}
+        self.timescale = timescale
+        self.result = None
+
+    def execute(self, sql, params=None):
+        if 'to_regclass' in sql:
+            self.result = (self.timescale,)
+        elif 'hypertables' in sql:
+            self.result = (1,) if params[0] in self.hypertables else None
+        elif 'pg_indexes' in sql:
+            table = self.indexes.get(params[0])
+            self.result = (table,) if table else None
+
+    def fetchone(self):
+        return self.result
+
+
+def test_load_migrations_starts_with_baseline_in_order():
+    migrations = load_migrations()
+    assert migrations[0].version == '0000'
+    assert migrations[0].name == 'create_tables'
+    assert migrations[0].transactional
+    versions = [m.version for m in migrations]
+    assert versions == sorted(versions)
+    # Index builds must not run in a transaction, or CONCURRENTLY fails
+    assert not any(m.transactional for m in migrations if m.version in ('0001', '0004'))
+
+
+def test_split_statements_drops_comments():
+    sql = '''-- migrate: no-transaction
+-- comment; with a semicolon;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx
+    ON t (a);
+
+DROP INDEX CONCURRENTLY IF EXISTS b_idx;
+'''
+    assert split_statements(sql) == [
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx\n    ON t (a);',
+        'DROP INDEX CONCURRENTLY IF EXISTS b_idx;',
+    ]
+
+
+def test_split_statements_keeps_do_blocks_whole():
+    sql = '''-- migrate: no-transaction
+DO $$
+BEGIN
+    UPDATE t SET a = 1;
+    COMMIT;
+END
+$$;
+SELECT 1;
+'''
+    assert split_statements(sql) == [
+        'DO $$\nBEGIN\n    UPDATE t SET a = 1;\n    COMMIT;\nEND\n$$;',
+        'SELECT 1;',
+    ]
+
+
+def test_online_statement_keeps_concurrently_on_plain_tables():
+    statement = 'CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx ON stock_data (ticker);'
+    assert online_statement(FakeCursor(timescale=False), statement) == statement
+    assert online_statement(FakeCursor(hypertables=['other']), statement) == statement
+
+
+def test_online_statement_builds_hypertable_indexes_per_chunk():
+    cursor = FakeCursor(hypertables=['stock_data'], indexes={'old_idx': 'stock_data'})
+    statement = (
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx\n'
+        '    ON stock_data (ticker, version, timestamp) INCLUDE (open);'
+    )
+    assert online_statement(cursor, statement) == (
+        'CREATE INDEX IF NOT EXISTS a_idx\n'
+        '    ON stock_data (ticker, version, timestamp) INCLUDE (open)'
+        ' WITH (timescaledb.transaction_per_chunk);'
+    )
+    assert (
+        online_statement(cursor, 'DROP INDEX CONCURRENTLY IF EXISTS old_idx;')
+        == 'DROP INDEX IF EXISTS old_idx;'
+    )
+    # Unknown index: left to DROP ... IF EXISTS
+    assert (
+        online_statement(cursor, 'DROP INDEX CONCURRENTLY IF EXISTS gone_idx;')
+        == 'DROP INDEX CONCURRENTLY IF EXISTS gone_idx;'
+    )
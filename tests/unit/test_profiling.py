@@ -0,0 +1,75 @@
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.profiling import (
+    Profiler,
+    ProfilingMiddleware,
+    is_profile_requested,
+    maybe_profile_stream,
+    start_profiler,
+)
+
+
+@pytest.fixture
+def profiling_env(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    monkeypatch.setenv('PROFILING_PROFILES_DIR', str(tmp_path))
+    monkeypatch.delenv('PROFILING_TOKEN', raising=False)
+    return tmp_path
+
+
+def test_is_profile_requested_disabled(monkeypatch):
+    monkeypatch.setenv('PROFILING_ENABLED', 'false')
+    assert not is_profile_requested('1')
+
+
+def test_is_profile_requested_token(profiling_env, monkeypatch):
+    assert is_profile_requested('1')
+    assert not is_profile_requested('0')
+    monkeypatch.setenv('PROFILING_TOKEN', 'secret')
+    assert not is_profile_requested('1')
+    assert is_profile_requested('secret')
+
+
+def test_profiler_writes_results(profiling_env):
+    with Profiler('unit'):
+        data = [list(range(100)) for _ in range(100)]
+    assert data
+    assert os.path.exists(profiling_env / 'unit.prof')
+    summary = (profiling_env / 'unit.txt').read_text()
+    assert 'tracemalloc peak' in summary
+    # The lock is released once the profile is written
+    again = start_profiler('again')
+    assert again is not None
+    again.finish()
+
+
+def test_only_one_profile_at_a_time(profiling_env):
+    first = start_profiler('first')
+    assert start_profiler('second') is None
+    first.finish()
+
+
+def test_profiled_stream(profiling_env):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware)
+
+    @app.get('/rows')
+    def rows():
+        def stream_data():
+            for i in range(10):
+                yield f'{i}\n'
+
+        return StreamingResponse(maybe_profile_stream(stream_data(), 'rows'))
+
+    with TestClient(app) as client:
+        response = client.get('/rows')
+        assert 'x-profile-id' not in response.headers
+
+        response = client.get('/rows', headers={'X-Profile': '1', 'X-Request-ID': 'abc'})
+        assert response.headers['x-profile-id'] == 'abc'
+        assert response.text.count('\n') == 10
+    assert os.path.exists(profiling_env / 'rows_abc.prof')
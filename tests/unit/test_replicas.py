@@ -0,0 +1,116 @@
+import psycopg2
+import pytest
+
+from db.connection import BlockingConnectionPool
+from db.replicas import Replica, ReplicaRouter, parse_replica_dsns
+
+
+class FakePool:
+    def __init__(self, params, fail=False):
+        self.params = params
+        self.fail = fail
+        self.returned = []
+
+    def getconn(self):
+        if self.fail:
+            raise psycopg2.OperationalError('replica down')
+        return object()
+
+    def putconn(self, conn):
+        self.returned.append(conn)
+
+    def closeall(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _replica(name, fail=False):
+    return Replica(name, {'host': name}, lambda params: FakePool(params, fail))
+
+
+def test_parse_replica_dsns_inherits_primary_params():
+    primary = {'host': 'primary', 'port': '5432', 'dbname': 'vault', 'user': 'u', 'password': 'p'}
+    replicas = parse_replica_dsns(
+        'host=r1 port=5433, postgresql://r2/other', primary
+    )
+    assert replicas == [
+        {**primary, 'host': 'r1', 'port': '5433'},
+        {**primary, 'host': 'r2', 'dbname': 'other'},
+    ]
+    assert parse_replica_dsns('', primary) == []
+
+
+def test_round_robin_alternates_replicas():
+    router = ReplicaRouter([_replica('a'), _replica('b')])
+    names = [router.getconn()[0].name for _ in range(4)]
+    assert names == ['a', 'b', 'a', 'b']
+
+
+def test_least_connections_prefers_idle_replica():
+    a, b = _replica('a'), _replica('b')
+    router = ReplicaRouter([a, b], strategy='least_connections')
+    first, conn = router.getconn()
+    assert first is a
+    # a now has a connection out, so b is picked
+    assert router.getconn()[0] is b
+    a.putconn(conn)
+    assert a.in_use == 0
+
+
+def test_failed_replica_is_skipped_then_retried():
+    clock = Clock()
+    a, b = _replica('a', fail=True), _replica('b')
+    router = ReplicaRouter([a, b], retry_after=30, clock=clock)
+    assert router.getconn()[0] is b
+    assert a.down_until == 130.0
+    assert [r.name for r in router.candidates()] == ['b']
+    clock.now = 131.0
+    assert {r.name for r in router.candidates()} == {'a', 'b'}
+
+
+def test_saturated_replica_is_passed_over_without_being_marked_down(mocker):
+    mocker.patch('psycopg2.connect', side_effect=lambda *args, **kwargs: object())
+    clock = Clock()
+    a = Replica('a', {}, lambda params: BlockingConnectionPool(0, 1, 0.0))
+    b = _replica('b')
+    # Busier than a, so a is always tried first
+    b.in_use = 5
+    router = ReplicaRouter([a, b], strategy='least_connections', clock=clock)
+    assert router.getconn()[0] is a
+    # a's only connection is out: the read goes to b without waiting
+    assert router.getconn()[0] is b
+    # With every replica saturated the read goes to the primary
+    assert ReplicaRouter([a], clock=clock).getconn() == (None, None)
+    assert a.down_until == 0.0
+    assert a.in_use == 1
+
+
+def test_falls_back_to_primary_when_all_replicas_fail():
+    router = ReplicaRouter([_replica('a', fail=True)])
+    assert router.getconn() == (None, None)
+    assert ReplicaRouter([]).getconn() == (None, None)
+
+
+def test_freshness_window_sends_recent_tickers_to_primary():
+    clock = Clock()
+    router = ReplicaRouter([_replica('a')], freshness_window=5, clock=clock)
+    router.mark_written('AAPL')
+    assert router.getconn('AAPL') == (None, None)
+    # Lists cover every ticker, so any recent write counts
+    assert router.needs_primary(None)
+    assert router.getconn('MSFT')[0].name == 'a'
+    clock.now += 5
+    assert router.getconn('AAPL')[0].name == 'a'
+    assert not router.needs_primary(None)
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        ReplicaRouter([], strategy='random')
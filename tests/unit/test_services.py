@@ -2,7 +2,12 @@ import pytest
 import pandas as pd
 from datetime import datetime
 
-from app.services.stock_data_service import read_and_validate_csv, prepare_records
+from app.services.stock_data_service import (
+    iter_columnar_batches,
+    prepare_bars,
+    prepare_columns,
+    read_and_validate_csv,
+)
 from app.models import StockData
 
 def test_read_and_validate_csv(mocker):
@@ -16,7 +21,7 @@ def test_read_and_validate_csv(mocker):
     assert 'timestamp' in df.columns
     assert 'ticker' in df.columns
 
-def test_prepare_records():
+def test_prepare_bars():
     df = pd.DataFrame({
         'timestamp': ['2023-01-01'],
         'ticker': ['AAPL'],
@@ -26,9 +31,9 @@ def test_prepare_records():
         'close': [154.0],
         'volume': [1000],
     })
-    records = prepare_records(df)
-    assert len(records) == 1
-    assert records[0] == StockData(
+    bars = prepare_bars(df)
+    assert len(bars) == 1
+    assert bars[0].to_model() == StockData(
         timestamp=datetime.strptime('2023-01-01', '%Y-%m-%d'),
         ticker='AAPL',
         open=150.0,
@@ -36,4 +41,50 @@ def test_prepare_records():
         low=149.0,
         close=154.0,
         volume=1000,
-    )
\ No newline at end of file
+    )
+
+def test_prepare_bars_invalid_value():
+    df = pd.DataFrame({
+        'timestamp': ['2023-01-01'],
+        'ticker': ['AAPL'],
+        'open': ['abc'],
+        'high': [155.0],
+        'low': [149.0],
+        'close': [154.0],
+        'volume': [1000],
+    })
+    with pytest.raises(ValueError, match='"open"'):
+        prepare_bars(df)
+
+def _write_parquet(table):
+    pq = pytest.importorskip('pyarrow.parquet')
+    import io
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    return buffer.getvalue()
+
+
+def test_prepare_columns_from_parquet():
+    pa = pytest.importorskip('pyarrow')
+    table = pa.table({
+        'timestamp': pa.array([datetime(2023, 1, 1), datetime(2023, 1, 2)]),
+        'ticker': ['AAPL', 'AAPL'],
+        'open': [150.0, 152.0],
+        'high': [155.0, 156.0],
+        'low': [149.0, 151.0],
+        'close': [154.0, 155.0],
+        'volume': pa.array([1000, 1200], type=pa.int32()),
+    })
+    batches = list(iter_columnar_batches(_write_parquet(table), 'parquet'))
+    bars = prepare_columns(batches[0])
+    assert [bar.timestamp for bar in bars] == [datetime(2023, 1, 1), datetime(2023, 1, 2)]
+    assert bars.close.tolist() == [154.0, 155.0]
+    assert bars.volume.tolist() == [1000, 1200]
+    assert bars.to_rows()[0] == (datetime(2023, 1, 1), 'AAPL', 150.0, 155.0, 149.0, 154.0, 1000)
+
+
+def test_prepare_columns_missing_column():
+    pa = pytest.importorskip('pyarrow')
+    batch = pa.record_batch({'timestamp': [datetime(2023, 1, 1)], 'ticker': ['AAPL']})
+    with pytest.raises(ValueError, match='missing required columns'):
+        prepare_columns(batch)
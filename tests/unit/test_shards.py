@@ -0,0 +1,42 @@
+import pytest
+
+from db.shards import ShardMap
+
+TICKERS = [f'T{i:04d}' for i in range(2000)]
+
+
+def test_owner_is_stable_and_spread_over_nodes():
+    shard_map = ShardMap(['a', 'b', 'c'])
+    owners = [shard_map.owner(t) for t in TICKERS]
+    assert owners == [ShardMap(['c', 'a', 'b']).owner(t) for t in TICKERS]
+    for node in ('a', 'b', 'c'):
+        assert 500 < owners.count(node) < 833
+
+
+def test_adding_a_node_only_moves_tickers_to_it():
+    before = ShardMap(['a', 'b', 'c'])
+    after = ShardMap(['a', 'b', 'c', 'd'])
+    moved = [t for t in TICKERS if before.owner(t) != after.owner(t)]
+    assert all(after.owner(t) == 'd' for t in moved)
+    # About a quarter of the tickers, rather than most of them as with hash % n
+    assert 350 < len(moved) < 650
+
+
+def test_previous_owner_during_rebalance():
+    shard_map = ShardMap(['a', 'b'], previous_nodes=['a'])
+    assert shard_map.sharded
+    assert shard_map.all_nodes == ['a', 'b']
+    for ticker in TICKERS[:50]:
+        expected = 'a' if shard_map.owner(ticker) == 'b' else None
+        assert shard_map.previous_owner(ticker) == expected
+
+
+def test_single_node_is_not_sharded():
+    shard_map = ShardMap(['default'])
+    assert not shard_map.sharded
+    assert shard_map.owner('AAPL') == 'default'
+    assert shard_map.previous_owner('AAPL') is None
+    with pytest.raises(ValueError):
+        ShardMap([])
+    with pytest.raises(ValueError):
+        ShardMap(['a', 'a'])
@@ -0,0 +1,70 @@
+import json
+import logging
+
+import pytest
+
+from db.queries import SqlQuery, fetch_query_results
+from db.slow_query_log import (
+    check_slow_query,
+    configure_slow_query_log,
+    get_slow_query_settings,
+    is_explainable,
+    summarize_params,
+)
+
+
+@pytest.fixture
+def slow_query_settings():
+    settings = get_slow_query_settings()
+    saved = vars(settings).copy()
+    yield settings
+    vars(settings).update(saved)
+
+
+def make_query(text, name):
+    sql = SqlQuery(text)
+    sql.name = name
+    return sql
+
+
+def test_summarize_params():
+    assert summarize_params(('AAPL', '2023-01-01')) == "('AAPL', '2023-01-01')"
+    assert summarize_params([(1,), (2,)], bulk=True) == '<2 rows>'
+    assert summarize_params(('x' * 1000,)).endswith('...')
+
+
+def test_is_explainable():
+    assert is_explainable('  SELECT * FROM stock_data')
+    assert not is_explainable('DELETE FROM stock_data WHERE ticker = %s')
+
+
+def test_fast_query_not_logged(mocker, slow_query_settings, caplog):
+    configure_slow_query_log(threshold_ms=10_000)
+    conn = mocker.MagicMock()
+    with caplog.at_level(logging.WARNING, logger='elginvault.slow_query'):
+        check_slow_query(conn, make_query('SELECT 1', 'fast'), None, 0.01, 1)
+    assert not caplog.records
+
+
+def test_slow_query_logged_with_plan(mocker, slow_query_settings, caplog, tmp_path):
+    explain_log = tmp_path / 'plans.jsonl'
+    configure_slow_query_log(threshold_ms=0, explain_sample_rate=1.0, explain_log=str(explain_log))
+    conn = mocker.MagicMock()
+    conn.autocommit = False
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [('AAPL',)]
+    cursor.fetchone.return_value = [[{'Plan': {'Node Type': 'Index Scan'}}]]
+
+    sql = make_query('SELECT * FROM stock_data WHERE ticker = %s', 'get_stock_data')
+    with caplog.at_level(logging.WARNING, logger='elginvault.slow_query'):
+        fetch_query_results(conn, sql, ('AAPL',))
+
+    assert 'Slow query get_stock_data' in caplog.text
+    assert "('AAPL',)" in caplog.text
+    executed = [call.args[0] for call in cursor.execute.call_args_list]
+    assert executed[1] == 'SAVEPOINT slow_query_explain'
+    assert executed[2].startswith('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT')
+    assert executed[3] == 'RELEASE SAVEPOINT slow_query_explain'
+    entry = json.loads(explain_log.read_text().splitlines()[0])
+    assert entry['query'] == 'get_stock_data'
+    assert entry['plan'][0]['Plan']['Node Type'] == 'Index Scan'
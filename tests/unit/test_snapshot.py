@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+from app import snapshot
+from app.cache import VaultCache
+from app.snapshot import LatestBars, SnapshotRefresher
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    '''
+    Replaces the database read; records what was asked for.
+    '''
+    calls = []
+    table = {'AAPL': '{"ticker":"AAPL"}', 'MSFT': '{"ticker":"MSFT"}'}
+
+    def read(tickers=None):
+        calls.append(tickers)
+        return {t: r for t, r in table.items() if tickers is None or t in tickers}
+
+    monkeypatch.setattr(snapshot, 'read_latest_records', read)
+    monkeypatch.setattr(snapshot, 'vault_cache', VaultCache())
+    return calls, table
+
+
+def test_loads_once_then_serves_from_memory(reads):
+    calls, _ = reads
+    bars = LatestBars()
+    assert bars.snapshot(['MSFT', 'NONE', 'MSFT']) == (['{"ticker":"MSFT"}'], ['NONE'])
+    assert bars.snapshot() == (['{"ticker":"AAPL"}', '{"ticker":"MSFT"}'], [])
+    assert calls == [None]
+
+
+def test_only_stale_tickers_are_read_again(reads):
+    calls, table = reads
+    bars = LatestBars()
+    bars.refresh()
+    table['AAPL'] = '{"ticker":"AAPL","close":2.0}'
+    del table['MSFT']
+    bars.mark_stale('AAPL')
+    bars.mark_stale('MSFT')
+    # Snapshots serve the table as it is until the refresh
+    assert bars.snapshot(['AAPL', 'MSFT']) == (['{"ticker":"AAPL"}', '{"ticker":"MSFT"}'], [])
+    assert calls == [None]
+    bars.refresh()
+    assert bars.snapshot(['AAPL', 'MSFT']) == (['{"ticker":"AAPL","close":2.0}'], ['MSFT'])
+    assert calls == [None, ['AAPL', 'MSFT']]
+    # A cleared table has nothing to serve, so the snapshot loads it
+    bars.mark_stale(None)
+    bars.snapshot()
+    assert calls[-1] is None
+
+
+def test_cache_invalidations_mark_tickers_stale(reads):
+    calls, _ = reads
+    cache = VaultCache()
+    bars = LatestBars()
+    cache.add_invalidation_callback(bars.mark_stale)
+    bars.refresh()
+    cache.invalidate('AAPL')
+    assert bars.pending and bars.changed.is_set()
+    bars.refresh()
+    assert calls[-1] == ['AAPL']
+    cache.clear()
+    bars.snapshot(['AAPL'])
+    assert calls[-1] is None
+
+
+def test_failed_refresh_keeps_tickers_stale(reads, monkeypatch):
+    calls, _ = reads
+    bars = LatestBars()
+    bars.refresh()
+    bars.mark_stale('AAPL')
+    monkeypatch.setattr(snapshot, 'read_latest_records', lambda tickers=None: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        bars.refresh()
+    assert bars._stale == {'AAPL'}
+    # The last table is still served
+    assert bars.snapshot(['AAPL']) == (['{"ticker":"AAPL"}'], [])
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_refresher_loads_the_table_and_follows_changes(reads, monkeypatch):
+    calls, table = reads
+    bars = LatestBars()
+    refresher = SnapshotRefresher(bars, retry_interval=0.01)
+    refresher.start()
+    try:
+        _wait_for(lambda: calls == [None])
+        table['AAPL'] = '{"ticker":"AAPL","close":2.0}'
+        bars.mark_stale('AAPL')
+        _wait_for(lambda: bars.snapshot(['AAPL'])[0] == ['{"ticker":"AAPL","close":2.0}'])
+        assert calls == [None, ['AAPL']]
+
+        failures = []
+
+        def failing(tickers=None):
+            failures.append(tickers)
+            raise ConnectionError('database unreachable')
+
+        monkeypatch.setattr(snapshot, 'read_latest_records', failing)
+        bars.mark_stale('MSFT')
+        # Retried while failing; snapshots keep the last table
+        _wait_for(lambda: len(failures) >= 2)
+        assert bars.snapshot(['AAPL', 'MSFT'])[1] == []
+        assert bars.pending
+    finally:
+        refresher.stop()
+        refresher.join(5)
+    assert not refresher.is_alive()
+
+
+def test_inactive_table_reads_the_database(reads):
+    calls, _ = reads
+    bars = LatestBars(enabled=False)
+    assert bars.snapshot(['AAPL']) == (['{"ticker":"AAPL"}'], [])
+    bars.snapshot(['AAPL'])
+    assert calls == [['AAPL'], ['AAPL']]
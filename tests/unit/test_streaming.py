@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+from app.metrics import STREAM_ABORTS
+from app.streaming import QueryStreamingResponse
+
+
+class FakeCancellation:
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+def _run(response, disconnect_after_chunks=None):
+    sent = []
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+        chunks = sum(1 for m in sent if m['type'] == 'http.response.body')
+        if disconnect_after_chunks is not None and chunks >= disconnect_after_chunks:
+            disconnected.set()
+
+    scope = {'type': 'http', 'asgi': {'spec_version': '2.0'}}
+    asyncio.run(response(scope, receive, send))
+    return sent
+
+
+def test_disconnect_cancels_query_and_closes_stream():
+    cancellation = FakeCancellation()
+    state = {'closed': False}
+
+    def body():
+        try:
+            yield 'first'
+            # Blocks like a long query until the statement is cancelled
+            cancellation.cancelled.wait(timeout=5)
+            yield 'second'
+            yield 'third'
+        finally:
+            state['closed'] = True
+
+    before = STREAM_ABORTS.value(endpoint='test')
+    response = QueryStreamingResponse(body(), cancellation, 'test')
+    sent = _run(response, disconnect_after_chunks=1)
+    assert cancellation.cancelled.is_set()
+    assert state['closed']
+    assert not response.completed
+    assert not any(m.get('body') == b'third' for m in sent)
+    assert STREAM_ABORTS.value(endpoint='test') == before + 1
+
+
+def test_completed_stream_is_not_cancelled():
+    cancellation = FakeCancellation()
+    response = QueryStreamingResponse(iter(['a', 'b']), cancellation, 'test')
+    sent = _run(response)
+    assert response.completed
+    assert not cancellation.cancelled.is_set()
+    assert [m.get('body') for m in sent[1:]] == [b'a', b'b', b'']
@@ -0,0 +1,32 @@
+import pytest
+
+from benchmarks.synthetic import generate_bars, make_tickers, make_timestamps
+
+
+def test_make_timestamps_daily():
+    timestamps = make_timestamps('2023-01-02', 1 / 52, '1d')
+    assert len(timestamps) == 5
+    assert all(ts.weekday() < 5 for ts in timestamps)
+
+
+def test_make_timestamps_intraday():
+    timestamps = make_timestamps('2023-01-02', 1 / 365, '1h')
+    assert [ts.strftime('%H:%M') for ts in timestamps] == [
+        '09:30', '10:30', '11:30', '12:30', '13:30', '14:30', '15:30'
+    ]
+    with pytest.raises(ValueError, match='Unsupported interval'):
+        make_timestamps('2023-01-02', 1, '2d')
+
+
+def test_generate_bars():
+    frames = list(generate_bars(tickers=3, years=1, interval='1d', seed=7))
+    assert [df['ticker'].iloc[0] for df in frames] == make_tickers(3)
+    for df in frames:
+        assert list(df.columns) == ['timestamp', 'ticker', 'open', 'high', 'low', 'close', 'volume']
+        assert (df['low'] <= df[['open', 'close']].min(axis=1)).all()
+        assert (df['high'] >= df[['open', 'close']].max(axis=1)).all()
+        assert df['timestamp'].is_monotonic_increasing
+
+    # Same seed, same data
+    again = list(generate_bars(tickers=3, years=1, interval='1d', seed=7))
+    assert frames[2].equals(again[2])
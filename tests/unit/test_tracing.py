@@ -0,0 +1,106 @@
+import json
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.tracing import (
+    SpanExporter,
+    TracingMiddleware,
+    current_trace_parent,
+    parse_traceparent,
+    span,
+    start_trace,
+    traced,
+    traced_iterator,
+    to_otlp,
+)
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+
+
+@traced('service')
+def load_rows():
+    with span('db.get_rows'):
+        return [1, 2, 3]
+
+
+@traced('service')
+def stream_rows():
+    with span('db.get_rows'):
+        rows = [1, 2, 3]
+    yield from rows
+
+
+def test_span_is_noop_outside_trace():
+    with span('db.get_rows') as current:
+        assert current is None
+    assert load_rows() == [1, 2, 3]
+
+
+def test_spans_nest_under_root():
+    with start_trace('task.import') as root:
+        load_rows()
+        assert list(stream_rows()) == [1, 2, 3]
+    names = {s.name: s for s in root.trace.spans}
+    assert names['service.load_rows'].parent_id == root.span_id
+    assert names['service.stream_rows'].parent_id == root.span_id
+    db_spans = [s for s in root.trace.spans if s.name == 'db.get_rows']
+    assert {s.parent_id for s in db_spans} == {
+        names['service.load_rows'].span_id,
+        names['service.stream_rows'].span_id,
+    }
+
+
+def test_trace_parent_propagates_to_background_task():
+    with start_trace('HTTP POST') as request_root:
+        parent = current_trace_parent()
+    with start_trace('task.import', parent=parent) as task_root:
+        pass
+    assert task_root.trace_id == request_root.trace_id
+    assert task_root.parent_id == request_root.span_id
+    assert parse_traceparent('garbage') == (None, None)
+
+
+def test_middleware_server_timing_and_traceparent():
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware)
+
+    @app.get('/rows')
+    def rows():
+        return {'data': load_rows()}
+
+    @app.get('/stream')
+    def stream():
+        return StreamingResponse(
+            traced_iterator((str(row) for row in stream_rows()), 'serialize.rows')
+        )
+
+    with TestClient(app) as client:
+        response = client.get(
+            '/rows', headers={'traceparent': f'00-{TRACE_ID}-00f067aa0ba902b7-01'}
+        )
+        assert response.headers['traceparent'].startswith(f'00-{TRACE_ID}-')
+        timing = response.headers['server-timing']
+        assert 'service.load_rows;dur=' in timing
+        assert 'db.get_rows;dur=' in timing
+
+        response = client.get('/stream')
+        assert response.text == '123'
+        assert 'traceparent' in response.headers
+
+
+def test_file_exporter(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    exporter = SpanExporter('file', str(path), '', 'elginvault')
+    with start_trace('task.import', task_id='abc') as root:
+        load_rows()
+    for finished in root.trace.spans:
+        exporter.export(finished)
+    exporter.flush()
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert {e['name'] for e in entries} == {'task.import', 'service.load_rows', 'db.get_rows'}
+    assert {e['trace_id'] for e in entries} == {root.trace_id}
+
+    otlp = to_otlp(root.trace.spans, 'elginvault')
+    spans = otlp['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert len(spans) == 3